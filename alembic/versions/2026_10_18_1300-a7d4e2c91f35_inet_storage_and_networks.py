@@ -0,0 +1,94 @@
+"""inet storage and networks
+
+Revision ID: a7d4e2c91f35
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 13:00:41.902114
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d4e2c91f35"
+down_revision: Union[str, None] = "3f1c2a9d7b10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# the same address as inet, IPv4-mapped IPv6 addresses as plain IPv4
+CANONICAL_IP: str = """
+    CASE WHEN ip::inet << '::ffff:0.0.0.0/96'
+    THEN '0.0.0.0'::inet + (ip::inet - '::ffff:0.0.0.0'::inet)
+    ELSE ip::inet END
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Note! Addresses were stored as free text, so one address could be stored in
+    # many textual forms (e.g. '2001:db8::1' and '2001:DB8::1'), which are equal
+    # as inet values - only the most recently written row of each is kept,
+    # otherwise primary key of inet column couldn't be created.
+    op.execute(
+        f"""
+        DELETE FROM ip_geolocation
+        WHERE ctid IN (
+            SELECT ctid FROM (
+                SELECT
+                    ctid,
+                    row_number() OVER (
+                        PARTITION BY {CANONICAL_IP}
+                        ORDER BY xmin::text::bigint DESC, ctid DESC
+                    ) AS position
+                FROM ip_geolocation
+            ) AS ranked
+            WHERE position > 1
+        )
+        """
+    )
+    op.alter_column(
+        "ip_geolocation",
+        "ip",
+        existing_type=sa.String(),
+        type_=postgresql.INET(),
+        postgresql_using="ip::inet",
+    )
+    op.create_table(
+        "network_geolocation",
+        sa.Column("network", postgresql.CIDR(), nullable=False),
+        sa.Column(
+            "geolocation", postgresql.JSONB(astext_type=sa.Text()), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("network"),
+    )
+    op.create_index(
+        "ix_network_geolocation_network_gist",
+        "network_geolocation",
+        ["network"],
+        unique=False,
+        postgresql_using="gist",
+        postgresql_ops={"network": "inet_ops"},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_network_geolocation_network_gist",
+        table_name="network_geolocation",
+        postgresql_using="gist",
+        postgresql_ops={"network": "inet_ops"},
+    )
+    op.drop_table("network_geolocation")
+    op.alter_column(
+        "ip_geolocation",
+        "ip",
+        existing_type=postgresql.INET(),
+        type_=sa.String(),
+        postgresql_using="host(ip)",
+    )
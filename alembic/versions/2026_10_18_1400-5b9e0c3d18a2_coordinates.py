@@ -0,0 +1,63 @@
+"""coordinates
+
+Revision ID: 5b9e0c3d18a2
+Revises: a7d4e2c91f35
+Create Date: 2026-10-18 14:00:12.530417
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5b9e0c3d18a2"
+down_revision: Union[str, None] = "a7d4e2c91f35"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "ip_geolocation",
+        sa.Column(
+            "latitude",
+            sa.Float(),
+            sa.Computed(
+                "(geolocation ->> 'latitude')::double precision", persisted=True
+            ),
+            nullable=False,
+        ),
+    )
+    op.add_column(
+        "ip_geolocation",
+        sa.Column(
+            "longitude",
+            sa.Float(),
+            sa.Computed(
+                "(geolocation ->> 'longitude')::double precision", persisted=True
+            ),
+            nullable=False,
+        ),
+    )
+    op.create_index(
+        "ix_ip_geolocation_location_gist",
+        "ip_geolocation",
+        [sa.text("point(longitude, latitude)")],
+        unique=False,
+        postgresql_using="gist",
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_ip_geolocation_location_gist",
+        table_name="ip_geolocation",
+        postgresql_using="gist",
+    )
+    op.drop_column("ip_geolocation", "longitude")
+    op.drop_column("ip_geolocation", "latitude")
@@ -0,0 +1,48 @@
+"""geolocation field columns
+
+Revision ID: c2f7a9e4d613
+Revises: 5b9e0c3d18a2
+Create Date: 2026-10-18 15:00:27.114582
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c2f7a9e4d613"
+down_revision: Union[str, None] = "5b9e0c3d18a2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FIELDS: tuple[str, ...] = ("continent_code", "country_code", "region_code", "city")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for field in FIELDS:
+        op.add_column(
+            "ip_geolocation",
+            sa.Column(
+                field,
+                sa.String(),
+                sa.Computed(f"geolocation ->> '{field}'", persisted=True),
+                nullable=False,
+            ),
+        )
+        op.create_index(
+            f"ix_ip_geolocation_{field}_ip",
+            "ip_geolocation",
+            [field, "ip"],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for field in reversed(FIELDS):
+        op.drop_index(f"ix_ip_geolocation_{field}_ip", table_name="ip_geolocation")
+        op.drop_column("ip_geolocation", field)
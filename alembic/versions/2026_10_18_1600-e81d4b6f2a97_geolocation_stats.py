@@ -0,0 +1,119 @@
+"""geolocation stats
+
+Revision ID: e81d4b6f2a97
+Revises: c2f7a9e4d613
+Create Date: 2026-10-18 16:00:03.482961
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e81d4b6f2a97"
+down_revision: Union[str, None] = "c2f7a9e4d613"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+GEOLOCATION_STATS_FUNCTION_DDL: str = """
+CREATE OR REPLACE FUNCTION apply_geolocation_stats() RETURNS trigger AS $$
+DECLARE
+    changed_countries integer;
+BEGIN
+    -- deltas of all rows are applied in a single statement, in order of stats
+    -- key, so concurrent statements lock stats rows in the same order
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO geolocation_stats (continent_code, country_code, addresses)
+        SELECT continent_code, country_code, count(*)
+        FROM new_rows
+        GROUP BY continent_code, country_code
+        ORDER BY continent_code, country_code
+        ON CONFLICT (continent_code, country_code)
+        DO UPDATE SET addresses = geolocation_stats.addresses + EXCLUDED.addresses;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO geolocation_stats (continent_code, country_code, addresses)
+        SELECT continent_code, country_code, -count(*)
+        FROM old_rows
+        GROUP BY continent_code, country_code
+        ORDER BY continent_code, country_code
+        ON CONFLICT (continent_code, country_code)
+        DO UPDATE SET addresses = geolocation_stats.addresses + EXCLUDED.addresses;
+    ELSE
+        -- rows which kept their continent and country cancel out, so updates
+        -- of other columns don't touch stats at all
+        INSERT INTO geolocation_stats (continent_code, country_code, addresses)
+        SELECT continent_code, country_code, sum(delta)
+        FROM (
+            SELECT continent_code, country_code, -1 AS delta FROM old_rows
+            UNION ALL
+            SELECT continent_code, country_code, 1 AS delta FROM new_rows
+        ) AS deltas
+        GROUP BY continent_code, country_code
+        HAVING sum(delta) <> 0
+        ORDER BY continent_code, country_code
+        ON CONFLICT (continent_code, country_code)
+        DO UPDATE SET addresses = geolocation_stats.addresses + EXCLUDED.addresses;
+    END IF;
+    GET DIAGNOSTICS changed_countries = ROW_COUNT;
+    IF changed_countries > 0 THEN
+        DELETE FROM geolocation_stats WHERE addresses = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+GEOLOCATION_STATS_TRIGGERS_DDL: tuple[str, ...] = (
+    """
+    CREATE TRIGGER ip_geolocation_stats_insert
+    AFTER INSERT ON ip_geolocation
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_geolocation_stats()
+    """,
+    """
+    CREATE TRIGGER ip_geolocation_stats_update
+    AFTER UPDATE ON ip_geolocation
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_geolocation_stats()
+    """,
+    """
+    CREATE TRIGGER ip_geolocation_stats_delete
+    AFTER DELETE ON ip_geolocation
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_geolocation_stats()
+    """,
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "geolocation_stats",
+        sa.Column("continent_code", sa.String(), nullable=False),
+        sa.Column("country_code", sa.String(), nullable=False),
+        sa.Column("addresses", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("continent_code", "country_code"),
+    )
+    op.execute("LOCK TABLE ip_geolocation IN SHARE MODE")
+    op.execute(GEOLOCATION_STATS_FUNCTION_DDL)
+    for trigger_ddl in GEOLOCATION_STATS_TRIGGERS_DDL:
+        op.execute(trigger_ddl)
+    op.execute(
+        """
+        INSERT INTO geolocation_stats (continent_code, country_code, addresses)
+        SELECT continent_code, country_code, count(*)
+        FROM ip_geolocation
+        GROUP BY continent_code, country_code
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for trigger in ("insert", "update", "delete"):
+        op.execute(f"DROP TRIGGER ip_geolocation_stats_{trigger} ON ip_geolocation")
+    op.execute("DROP FUNCTION apply_geolocation_stats()")
+    op.drop_table("geolocation_stats")
@@ -0,0 +1,67 @@
+"""canonical addresses
+
+Revision ID: 9d3a61c7f0b4
+Revises: e81d4b6f2a97
+Create Date: 2026-10-18 17:00:48.260317
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9d3a61c7f0b4"
+down_revision: Union[str, None] = "e81d4b6f2a97"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# IPv4 address of IPv4-mapped IPv6 address
+TO_IPV4: str = "('0.0.0.0'::inet + ({column} - '::ffff:0.0.0.0'::inet))"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Note! Addresses stored in both IPv4 and IPv4-mapped form before inet storage
+    # were collapsed by a7d4e2c91f35 already, so duplicates are only those stored
+    # since. When both forms are stored, the IPv4 row is kept.
+    op.execute(
+        f"""
+        DELETE FROM ip_geolocation mapped
+        USING ip_geolocation ipv4
+        WHERE mapped.ip << '::ffff:0.0.0.0/96'
+        AND ipv4.ip = {TO_IPV4.format(column="mapped.ip")}
+        """
+    )
+    op.execute(
+        f"""
+        UPDATE ip_geolocation SET ip = {TO_IPV4.format(column="ip")}
+        WHERE ip << '::ffff:0.0.0.0/96'
+        """
+    )
+
+    to_ipv4_network = (
+        f"set_masklen({TO_IPV4.format(column='{column}')}, "
+        "masklen({column}) - 96)::cidr"
+    )
+    op.execute(
+        f"""
+        DELETE FROM network_geolocation mapped
+        USING network_geolocation ipv4
+        WHERE mapped.network <<= '::ffff:0.0.0.0/96'
+        AND ipv4.network = {to_ipv4_network.format(column="mapped.network")}
+        """
+    )
+    op.execute(
+        f"""
+        UPDATE network_geolocation
+        SET network = {to_ipv4_network.format(column="network")}
+        WHERE network <<= '::ffff:0.0.0.0/96'
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # merged duplicates can't be restored
+    pass
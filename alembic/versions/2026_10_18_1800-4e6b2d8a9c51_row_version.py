@@ -0,0 +1,42 @@
+"""row version
+
+Revision ID: 4e6b2d8a9c51
+Revises: 9d3a61c7f0b4
+Create Date: 2026-10-18 18:00:19.637095
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4e6b2d8a9c51"
+down_revision: Union[str, None] = "9d3a61c7f0b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "ip_geolocation",
+        sa.Column("version", sa.Integer(), server_default=sa.text("1"), nullable=False),
+    )
+    op.add_column(
+        "ip_geolocation",
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("ip_geolocation", "updated_at")
+    op.drop_column("ip_geolocation", "version")
@@ -0,0 +1,57 @@
+"""geolocation freshness
+
+Revision ID: b5c08e2f7d19
+Revises: 4e6b2d8a9c51
+Create Date: 2026-10-18 19:00:42.118305
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b5c08e2f7d19"
+down_revision: Union[str, None] = "4e6b2d8a9c51"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "ip_geolocation",
+        sa.Column(
+            "fetched_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    # origin of existing rows is unknown, so they're treated as manual and never
+    # overwritten by refresh
+    op.add_column(
+        "ip_geolocation",
+        sa.Column("source", sa.String(), server_default="manual", nullable=False),
+    )
+    op.execute("UPDATE ip_geolocation SET fetched_at = updated_at")
+    op.create_index(
+        "ix_ip_geolocation_ip_stack_fetched_at",
+        "ip_geolocation",
+        ["fetched_at"],
+        unique=False,
+        postgresql_where=sa.text("source = 'ip_stack'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_ip_geolocation_ip_stack_fetched_at",
+        table_name="ip_geolocation",
+        postgresql_where=sa.text("source = 'ip_stack'"),
+    )
+    op.drop_column("ip_geolocation", "source")
+    op.drop_column("ip_geolocation", "fetched_at")
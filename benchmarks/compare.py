@@ -0,0 +1,73 @@
+import argparse
+import json
+import sys
+
+# compared statistics and whether higher value is better
+COMPARED: dict[str, bool] = {
+    "mean_us": False,
+    "p95_us": False,
+    "ops_per_sec": True,
+    "requests_per_sec": True,
+}
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    values = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif key in COMPARED and isinstance(value, (int, float)):
+            values[path] = value
+    return values
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """
+    Descriptions of statistics which got worse by more than threshold (fraction
+    of baseline value).
+    """
+    baseline_values = flatten(baseline["results"])
+    regressions = []
+    for path, value in flatten(current["results"]).items():
+        baseline_value = baseline_values.get(path)
+        if not baseline_value:
+            continue
+
+        change = (value - baseline_value) / baseline_value
+        if COMPARED[path.rsplit(".", 1)[-1]]:
+            change = -change
+        if change > threshold:
+            regressions.append(
+                f"{path}: {baseline_value:.1f} -> {value:.1f} ({change:+.0%} worse)"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare benchmark results, exit with 1 on regression."
+    )
+    parser.add_argument("baseline", help="Path of baseline JSON results.")
+    parser.add_argument("current", help="Path of current JSON results.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed relative slowdown, 0.2 by default.",
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print(regression)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
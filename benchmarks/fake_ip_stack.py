@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import ipaddress
+import multiprocessing
+import random
+import socket
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+COUNTRIES: tuple[tuple[str, str, str, str, str, str], ...] = (
+    ("EU", "Europe", "PL", "Poland", "MZ", "Warsaw"),
+    ("EU", "Europe", "DE", "Germany", "BE", "Berlin"),
+    ("NA", "North America", "US", "United States", "CA", "Mountain View"),
+    ("AS", "Asia", "JP", "Japan", "13", "Tokyo"),
+    ("SA", "South America", "BR", "Brazil", "SP", "Sao Paulo"),
+)
+
+
+def fake_geolocation(ip: str) -> dict:
+    """
+    Geolocation derived from the address, so the same address always gets the
+    same answer.
+    """
+    address = int(ipaddress.ip_address(ip))
+    continent_code, continent_name, country_code, country_name, region_code, city = (
+        COUNTRIES[address % len(COUNTRIES)]
+    )
+    return {
+        "ip": ip,
+        "type": f"ipv{ipaddress.ip_address(ip).version}",
+        "continent_code": continent_code,
+        "continent_name": continent_name,
+        "country_code": country_code,
+        "country_name": country_name,
+        "region_code": region_code,
+        "region_name": region_code,
+        "city": city,
+        "zip": f"{address % 100000:05d}",
+        "latitude": (address % 18000) / 100 - 90,
+        "longitude": (address % 36000) / 100 - 180,
+    }
+
+
+def create_app(
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    not_found_rate: float = 0.0,
+    seed: int | None = None,
+) -> FastAPI:
+    """
+    Stand-in for IPStack API. Each request waits latency +/- jitter seconds,
+    fails with HTTP 503 with error_rate probability, and each address is
+    reported as not found with not_found_rate probability.
+    """
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    @app.get("/{ip_addresses}")
+    async def resolve(ip_addresses: str) -> JSONResponse:
+        await asyncio.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+
+        if rng.random() < error_rate:
+            return JSONResponse(status_code=503, content={"detail": "Unavailable."})
+
+        results = []
+        for ip in ip_addresses.split(","):
+            if rng.random() < not_found_rate:
+                results.append(
+                    {
+                        "success": False,
+                        "error": {"code": 404, "type": "404_not_found", "info": ""},
+                    }
+                )
+            else:
+                results.append(fake_geolocation(ip))
+
+        return JSONResponse(results if len(results) > 1 else results[0])
+
+    return app
+
+
+class BackgroundServer:
+    """
+    Application served by uvicorn in a forked process, so load generator and
+    served application don't compete for the same GIL.
+    """
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 8100) -> None:
+        self.url = f"http://{host}:{port}"
+        self._address = (host, port)
+        self._process = multiprocessing.get_context("fork").Process(
+            target=uvicorn.run,
+            args=(app,),
+            kwargs={"host": host, "port": port, "log_level": "warning"},
+            daemon=True,
+        )
+
+    def __enter__(self) -> "BackgroundServer":
+        self._process.start()
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(self._address, timeout=1).close()
+                return self
+            except OSError:
+                if time.monotonic() > deadline or not self._process.is_alive():
+                    raise RuntimeError(f"Server at {self.url} didn't start.")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc_info) -> None:
+        self._process.terminate()
+        self._process.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for IPStack API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    app = create_app(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        not_found_rate=args.not_found_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+from benchmarks.fake_ip_stack import BackgroundServer, create_app, fake_geolocation
+from benchmarks.micro import benchmark_ip, clean
+from benchmarks.results import summarize, write_results
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.database import SESSION_MAKER
+from geolocation_catalogue.ip_geolocation_crud import IpGeolocationCRUD
+from geolocation_catalogue.main import app
+from geolocation_catalogue.schemas import GeolocationSchema
+
+# weights of operations in each scenario
+SCENARIOS: dict[str, dict[str, float]] = {
+    "hit-heavy": {"get_hit": 0.95, "get_miss": 0.05},
+    "miss-heavy": {"get_hit": 0.1, "get_miss": 0.9},
+    "write-heavy": {"get_hit": 0.3, "put": 0.7},
+}
+
+HOT_ADDRESSES: int = 1000
+
+
+class Scenario:
+    """
+    Load of given operation mix sent by concurrent workers. Hits read stored
+    addresses, misses request fresh ones, so each of them calls IPStack.
+    """
+
+    def __init__(self, weights: dict[str, float], seed: int) -> None:
+        self._operations = list(weights)
+        self._weights = list(weights.values())
+        self._rng = random.Random(seed)
+        self._next_miss = HOT_ADDRESSES
+
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.status_codes: dict[str, Counter] = defaultdict(Counter)
+
+    def next_request(self) -> tuple[str, str, dict]:
+        operation = self._rng.choices(self._operations, self._weights)[0]
+        if operation == "get_miss":
+            self._next_miss += 1
+            return (
+                operation,
+                "GET",
+                {"params": {"address": benchmark_ip(self._next_miss)}},
+            )
+
+        ip = benchmark_ip(self._rng.randrange(HOT_ADDRESSES))
+        if operation == "put":
+            return (
+                operation,
+                "PUT",
+                {"params": {"address": ip}, "json": fake_geolocation(ip)},
+            )
+        return operation, "GET", {"params": {"address": ip}}
+
+    async def run(self, url: str, requests: int, concurrency: int) -> float:
+        remaining = requests
+
+        async def worker(client: httpx.AsyncClient) -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                operation, method, kwargs = self.next_request()
+                start = time.perf_counter()
+                response = await client.request(method, "/address", **kwargs)
+                self.latencies[operation].append(time.perf_counter() - start)
+                self.status_codes[operation][str(response.status_code)] += 1
+
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+            return time.perf_counter() - start
+
+    def results(self, duration: float) -> dict:
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "requests": requests,
+            "duration_s": duration,
+            "requests_per_sec": requests / duration,
+            "latency": summarize(
+                [
+                    latency
+                    for latencies in self.latencies.values()
+                    for latency in latencies
+                ]
+            ),
+            "operations": {
+                operation: {
+                    "latency": summarize(latencies),
+                    "status_codes": dict(self.status_codes[operation]),
+                }
+                for operation, latencies in self.latencies.items()
+            },
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="End-to-end load scenarios against the application."
+    )
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ip-stack-port", type=int, default=8100)
+    parser.add_argument("--ip-stack-latency-ms", type=float, default=50.0)
+    parser.add_argument("--ip-stack-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--ip-stack-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of JSON results, stdout by default.")
+    args = parser.parse_args()
+
+    ip_stack_app = create_app(
+        latency=args.ip_stack_latency_ms / 1000,
+        jitter=args.ip_stack_jitter_ms / 1000,
+        error_rate=args.ip_stack_error_rate,
+        seed=args.seed,
+    )
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+
+    ip_stack_server = BackgroundServer(ip_stack_app, port=args.ip_stack_port)
+    # application process is forked, so it inherits configuration set here
+    CONFIG.ip_stack_api_url = ip_stack_server.url
+    CONFIG.ip_stack_api_access_key = "benchmark"
+    app_server = BackgroundServer(app, port=args.port)
+
+    results = {}
+    with ip_stack_server, app_server, SESSION_MAKER() as db:
+        for name in scenarios:
+            clean(db)
+            IpGeolocationCRUD.create_many(
+                db,
+                {
+                    benchmark_ip(i): GeolocationSchema(
+                        **fake_geolocation(benchmark_ip(i))
+                    )
+                    for i in range(HOT_ADDRESSES)
+                },
+            )
+            try:
+                scenario = Scenario(SCENARIOS[name], seed=args.seed)
+                duration = asyncio.run(
+                    scenario.run(app_server.url, args.requests, args.concurrency)
+                )
+                results[name] = scenario.results(duration)
+            finally:
+                clean(db)
+
+    results["config"] = {
+        "async_mode": CONFIG.async_mode,
+        "ip_stack_batch_mode": CONFIG.ip_stack_batch_mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ip_stack_latency_ms": args.ip_stack_latency_ms,
+        "ip_stack_error_rate": args.ip_stack_error_rate,
+    }
+    write_results("load", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
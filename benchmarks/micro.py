@@ -0,0 +1,234 @@
+import argparse
+import ipaddress
+import os
+import tempfile
+import time
+from typing import Any, Callable
+
+from fastapi import HTTPException
+from sqlalchemy import cast, delete
+from sqlalchemy.dialects.postgresql import INET
+from sqlalchemy.orm import Session
+
+from benchmarks.fake_ip_stack import fake_geolocation
+from benchmarks.results import summarize, write_results
+from geolocation_catalogue.address_validator import validate_address
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE, SharedMemoryCache
+from geolocation_catalogue.database import SESSION_MAKER
+from geolocation_catalogue.domain_alias import DOMAIN_ALIAS_CACHE
+from geolocation_catalogue.ip_geolocation_crud import IpGeolocationCRUD
+from geolocation_catalogue.models import IpGeolocation
+from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
+
+# addresses reserved for benchmarking (RFC 2544), so they never collide with data
+BENCHMARK_NETWORK = ipaddress.ip_network("198.18.0.0/15")
+BENCHMARK_DOMAIN: str = "benchmark.example"
+BULK_SIZE: int = 100
+
+
+def benchmark_ip(i: int) -> str:
+    return str(BENCHMARK_NETWORK.network_address + i)
+
+
+def run(
+    fn: Callable[..., Any],
+    iterations: int,
+    warmup: int,
+    setup: Callable[[int], tuple] | None = None,
+) -> dict:
+    """
+    Call fn(*setup(i)) warmup + iterations times, timing only calls after warmup.
+    Setup isn't timed.
+    """
+    latencies = []
+    for i in range(warmup + iterations):
+        args = setup(i) if setup else (i,)
+        start = time.perf_counter()
+        fn(*args)
+        if i >= warmup:
+            latencies.append(time.perf_counter() - start)
+
+    summary = summarize(latencies)
+    summary["ops_per_sec"] = len(latencies) / sum(latencies)
+    return summary
+
+
+def wrong_format(db: Session) -> None:
+    try:
+        validate_address(db, "not an address!")
+    except HTTPException:
+        pass
+
+
+def clean(db: Session) -> None:
+    db.execute(
+        delete(IpGeolocation).where(
+            IpGeolocation.ip.op("<<")(cast(str(BENCHMARK_NETWORK), INET))
+        )
+    )
+    db.commit()
+
+
+def benchmarks(db: Session, iterations: int) -> dict[str, Callable[[], dict]]:
+    """
+    Benchmarks by name. Reads use BULK_SIZE addresses stored before the run,
+    writes of single addresses and bulk writes get separate address ranges.
+    """
+    geolocation = fake_geolocation("57.144.110.1")
+    geolocation_schema = GeolocationSchema(**geolocation)
+    other_geolocation_schema = GeolocationSchema(**{**geolocation, "city": "Krakow"})
+    ip_geolocation_schema = IpGeolocationSchema(
+        ip="57.144.110.1", geolocation=geolocation_schema
+    )
+    existing_ip = benchmark_ip(0)
+    created = BULK_SIZE
+    bulk_created = created + iterations + 10
+
+    def get_ip_geolocation(i: int) -> tuple:
+        return db, IpGeolocationCRUD.get_by_ip(db, benchmark_ip(created + i))
+
+    def update_setup(i: int) -> tuple:
+        # geolocation has to differ from the stored one, otherwise nothing is written
+        _, ip_geolocation = get_ip_geolocation(i)
+        return db, ip_geolocation, other_geolocation_schema
+
+    def bulk_setup(i: int) -> tuple:
+        start = bulk_created + i * BULK_SIZE
+        return db, {
+            benchmark_ip(start + j): geolocation_schema for j in range(BULK_SIZE)
+        }
+
+    # directory is removed when benchmarks() returns, cache keeps its file mapped
+    shared_cache_dir = tempfile.TemporaryDirectory()
+    shared_cache = SharedMemoryCache(
+        os.path.join(shared_cache_dir.name, "cache"),
+        max_size=BULK_SIZE,
+        ttl=60,
+        slot_size=1024,
+    )
+    shared_cache.set(ip_geolocation_schema.ip, ip_geolocation_schema)
+
+    def cold_setup(i: int) -> tuple:
+        IP_GEOLOCATION_CACHE.invalidate(existing_ip)
+        return db, existing_ip
+
+    return {
+        "validate_address[ipv4]": lambda: run(
+            lambda i: validate_address(db, "57.144.110.1"), iterations, 100
+        ),
+        "validate_address[ipv6]": lambda: run(
+            lambda i: validate_address(db, "2001:db8::1"), iterations, 100
+        ),
+        "validate_address[domain_cached]": lambda: run(
+            lambda i: validate_address(db, BENCHMARK_DOMAIN), iterations, 100
+        ),
+        "validate_address[wrong_format]": lambda: run(
+            lambda i: wrong_format(db), iterations, 100
+        ),
+        "GeolocationSchema.validate": lambda: run(
+            lambda i: GeolocationSchema.model_validate(geolocation), iterations, 100
+        ),
+        "GeolocationSchema.dump_json": lambda: run(
+            lambda i: geolocation_schema.model_dump_json(), iterations, 100
+        ),
+        "IpGeolocationSchema.dump_json": lambda: run(
+            lambda i: ip_geolocation_schema.model_dump_json(), iterations, 100
+        ),
+        "IpGeolocationSchema.to_json[cached]": lambda: run(
+            lambda i: ip_geolocation_schema.to_json(), iterations, 100
+        ),
+        "SharedMemoryCache.get[hit]": lambda: run(
+            lambda i: shared_cache.get(ip_geolocation_schema.ip), iterations, 100
+        ),
+        "SharedMemoryCache.set": lambda: run(
+            lambda i: shared_cache.set(ip_geolocation_schema.ip, ip_geolocation_schema),
+            iterations,
+            100,
+        ),
+        "IpGeolocationCRUD.upsert[insert]": lambda: run(
+            IpGeolocationCRUD.upsert,
+            iterations,
+            10,
+            setup=lambda i: (db, benchmark_ip(created + i), geolocation_schema),
+        ),
+        "IpGeolocationCRUD.get_by_ip[hit]": lambda: run(
+            lambda i: IpGeolocationCRUD.get_by_ip(db, existing_ip), iterations, 10
+        ),
+        "IpGeolocationCRUD.get_by_ip[miss]": lambda: run(
+            lambda i: IpGeolocationCRUD.get_by_ip(db, "198.19.255.254"), iterations, 10
+        ),
+        "IpGeolocationCRUD.get_cached_by_ip[warm]": lambda: run(
+            lambda i: IpGeolocationCRUD.get_cached_by_ip(db, existing_ip),
+            iterations,
+            10,
+        ),
+        "IpGeolocationCRUD.get_cached_by_ip[cold]": lambda: run(
+            IpGeolocationCRUD.get_cached_by_ip, iterations, 10, setup=cold_setup
+        ),
+        f"IpGeolocationCRUD.get_by_ips[{BULK_SIZE}]": lambda: run(
+            lambda i: IpGeolocationCRUD.get_by_ips(
+                db, [benchmark_ip(j) for j in range(BULK_SIZE)]
+            ),
+            iterations,
+            10,
+        ),
+        "IpGeolocationCRUD.update": lambda: run(
+            IpGeolocationCRUD.update, iterations, 10, setup=update_setup
+        ),
+        f"IpGeolocationCRUD.create_many[{BULK_SIZE}]": lambda: run(
+            IpGeolocationCRUD.create_many, iterations, 10, setup=bulk_setup
+        ),
+        "IpGeolocationCRUD.upsert[update]": lambda: run(
+            lambda i: IpGeolocationCRUD.upsert(db, existing_ip, geolocation_schema),
+            iterations,
+            10,
+        ),
+        f"IpGeolocationCRUD.upsert_many[{BULK_SIZE}, update]": lambda: run(
+            lambda i: IpGeolocationCRUD.upsert_many(
+                db, {benchmark_ip(j): geolocation_schema for j in range(BULK_SIZE)}
+            ),
+            iterations,
+            10,
+        ),
+        "IpGeolocationCRUD.delete": lambda: run(
+            IpGeolocationCRUD.delete, iterations, 10, setup=get_ip_geolocation
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks of address validation, schemas and CRUD."
+    )
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--filter", help="Run only benchmarks containing this text.")
+    parser.add_argument("--output", help="Path of JSON results, stdout by default.")
+    args = parser.parse_args()
+
+    if (
+        BULK_SIZE * (args.iterations + 12) + args.iterations
+        > BENCHMARK_NETWORK.num_addresses
+    ):
+        parser.error("Too many iterations for benchmark address range.")
+
+    DOMAIN_ALIAS_CACHE.set(BENCHMARK_DOMAIN, [benchmark_ip(0)])
+    results = {}
+    with SESSION_MAKER() as db:
+        clean(db)
+        try:
+            geolocation_schema = GeolocationSchema(**fake_geolocation(benchmark_ip(0)))
+            IpGeolocationCRUD.create_many(
+                db, {benchmark_ip(i): geolocation_schema for i in range(BULK_SIZE)}
+            )
+            for name, benchmark in benchmarks(db, args.iterations).items():
+                if args.filter and args.filter not in name:
+                    continue
+                results[name] = benchmark()
+        finally:
+            clean(db)
+
+    write_results("micro", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
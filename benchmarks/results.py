@@ -0,0 +1,58 @@
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+def summarize(latencies: list[float]) -> dict:
+    """
+    Latency statistics in microseconds.
+    """
+    if not latencies:
+        return {"count": 0}
+
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1e6
+
+    return {
+        "count": len(ordered),
+        "mean_us": statistics.fmean(ordered) * 1e6,
+        "p50_us": percentile(0.50),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "max_us": ordered[-1] * 1e6,
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+    }
+
+
+def write_results(suite: str, results: dict, output: str | None) -> None:
+    """
+    Write results as JSON to output file or to stdout.
+    """
+    document = json.dumps(
+        {"suite": suite, "environment": environment(), "results": results}, indent=2
+    )
+    if output:
+        with open(output, "w") as f:
+            f.write(document + "\n")
+    else:
+        print(document)
@@ -1,27 +1,60 @@
 import ipaddress
 import re
 from abc import ABC, abstractstaticmethod
-from socket import gaierror, gethostbyname
+from socket import gaierror
+from typing import NoReturn
 
 from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from geolocation_catalogue.domain_alias import (
+    async_resolve_domain_ip,
+    get_cached_domain_ip,
+    resolve_domain_ip,
+)
+from geolocation_catalogue.metrics import Stage
+from geolocation_catalogue.negative_cache import (
+    NegativeLookupKind,
+    async_raise_if_negative,
+    async_set_negatives,
+    raise_if_negative,
+    set_negatives,
+)
 
 DOMAIN_NAME_PATTERN: str = (
     r"^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]$"
 )
 # domain pattern taken from this answer: https://stackoverflow.com/a/30007882
 
+IPV4_MAPPED_NETWORK = ipaddress.ip_network("::ffff:0:0/96")
+
+_DOMAIN_NAME_REGEX: re.Pattern = re.compile(DOMAIN_NAME_PATTERN)
+_IPV4_CHARACTERS: frozenset[str] = frozenset("0123456789.")
+
 
 class AddressValidator(ABC):
     @abstractstaticmethod
     def get_validator_name(self) -> str:
         return self._validator_name
 
+    @abstractstaticmethod
+    def normalize(self, address: str) -> str | None:
+        """
+        Canonical form of the address, None if address is not valid.
+        """
+        pass
+
     @abstractstaticmethod
     def is_valid(self, address: str) -> bool:
         pass
 
     @abstractstaticmethod
-    def to_ip(self, address: str) -> str:
+    def to_ip(self, db: Session, address: str) -> str:
+        pass
+
+    @abstractstaticmethod
+    async def async_to_ip(self, db: AsyncSession, address: str) -> str:
         pass
 
 
@@ -31,16 +64,34 @@ class IpValidator(AddressValidator):
         return "IPv4"
 
     @staticmethod
-    def is_valid(address: str) -> bool:
+    def normalize(address: str) -> str | None:
+        """
+        Canonical text of the address - IPv4 mapped to IPv6 is turned into IPv4,
+        IPv6 is compressed and lowercased.
+        """
         try:
-            ipaddress.ip_address(address)
+            ip = ipaddress.ip_address(address)
         except ValueError:
-            return False
+            return None
 
-        return True
+        if ip.version == 6:
+            # scoped addresses are link-local, they don't have geolocation
+            if ip.scope_id:
+                return None
+            if ip.ipv4_mapped:
+                return str(ip.ipv4_mapped)
+        return str(ip)
 
     @staticmethod
-    def to_ip(address: str) -> str:
+    def is_valid(address: str) -> bool:
+        return IpValidator.normalize(address) is not None
+
+    @staticmethod
+    def to_ip(db: Session, address: str) -> str:
+        return address
+
+    @staticmethod
+    async def async_to_ip(db: AsyncSession, address: str) -> str:
         return address
 
 
@@ -49,27 +100,144 @@ class DomainNameValidator(AddressValidator):
     def get_validator_name() -> str:
         return "domain name"
 
+    @staticmethod
+    def normalize(address: str) -> str | None:
+        """
+        Lowercase, IDNA encoded domain without trailing dot.
+        """
+        domain = address.lower().removesuffix(".")
+        if not domain.isascii():
+            try:
+                domain = domain.encode("idna").decode("ascii")
+            except UnicodeError:
+                return None
+
+        return domain if _DOMAIN_NAME_REGEX.match(domain) else None
+
     @staticmethod
     def is_valid(address: str) -> bool:
-        return re.match(DOMAIN_NAME_PATTERN, address)
+        return DomainNameValidator.normalize(address) is not None
+
+    @staticmethod
+    def to_ip(db: Session, address: str) -> str:
+        ip = get_cached_domain_ip(address)
+        if ip:
+            return ip
+
+        # domains which recently failed to resolve aren't resolved again
+        raise_if_negative(NegativeLookupKind.DOMAIN, address)
+        try:
+            return resolve_domain_ip(db, address)
+        except gaierror:
+            detail = "Error when trying to resolve domain IP."
+            set_negatives(NegativeLookupKind.DOMAIN, {address: detail})
+            raise HTTPException(status_code=404, detail=detail)
 
     @staticmethod
-    def to_ip(address: str) -> str:
+    async def async_to_ip(db: AsyncSession, address: str) -> str:
+        ip = get_cached_domain_ip(address)
+        if ip:
+            return ip
+
+        await async_raise_if_negative(NegativeLookupKind.DOMAIN, address)
         try:
-            return gethostbyname(address)
+            return await async_resolve_domain_ip(db, address)
         except gaierror:
-            raise HTTPException(
-                status_code=404, detail="Error when trying to resolve domain IP."
-            )
+            detail = "Error when trying to resolve domain IP."
+            await async_set_negatives(NegativeLookupKind.DOMAIN, {address: detail})
+            raise HTTPException(status_code=404, detail=detail)
+
+
+ADDRESS_VALIDATORS: tuple[type[AddressValidator], ...] = (
+    IpValidator,
+    DomainNameValidator,
+)
+
+
+def classify_address(address: str) -> type[AddressValidator]:
+    """
+    Pick validator by characters of the address, so only one of them has to
+    parse it. Colon is only allowed in IPv6 and domain can't end with a digit
+    in its top level label.
+    """
+    if ":" in address or (
+        address[-1:].isdigit() and _IPV4_CHARACTERS.issuperset(address)
+    ):
+        return IpValidator
+    return DomainNameValidator
+
+
+def normalize_address(address: str) -> tuple[type[AddressValidator], str]:
+    validator = classify_address(address)
+    normalized_address = validator.normalize(address)
+    if normalized_address is None:
+        _raise_wrong_format()
+
+    return validator, normalized_address
+
+
+def validate_address(db: Session, address: str) -> str:
+    """
+    Normalize the address and resolve it to IP. Domain may need domain_alias
+    query and DNS resolution, so it's called from endpoints - off the event
+    loop - and never from request validation.
+    """
+    with Stage("validate_address"):
+        validator, normalized_address = normalize_address(address)
+        return validator.to_ip(db, normalized_address)
+
+
+def is_network(address: str) -> bool:
+    return "/" in address
+
+
+def validate_address_or_network(db: Session, address: str) -> str:
+    """
+    Like validate_address, but also accepts network given in CIDR notation.
+    """
+    if not is_network(address):
+        return validate_address(db, address)
+
+    return normalize_network(address)
+
+
+def normalize_network(address: str) -> str:
+    try:
+        network = ipaddress.ip_network(address)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail="Network given in wrong format! It should be in CIDR notation without host bits set.",
+        )
+
+    # network of IPv4 addresses mapped to IPv6 is stored as IPv4 one
+    if (
+        network.version == 6
+        and network.prefixlen >= 96
+        and network.subnet_of(IPV4_MAPPED_NETWORK)
+    ):
+        network = ipaddress.ip_network(
+            (network.network_address.ipv4_mapped, network.prefixlen - 96)
+        )
+    return str(network)
+
+
+async def async_validate_address(db: AsyncSession, address: str) -> str:
+    with Stage("validate_address"):
+        validator, normalized_address = normalize_address(address)
+        return await validator.async_to_ip(db, normalized_address)
+
+
+async def async_validate_address_or_network(db: AsyncSession, address: str) -> str:
+    if not is_network(address):
+        return await async_validate_address(db, address)
 
+    return normalize_network(address)
 
-def validate_address(address: str) -> str:
-    for validator in AddressValidator.__subclasses__():
-        if validator.is_valid(address):
-            return validator.to_ip(address)
 
+def _raise_wrong_format() -> NoReturn:
     appropriate_formats = ", ".join(
-        [v.get_validator_name() for v in AddressValidator.__subclasses__()]
+        [v.get_validator_name() for v in ADDRESS_VALIDATORS]
     )
     raise HTTPException(
         status_code=422,
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from fastapi import HTTPException
+from sqlalchemy import Connection, Engine
+from sqlalchemy.orm import Session
+
+from geolocation_catalogue.address_validator import validate_address
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.ip_geolocation_crud import (
+    IpGeolocationCRUD,
+    NetworkGeolocationCRUD,
+)
+from geolocation_catalogue.ip_stack_handler import IpStackHandler
+from geolocation_catalogue.models import GeolocationSource
+from geolocation_catalogue.negative_cache import (
+    NegativeLookupKind,
+    get_negatives,
+    set_negatives,
+)
+from geolocation_catalogue.schemas import AddressLookupResultSchema, GeolocationSchema
+
+
+def _validate_address(bind: Engine | Connection, address: str) -> str | HTTPException:
+    # sessions aren't thread safe, so each worker uses one of its own
+    try:
+        with Session(bind) as db:
+            return validate_address(db, address)
+    except HTTPException as exc:
+        return exc
+
+
+def _resolve_geolocation(
+    ip_stack_handler: IpStackHandler, ip: str
+) -> GeolocationSchema | HTTPException:
+    try:
+        return ip_stack_handler.resolve_geolocation(ip_address=ip)
+    except HTTPException as exc:
+        return exc
+    except requests.RequestException:
+        return HTTPException(
+            status_code=500,
+            detail="Internal error related to address geolocation resolving process.",
+        )
+
+
+def _resolve_geolocations(
+    ip_stack_handler: IpStackHandler, ips: list[str]
+) -> dict[str, GeolocationSchema | HTTPException]:
+    try:
+        return ip_stack_handler.resolve_geolocations(ip_addresses=ips)
+    except HTTPException as exc:
+        return {ip: exc for ip in ips}
+    except requests.RequestException:
+        return {
+            ip: HTTPException(
+                status_code=500,
+                detail="Internal error related to address geolocation resolving process.",
+            )
+            for ip in ips
+        }
+
+
+def lookup_addresses(
+    db: Session, addresses: list[str]
+) -> list[AddressLookupResultSchema]:
+    """
+    Resolve geolocation of many addresses at once. Known IPs are fetched from cache
+    or with a single query (falling back to stored networks), misses are resolved
+    concurrently via IPStack and stored in one transaction, unless IPStack
+    recently didn't find them. Errors are reported per address instead of being
+    raised.
+    """
+    unique_addresses = list(dict.fromkeys(addresses))
+
+    with ThreadPoolExecutor(
+        max_workers=CONFIG.addresses_lookup_max_workers
+    ) as executor:
+        validated = dict(
+            zip(
+                unique_addresses,
+                executor.map(
+                    partial(_validate_address, db.get_bind()), unique_addresses
+                ),
+            )
+        )
+        ips = list(dict.fromkeys(v for v in validated.values() if isinstance(v, str)))
+
+        geolocations: dict[str, GeolocationSchema | HTTPException] = {}
+        for ip in ips:
+            ip_geolocation_schema = IP_GEOLOCATION_CACHE.get(ip)
+            if ip_geolocation_schema:
+                geolocations[ip] = ip_geolocation_schema.geolocation
+
+        uncached_ips = [ip for ip in ips if ip not in geolocations]
+        for ip_geolocation in IpGeolocationCRUD.get_by_ips(db, uncached_ips):
+            geolocations[ip_geolocation.ip] = GeolocationSchema.from_stored(
+                ip_geolocation.geolocation
+            )
+
+        unknown_ips = [ip for ip in uncached_ips if ip not in geolocations]
+        for ip, geolocation in NetworkGeolocationCRUD.get_by_ips(
+            db, unknown_ips
+        ).items():
+            geolocations[ip] = GeolocationSchema.from_stored(geolocation)
+
+        missing_ips = [ip for ip in ips if ip not in geolocations]
+        if missing_ips and CONFIG.ip_stack_api_access_key:
+            for ip, detail in get_negatives(
+                NegativeLookupKind.ADDRESS, missing_ips
+            ).items():
+                geolocations[ip] = HTTPException(status_code=404, detail=detail)
+            missing_ips = [ip for ip in missing_ips if ip not in geolocations]
+
+        if missing_ips and CONFIG.ip_stack_api_access_key:
+            ip_stack_handler = IpStackHandler(
+                api_access_key=CONFIG.ip_stack_api_access_key
+            )
+            if CONFIG.ip_stack_batch_mode:
+                resolved = {}
+                chunks = [
+                    missing_ips[i : i + CONFIG.ip_stack_batch_max_size]
+                    for i in range(0, len(missing_ips), CONFIG.ip_stack_batch_max_size)
+                ]
+                for chunk_resolved in executor.map(
+                    partial(_resolve_geolocations, ip_stack_handler), chunks
+                ):
+                    resolved.update(chunk_resolved)
+            else:
+                resolved = dict(
+                    zip(
+                        missing_ips,
+                        executor.map(
+                            partial(_resolve_geolocation, ip_stack_handler),
+                            missing_ips,
+                        ),
+                    )
+                )
+            IpGeolocationCRUD.create_many(
+                db,
+                {
+                    ip: geolocation
+                    for ip, geolocation in resolved.items()
+                    if isinstance(geolocation, GeolocationSchema)
+                },
+                GeolocationSource.IP_STACK,
+            )
+            set_negatives(
+                NegativeLookupKind.ADDRESS,
+                {
+                    ip: geolocation.detail
+                    for ip, geolocation in resolved.items()
+                    if isinstance(geolocation, HTTPException)
+                    and geolocation.status_code == 404
+                },
+            )
+            geolocations.update(resolved)
+
+    results = []
+    for address in addresses:
+        ip = validated[address]
+        if isinstance(ip, HTTPException):
+            results.append(
+                AddressLookupResultSchema(
+                    address=address, status_code=ip.status_code, detail=ip.detail
+                )
+            )
+            continue
+
+        geolocation = geolocations.get(ip)
+        if geolocation is None:
+            results.append(
+                AddressLookupResultSchema(
+                    address=address,
+                    ip=ip,
+                    status_code=404,
+                    detail="Geolocation for address not found.",
+                )
+            )
+        elif isinstance(geolocation, HTTPException):
+            results.append(
+                AddressLookupResultSchema(
+                    address=address,
+                    ip=ip,
+                    status_code=geolocation.status_code,
+                    detail=geolocation.detail,
+                )
+            )
+        else:
+            results.append(
+                AddressLookupResultSchema(
+                    address=address, ip=ip, status_code=200, geolocation=geolocation
+                )
+            )
+
+    return results
@@ -0,0 +1,196 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from geolocation_catalogue.address_validator import (
+    async_validate_address,
+    async_validate_address_or_network,
+    is_network,
+)
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.database import (
+    get_async_db,
+    get_async_read_db,
+    read_cache_ttl,
+)
+from geolocation_catalogue.ip_geolocation_crud import (
+    AsyncIpGeolocationCRUD,
+    AsyncNetworkGeolocationCRUD,
+)
+from geolocation_catalogue.ip_stack_handler import (
+    AsyncIpStackHandler,
+    get_ip_stack_batcher,
+)
+from geolocation_catalogue.metrics import Stage
+from geolocation_catalogue.models import GeolocationSource
+from geolocation_catalogue.negative_cache import (
+    NegativeLookupKind,
+    async_purge_negatives,
+    async_raise_if_negative,
+    async_set_negatives,
+)
+from geolocation_catalogue.refresh import schedule_refresh_if_stale
+from geolocation_catalogue.responses import (
+    check_if_match,
+    entity_tag,
+    ip_geolocation_response,
+)
+from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
+from geolocation_catalogue.single_flight import IP_GEOLOCATION_SINGLE_FLIGHT
+from geolocation_catalogue.snapshot import get_snapshot
+
+router = APIRouter()
+
+
+@router.get("/address", response_model=IpGeolocationSchema)
+async def get_address_geolocation(
+    address: str,
+    if_none_match: Annotated[str | None, Header()] = None,
+    read_db: AsyncSession = Depends(get_async_read_db),
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    address = await async_validate_address(db, address)
+
+    snapshot = get_snapshot()
+    if snapshot:
+        with Stage("snapshot"):
+            geolocation_schema = snapshot.lookup(address)
+        if geolocation_schema:
+            return ip_geolocation_response(
+                IpGeolocationSchema.model_construct(
+                    ip=address, geolocation=geolocation_schema
+                ),
+                if_none_match,
+            )
+
+    # misses are read from a replica, which may lag behind, so they're cached briefly
+    ip_geolocation_schema = await AsyncIpGeolocationCRUD.get_cached_by_ip(
+        read_db, address, read_cache_ttl()
+    )
+
+    if ip_geolocation_schema:
+        # stale geolocation is served anyway, refresh happens in background
+        schedule_refresh_if_stale(ip_geolocation_schema)
+        return ip_geolocation_response(ip_geolocation_schema, if_none_match)
+
+    # connection isn't held while IPStack is called, miss is stored on primary
+    await read_db.close()
+
+    if not CONFIG.ip_stack_api_access_key:
+        raise HTTPException(
+            status_code=404, detail="Geolocation for address not found."
+        )
+
+    await async_raise_if_negative(NegativeLookupKind.ADDRESS, address)
+
+    async def resolve_and_store() -> IpGeolocationSchema:
+        try:
+            if CONFIG.ip_stack_batch_mode:
+                geolocation_schema = await get_ip_stack_batcher(
+                    CONFIG.ip_stack_api_access_key
+                ).async_resolve_geolocation(ip_address=address)
+            else:
+                ip_stack_handler = AsyncIpStackHandler(
+                    api_access_key=CONFIG.ip_stack_api_access_key
+                )
+                geolocation_schema = await ip_stack_handler.resolve_geolocation(
+                    ip_address=address
+                )
+        except HTTPException as exc:
+            if exc.status_code == 404:
+                await async_set_negatives(
+                    NegativeLookupKind.ADDRESS, {address: exc.detail}
+                )
+            raise
+
+        ip_geolocation = await AsyncIpGeolocationCRUD.upsert(
+            db, address, geolocation_schema, GeolocationSource.IP_STACK
+        )
+        ip_geolocation_schema = IpGeolocationSchema.from_row(ip_geolocation)
+        IP_GEOLOCATION_CACHE.set(address, ip_geolocation_schema)
+
+        return ip_geolocation_schema
+
+    # concurrent misses of the same address share one IPStack call and one insert
+    return ip_geolocation_response(
+        await IP_GEOLOCATION_SINGLE_FLIGHT.do_async(address, resolve_and_store),
+        if_none_match,
+    )
+
+
+@router.put("/address", response_model=IpGeolocationSchema)
+async def put_address_geolocation(
+    address: str,
+    geolocation: GeolocationSchema,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
+    db: AsyncSession = Depends(get_async_db),
+) -> IpGeolocationSchema:
+    address = await async_validate_address_or_network(db, address)
+
+    if is_network(address):
+        # networks aren't versioned, so no precondition can be fulfilled
+        if if_match is not None:
+            raise HTTPException(
+                status_code=412, detail="Geolocation for given network not versioned."
+            )
+        network_geolocation = await AsyncNetworkGeolocationCRUD.upsert(
+            db, address, geolocation
+        )
+        # network may cover any of cached addresses
+        IP_GEOLOCATION_CACHE.clear()
+
+        return IpGeolocationSchema(
+            ip=network_geolocation.network,
+            geolocation=network_geolocation.geolocation,
+        )
+
+    if if_match is None:
+        ip_geolocation = await AsyncIpGeolocationCRUD.upsert(db, address, geolocation)
+    else:
+        # precondition needs the stored version, so the row is read first
+        ip_geolocation = await AsyncIpGeolocationCRUD.get_by_ip(db, address)
+        check_if_match(if_match, ip_geolocation)
+        ip_geolocation = await AsyncIpGeolocationCRUD.update(
+            db, ip_geolocation, geolocation
+        )
+
+    # stored row is cached right away, so the next lookup needn't read it again
+    IP_GEOLOCATION_CACHE.set(address, IpGeolocationSchema.from_row(ip_geolocation))
+    await async_purge_negatives([address])
+    response.headers["ETag"] = entity_tag(
+        ip_geolocation.version, ip_geolocation.updated_at
+    )
+
+    return ip_geolocation
+
+
+@router.delete("/address")
+async def delete_address_geolocation(
+    address: str,
+    db: AsyncSession = Depends(get_async_db),
+) -> Response:
+    address = await async_validate_address_or_network(db, address)
+
+    if is_network(address):
+        if not await AsyncNetworkGeolocationCRUD.delete(db, address):
+            raise HTTPException(
+                status_code=404, detail="Geolocation for given network not found."
+            )
+        IP_GEOLOCATION_CACHE.clear()
+
+        return Response(status_code=204)
+
+    ip_geolocation = await AsyncIpGeolocationCRUD.get_by_ip(db, address)
+
+    if not ip_geolocation:
+        raise HTTPException(
+            status_code=404, detail="Geolocation for given address not found."
+        )
+
+    await AsyncIpGeolocationCRUD.delete(db, ip_geolocation)
+    IP_GEOLOCATION_CACHE.invalidate(address)
+
+    return Response(status_code=204)
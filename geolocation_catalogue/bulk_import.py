@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, TextIO
+
+from pydantic import ValidationError
+
+from geolocation_catalogue.address_validator import IpValidator
+from geolocation_catalogue.database import ENGINE
+from geolocation_catalogue.schemas import GeolocationSchema
+
+STAGING_TABLE_DDL: str = """
+CREATE TEMPORARY TABLE IF NOT EXISTS ip_geolocation_staging (
+    line bigint NOT NULL,
+    ip inet NOT NULL,
+    geolocation jsonb NOT NULL
+) ON COMMIT DELETE ROWS
+"""
+
+# Note! ON CONFLICT DO UPDATE can't touch the same row twice, so only the last
+# occurrence of an address within a chunk is merged.
+MERGE_STAGING_SQL: str = """
+INSERT INTO ip_geolocation (ip, geolocation, source)
+SELECT DISTINCT ON (ip) ip, geolocation, 'import'
+FROM ip_geolocation_staging
+ORDER BY ip, line DESC
+ON CONFLICT (ip) DO UPDATE SET
+    geolocation = EXCLUDED.geolocation,
+    version = ip_geolocation.version + 1,
+    updated_at = now(),
+    fetched_at = now(),
+    source = EXCLUDED.source
+"""
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    imported: int = 0
+    rejected: int = 0
+
+
+def read_rows(file: TextIO, file_format: str) -> Iterator[dict | str]:
+    """
+    Stream rows of CSV file with header or lines of NDJSON file. NDJSON lines
+    are parsed by to_row along with validation, so a malformed line rejects only
+    itself.
+    """
+    if file_format == "csv":
+        yield from csv.DictReader(file)
+        return
+
+    for line in file:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def to_row(row: dict | str) -> dict:
+    """
+    Row of read CSV row or NDJSON line. NDJSON rows can keep geolocation fields
+    at top level or nested under "geolocation" key. Raises ValueError when line
+    isn't JSON object or CSV row has more fields than header.
+    """
+    if isinstance(row, str):
+        row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("Row is not a JSON object.")
+        if isinstance(row.get("geolocation"), dict):
+            row = {"ip": row.get("ip"), **row["geolocation"]}
+    elif None in row:
+        # csv.DictReader keeps values beyond header under None key
+        raise ValueError("Row has more fields than header.")
+    return row
+
+
+def import_rows(
+    rows: Iterable[dict | str],
+    chunk_size: int = 10000,
+    rejected_file: TextIO | None = None,
+    on_progress: Callable[[ImportStats], None] | None = None,
+) -> ImportStats:
+    """
+    Validate rows in chunks and merge valid ones into ip_geolocation through COPY
+    to staging table. Each chunk is committed separately, so memory usage doesn't
+    depend on number of rows. Rejected rows are written to rejected_file as NDJSON.
+    """
+    stats = ImportStats()
+
+    connection = ENGINE.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(STAGING_TABLE_DDL)
+
+        chunk = io.StringIO()
+        chunk_writer = csv.writer(chunk)
+        chunk_rows = 0
+
+        for line, row in enumerate(rows, start=1):
+            stats.read += 1
+            try:
+                row = to_row(row)
+                ip = IpValidator.normalize(row.get("ip") or "")
+                if not ip:
+                    raise ValueError(f"Invalid IP address: {row.get('ip')!r}.")
+                geolocation = GeolocationSchema(**row).model_dump_json()
+            except (ValueError, TypeError, ValidationError) as exc:
+                stats.rejected += 1
+                if rejected_file:
+                    rejected_file.write(
+                        json.dumps(
+                            {"line": line, "row": row, "error": _error(exc)},
+                            default=str,
+                        )
+                        + "\n"
+                    )
+                continue
+
+            chunk_writer.writerow((line, ip, geolocation))
+            chunk_rows += 1
+
+            if chunk_rows >= chunk_size:
+                stats.imported += _merge_chunk(connection, cursor, chunk)
+                chunk = io.StringIO()
+                chunk_writer = csv.writer(chunk)
+                chunk_rows = 0
+                if on_progress:
+                    on_progress(stats)
+
+        if chunk_rows:
+            stats.imported += _merge_chunk(connection, cursor, chunk)
+            if on_progress:
+                on_progress(stats)
+    finally:
+        connection.close()
+
+    return stats
+
+
+def _merge_chunk(connection, cursor, chunk: io.StringIO) -> int:
+    chunk.seek(0)
+    cursor.copy_expert(
+        "COPY ip_geolocation_staging (line, ip, geolocation) FROM STDIN WITH (FORMAT csv)",
+        chunk,
+    )
+    cursor.execute(MERGE_STAGING_SQL)
+    merged = cursor.rowcount
+    connection.commit()
+
+    return merged
+
+
+def _error(exc: Exception) -> str | list:
+    if isinstance(exc, ValidationError):
+        return exc.errors(include_url=False, include_context=False, include_input=False)
+    return str(exc)
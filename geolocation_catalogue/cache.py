@@ -0,0 +1,480 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Generic, Hashable, Iterator, TypeVar
+from zlib import crc32
+
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.schemas import IpGeolocationSchema
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Bounded LRU cache with per-entry time to live. All operations are guarded by
+    a lock, so single instance can be shared by FastAPI threadpool workers.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        if self._max_size <= 0:
+            return
+
+        ttl = self._ttl if ttl is None else min(ttl, self._ttl)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: K) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self, limit: int) -> list[K]:
+        """
+        Keys of at most limit live entries, the most recently used first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            live_keys = (
+                key
+                for key, (expires_at, _) in reversed(self._entries.items())
+                if expires_at > now
+            )
+            return list(islice(live_keys, limit))
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                size=len(self._entries),
+                max_size=self._max_size,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+            )
+
+
+SHARED_CACHE_MAGIC: bytes = b"GEOCACH1"
+# magic, slot count, slot size, generation, size, evictions
+_HEADER = struct.Struct("<8sIIIIQ")
+HEADER_SIZE: int = 64
+# sequence, generation, referenced, key length, value length, expiration time
+_SLOT = struct.Struct("<IIBBHd")
+_SEQUENCE = struct.Struct("<I")
+_REFERENCED_OFFSET: int = 8
+KEY_SIZE: int = 48
+# version, update and fetch time in microseconds since epoch, source
+_VALUE = struct.Struct("<qqq8s")
+_NONE: int = -(2**63)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# slots a key can be stored in, one of them is evicted when all are taken
+SET_WAYS: int = 8
+READ_ATTEMPTS: int = 4
+
+
+def _to_microseconds(value: datetime | None) -> int:
+    return _NONE if value is None else (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_microseconds(value: int) -> datetime | None:
+    return None if value == _NONE else _EPOCH + timedelta(microseconds=value)
+
+
+class SharedMemoryCache:
+    """
+    Address cache in a memory-mapped file, shared by all worker processes of the
+    host. Entries are kept in fixed-size slots of a set-associative hash table,
+    full sets evict with clock algorithm (second chance for recently read
+    entries). Writers are serialized by a lock of the file, readers take no lock
+    - every slot has a sequence number which writers make odd while they change
+    it, so readers retry (or miss) instead of reading a torn entry. Clearing
+    bumps generation of the table, entries of older generations are empty.
+
+    Hits, misses and expirations are counted per process, size and evictions for
+    the whole table.
+
+    Table layout is part of the file name, so workers with other settings use a
+    file of their own. File which is already in use is never resized - other
+    processes have it mapped - ValueError is raised if its layout doesn't match.
+    """
+
+    def __init__(self, path: str, max_size: int, ttl: float, slot_size: int) -> None:
+        self._ttl = ttl
+        self._slot_size = slot_size
+        self._set_count = -(-max_size // SET_WAYS) if max_size > 0 else 0
+        self._slot_count = self._set_count * SET_WAYS
+        # clock hand of each set, followed by slots
+        self._slots_offset = HEADER_SIZE + -(-self._set_count // 64) * 64
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._expirations = 0
+
+        self._path = f"{path}.{self._slot_count}x{slot_size}"
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._mmap: mmap.mmap | None = None
+        if self._slot_count:
+            try:
+                self._mmap = self._map()
+            except ValueError:
+                os.close(self._fd)
+                raise
+
+    def _map(self) -> mmap.mmap:
+        file_size = self._slots_offset + self._slot_count * self._slot_size
+        with self._file_lock():
+            current_size = os.fstat(self._fd).st_size
+            header = os.pread(self._fd, _HEADER.size, 0)
+            # file without header isn't used by anyone yet, it's only ever grown -
+            # shrinking a file mapped by other processes would crash them
+            if current_size <= file_size and not header.strip(b"\0"):
+                os.ftruncate(self._fd, file_size)
+                os.pwrite(
+                    self._fd,
+                    _HEADER.pack(
+                        SHARED_CACHE_MAGIC, self._slot_count, self._slot_size, 1, 0, 0
+                    ),
+                    0,
+                )
+            elif (
+                current_size != file_size
+                or len(header) < _HEADER.size
+                or _HEADER.unpack(header)[:3]
+                != (SHARED_CACHE_MAGIC, self._slot_count, self._slot_size)
+            ):
+                raise ValueError(
+                    f"Shared cache file {self._path} is in use with other layout."
+                )
+        return mmap.mmap(self._fd, file_size)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        # file lock is held per open file, so threads need their own lock
+        with self._lock, self._file_lock():
+            yield
+
+    def _header(self) -> tuple:
+        return _HEADER.unpack_from(self._mmap, 0)
+
+    def _set_header(self, generation: int, size: int, evictions: int) -> None:
+        _HEADER.pack_into(
+            self._mmap,
+            0,
+            SHARED_CACHE_MAGIC,
+            self._slot_count,
+            self._slot_size,
+            generation,
+            size,
+            evictions,
+        )
+
+    def _set_index(self, key: bytes) -> int:
+        return crc32(key) % self._set_count
+
+    def _slot_offset(self, set_index: int, way: int) -> int:
+        return self._slots_offset + (set_index * SET_WAYS + way) * self._slot_size
+
+    def _read_slot(self, offset: int, key: bytes) -> tuple | None:
+        """
+        Generation, expiration time and value of the slot if it holds key, None
+        if it doesn't or it was being written through all attempts.
+        """
+        for _ in range(READ_ATTEMPTS):
+            sequence = _SEQUENCE.unpack_from(self._mmap, offset)[0]
+            if sequence & 1:
+                continue
+            _, generation, _, key_length, value_length, expires_at = _SLOT.unpack_from(
+                self._mmap, offset
+            )
+            key_offset = offset + _SLOT.size
+            if (
+                key_length != len(key)
+                or self._mmap[key_offset : key_offset + key_length] != key
+            ):
+                value = None
+            else:
+                value_offset = key_offset + KEY_SIZE
+                value = self._mmap[value_offset : value_offset + value_length]
+            if _SEQUENCE.unpack_from(self._mmap, offset)[0] == sequence:
+                return None if value is None else (generation, expires_at, value)
+        return None
+
+    def _write_slot(
+        self, offset: int, generation: int, key: bytes, value: bytes, expires_at: float
+    ) -> None:
+        sequence = _SEQUENCE.unpack_from(self._mmap, offset)[0]
+        _SEQUENCE.pack_into(self._mmap, offset, sequence + 1)
+        _SLOT.pack_into(
+            self._mmap,
+            offset,
+            sequence + 1,
+            generation,
+            0,
+            len(key),
+            len(value),
+            expires_at,
+        )
+        key_offset = offset + _SLOT.size
+        self._mmap[key_offset : key_offset + len(key)] = key
+        value_offset = key_offset + KEY_SIZE
+        self._mmap[value_offset : value_offset + len(value)] = value
+        _SEQUENCE.pack_into(self._mmap, offset, sequence + 2)
+
+    def _find(self, key: bytes, generation: int) -> int | None:
+        set_index = self._set_index(key)
+        for way in range(SET_WAYS):
+            offset = self._slot_offset(set_index, way)
+            slot = self._read_slot(offset, key)
+            if slot is not None and slot[0] == generation:
+                return offset
+        return None
+
+    def get(self, key: str) -> IpGeolocationSchema | None:
+        if self._mmap is None:
+            self._misses += 1
+            return None
+
+        encoded_key = key.encode()
+        generation = self._header()[3]
+        set_index = self._set_index(encoded_key)
+        for way in range(SET_WAYS):
+            offset = self._slot_offset(set_index, way)
+            slot = self._read_slot(offset, encoded_key)
+            if slot is None or slot[0] != generation:
+                continue
+
+            _, expires_at, value = slot
+            if expires_at <= time.time():
+                self._expirations += 1
+                break
+
+            self._mmap[offset + _REFERENCED_OFFSET] = 1
+            self._hits += 1
+            return self._decode(value)
+
+        self._misses += 1
+        return None
+
+    def set(
+        self, key: str, value: IpGeolocationSchema, ttl: float | None = None
+    ) -> None:
+        if self._mmap is None:
+            return
+
+        encoded_key = key.encode()
+        encoded_value = self._encode(value)
+        if (
+            len(encoded_key) > KEY_SIZE
+            or _SLOT.size + KEY_SIZE + len(encoded_value) > self._slot_size
+        ):
+            return
+
+        now = time.time()
+        expires_at = now + (self._ttl if ttl is None else min(ttl, self._ttl))
+        with self._write_lock():
+            _, _, _, generation, size, evictions = self._header()
+            offset = self._find(encoded_key, generation)
+            if offset is None:
+                offset, evicted = self._victim(self._set_index(encoded_key), generation)
+                if evicted is None:
+                    size += 1
+                elif evicted:
+                    evictions += 1
+            self._write_slot(offset, generation, encoded_key, encoded_value, expires_at)
+            self._set_header(generation, size, evictions)
+
+    def _victim(self, set_index: int, generation: int) -> tuple[int, bool | None]:
+        """
+        Slot for a new entry and whether a live entry is evicted from it - None
+        when the slot was empty.
+        """
+        now = time.time()
+        for way in range(SET_WAYS):
+            offset = self._slot_offset(set_index, way)
+            _, slot_generation, _, _, _, expires_at = _SLOT.unpack_from(
+                self._mmap, offset
+            )
+            if slot_generation != generation:
+                return offset, None
+            if expires_at <= now:
+                return offset, False
+
+        hand_offset = HEADER_SIZE + set_index
+        way = self._mmap[hand_offset]
+        while True:
+            offset = self._slot_offset(set_index, way)
+            way = (way + 1) % SET_WAYS
+            if self._mmap[offset + _REFERENCED_OFFSET]:
+                self._mmap[offset + _REFERENCED_OFFSET] = 0
+                continue
+            self._mmap[hand_offset] = way
+            return offset, True
+
+    def invalidate(self, key: str) -> bool:
+        if self._mmap is None:
+            return False
+
+        encoded_key = key.encode()
+        with self._write_lock():
+            _, _, _, generation, size, evictions = self._header()
+            offset = self._find(encoded_key, generation)
+            if offset is None:
+                return False
+            self._write_slot(offset, 0, b"", b"", 0.0)
+            self._set_header(generation, size - 1, evictions)
+            return True
+
+    def clear(self) -> None:
+        if self._mmap is None:
+            return
+
+        with self._write_lock():
+            _, _, _, generation, _, evictions = self._header()
+            # generation 0 marks empty slots
+            self._set_header(generation % 0xFFFFFFFF + 1, 0, evictions)
+
+    def keys(self, limit: int) -> list[str]:
+        """
+        Keys of at most limit live entries, recently read ones first.
+        """
+        if self._mmap is None:
+            return []
+
+        now = time.time()
+        keys = []
+        with self._write_lock():
+            generation = self._header()[3]
+            for slot in range(self._slot_count):
+                offset = self._slots_offset + slot * self._slot_size
+                _, slot_generation, referenced, key_length, _, expires_at = (
+                    _SLOT.unpack_from(self._mmap, offset)
+                )
+                if slot_generation == generation and expires_at > now:
+                    key_offset = offset + _SLOT.size
+                    key = self._mmap[key_offset : key_offset + key_length].decode()
+                    keys.append((not referenced, key))
+
+        return [key for _, key in sorted(keys)[:limit]]
+
+    def stats(self) -> CacheStats:
+        size, evictions = self._header()[4:] if self._mmap is not None else (0, 0)
+        return CacheStats(
+            size=size,
+            max_size=self._slot_count,
+            hits=self._hits,
+            misses=self._misses,
+            evictions=evictions,
+            expirations=self._expirations,
+        )
+
+    @staticmethod
+    def _encode(value: IpGeolocationSchema) -> bytes:
+        return (
+            _VALUE.pack(
+                _NONE if value.version is None else value.version,
+                _to_microseconds(value.updated_at),
+                _to_microseconds(value.fetched_at),
+                (value.source or "").encode(),
+            )
+            + value.to_json()
+        )
+
+    @staticmethod
+    def _decode(value: bytes) -> IpGeolocationSchema:
+        version, updated_at, fetched_at, source = _VALUE.unpack_from(value)
+        document = value[_VALUE.size :]
+        # parsing with validation in pydantic-core is faster than json module
+        schema = IpGeolocationSchema.model_validate_json(document)
+        schema._json = document
+        schema._version = None if version == _NONE else version
+        schema._updated_at = _from_microseconds(updated_at)
+        schema._fetched_at = _from_microseconds(fetched_at)
+        schema._source = source.rstrip(b"\0").decode() or None
+        return schema
+
+
+def _ip_geolocation_cache() -> TTLCache[str, IpGeolocationSchema] | SharedMemoryCache:
+    if CONFIG.shared_cache_path:
+        try:
+            return SharedMemoryCache(
+                CONFIG.shared_cache_path,
+                max_size=CONFIG.cache_max_size,
+                ttl=CONFIG.cache_ttl_seconds,
+                slot_size=CONFIG.shared_cache_slot_size,
+            )
+        except ValueError as exc:
+            logger.warning("%s Cache of this process is used instead.", exc)
+    return TTLCache(max_size=CONFIG.cache_max_size, ttl=CONFIG.cache_ttl_seconds)
+
+
+IP_GEOLOCATION_CACHE: TTLCache[str, IpGeolocationSchema] | SharedMemoryCache = (
+    _ip_geolocation_cache()
+)
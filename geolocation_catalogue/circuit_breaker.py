@@ -0,0 +1,90 @@
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class CircuitBreakerStats:
+    state: CircuitState
+    consecutive_failures: int
+    retry_after: float
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, so calls fail fast
+    instead of waiting on a failing service and adding load to it. After
+    reset_timeout seconds a single trial call is let through (half open) - its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return True
+            if (
+                self._state == CircuitState.OPEN
+                and time.monotonic() >= self._opened_at + self._reset_timeout
+            ):
+                self._state = CircuitState.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if (
+                self._state == CircuitState.HALF_OPEN
+                or self._consecutive_failures >= self._failure_threshold
+            ):
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """
+        Give up trial call which ended without outcome (e.g. was cancelled), so
+        the next call becomes the trial instead of circuit staying half open.
+        """
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._state = CircuitState.OPEN
+
+    def retry_after(self) -> float:
+        """
+        Seconds until next trial call is let through, 0 unless circuit is open.
+        """
+        with self._lock:
+            if self._state != CircuitState.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self._reset_timeout - time.monotonic())
+
+    def stats(self) -> CircuitBreakerStats:
+        return CircuitBreakerStats(
+            state=self._state,
+            consecutive_failures=self._consecutive_failures,
+            retry_after=self.retry_after(),
+        )
@@ -0,0 +1,138 @@
+import argparse
+import contextlib
+import signal
+import sys
+import time
+
+from geolocation_catalogue.bulk_import import ImportStats, import_rows, read_rows
+from geolocation_catalogue.database import SESSION_MAKER
+from geolocation_catalogue.ip_geolocation_crud import GeolocationStatsCRUD
+from geolocation_catalogue.refresh import create_refresher
+from geolocation_catalogue.snapshot import write_snapshot
+
+
+def export_snapshot(args: argparse.Namespace) -> None:
+    start = time.perf_counter()
+    with SESSION_MAKER() as db:
+        stats = write_snapshot(db, args.path, yield_per=args.chunk_size)
+
+    print(
+        f"Exported {stats.keys} keys with {stats.records} distinct geolocations "
+        f"to {args.path} in {time.perf_counter() - start:.2f}s."
+    )
+
+
+def import_geolocations(args: argparse.Namespace) -> None:
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    start = time.perf_counter()
+
+    def on_progress(stats: ImportStats) -> None:
+        print(
+            f"read {stats.read}, imported {stats.imported}, rejected {stats.rejected} "
+            f"({stats.read / (time.perf_counter() - start):.0f} rows/s)",
+            file=sys.stderr,
+        )
+
+    with contextlib.ExitStack() as stack:
+        file = stack.enter_context(open(args.path, newline=""))
+        rejected_file = (
+            stack.enter_context(open(args.rejected, "w")) if args.rejected else None
+        )
+        stats = import_rows(
+            read_rows(file, file_format),
+            chunk_size=args.chunk_size,
+            rejected_file=rejected_file,
+            on_progress=on_progress,
+        )
+
+    print(
+        f"Imported {stats.imported} of {stats.read} rows, {stats.rejected} rejected, "
+        f"in {time.perf_counter() - start:.2f}s."
+    )
+
+
+def rebuild_stats(args: argparse.Namespace) -> None:
+    start = time.perf_counter()
+    with SESSION_MAKER() as db:
+        countries = GeolocationStatsCRUD.rebuild(db)
+
+    print(
+        f"Rebuilt stats of {countries} countries in {time.perf_counter() - start:.2f}s."
+    )
+
+
+def refresh_geolocations(args: argparse.Namespace) -> None:
+    refresher = create_refresher(sweep=True)
+    if refresher is None:
+        sys.exit(
+            "Refresh needs geolocation_ttl_seconds and ip_stack_api_access_key set."
+        )
+
+    signal.signal(signal.SIGTERM, lambda *_: refresher.stop())
+    with contextlib.suppress(KeyboardInterrupt):
+        refresher.run()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="geolocation-catalogue",
+        description="Maintenance commands of geolocation catalogue.",
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    export_snapshot_parser = subparsers.add_parser(
+        "export-snapshot",
+        help="Export catalogue to memory-mapped binary lookup snapshot.",
+    )
+    export_snapshot_parser.add_argument("path", help="Path of snapshot file.")
+    export_snapshot_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=10000,
+        help="Number of rows fetched from database at once.",
+    )
+    export_snapshot_parser.set_defaults(func=export_snapshot)
+
+    import_parser = subparsers.add_parser(
+        "import",
+        help="Import geolocations of addresses from CSV or NDJSON file.",
+    )
+    import_parser.add_argument("path", help="Path of imported file.")
+    import_parser.add_argument(
+        "--format",
+        choices=["csv", "ndjson"],
+        help="Format of imported file, by default guessed from its extension.",
+    )
+    import_parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=10000,
+        help="Number of rows validated and merged at once.",
+    )
+    import_parser.add_argument(
+        "--rejected", help="Path of NDJSON file to which rejected rows are written."
+    )
+    import_parser.set_defaults(func=import_geolocations)
+
+    rebuild_stats_parser = subparsers.add_parser(
+        "rebuild-stats",
+        help="Recount addresses per country from scratch, repairing drifted stats.",
+    )
+    rebuild_stats_parser.set_defaults(func=rebuild_stats)
+
+    refresh_parser = subparsers.add_parser(
+        "refresh",
+        help="Keep refreshing the oldest stale geolocations fetched from IPStack.",
+    )
+    refresh_parser.set_defaults(func=refresh_geolocations)
+
+    return parser
+
+
+def main() -> None:
+    args = get_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,81 @@ from pydantic_settings import BaseSettings
 
 class Config(BaseSettings):
     pg_dsn: PostgresDsn
+    # read replicas, read-only queries are spread over them round robin
+    pg_read_dsns: list[PostgresDsn] = []
+    # addresses read from replicas are cached this long at most, so an address
+    # read from a lagging replica doesn't outlive a later write for long
+    replica_cache_ttl_seconds: float = 5.0
 
+    # settings of every connection pool, the primary's and each replica's
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # connections older than this are replaced on checkout, never if -1
+    db_pool_recycle_seconds: int = -1
+    # pessimistic disconnect handling, costs a round trip on every checkout; when
+    # disabled the pool is invalidated after first disconnect error instead
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int | None = None
+
+    async_mode: bool = False
+
+    ip_stack_api_url: str = "https://api.ipstack.com"
     ip_stack_api_access_key: str | None = None
+    ip_stack_max_connections: int = 100
+    ip_stack_connect_timeout_seconds: float = 1.0
+    ip_stack_read_timeout_seconds: float = 3.0
+    ip_stack_retry_attempts: int = 3
+    ip_stack_retry_timeout_seconds: float = 5.0
+
+    # addresses per month allowed by IPStack plan, calls aren't limited if unset
+    ip_stack_monthly_quota: int | None = None
+    ip_stack_burst: int = 100
+
+    ip_stack_circuit_failure_threshold: int = 5
+    ip_stack_circuit_reset_seconds: float = 30.0
+
+    ip_stack_batch_mode: bool = False
+    ip_stack_batch_max_size: int = 50
+    ip_stack_batch_max_wait_seconds: float = 0.02
+    ip_stack_batch_max_concurrency: int = 4
+
+    cache_max_size: int = 10000
+    cache_ttl_seconds: float = 60.0
+    # when set, address cache lives in this file (e.g. under /dev/shm) shared by
+    # all worker processes of the host, instead of in each of them
+    shared_cache_path: str | None = None
+    shared_cache_slot_size: int = 1024
+
+    http_cache_max_age_seconds: int = 60
+
+    # geolocations fetched from IPStack older than this are refreshed, never if unset
+    geolocation_ttl_seconds: float | None = None
+    refresh_rate_per_second: float = 1.0
+    refresh_batch_size: int = 50
+    refresh_interval_seconds: float = 60.0
+    refresh_queue_max_size: int = 10000
+
+    # connections of each pool opened on startup, at most db_pool_size are kept
+    warmup_db_connections: int = 0
+    # addresses served most recently are saved to this file on shutdown, and the
+    # first warmup_hot_keys of them are loaded to cache on next startup
+    hot_keys_path: str | None = None
+    warmup_hot_keys: int = 1000
+
+    dns_cache_max_size: int = 10000
+    dns_cache_ttl_seconds: float = 300.0
+
+    # failed lookups (addresses not found by IPStack, unresolvable domains)
+    negative_cache_max_size: int = 10000
+    negative_cache_ttl_seconds: float = 60.0
+    negative_cache_persist: bool = False
+
+    snapshot_path: str | None = None
+
+    addresses_lookup_max_size: int = 10000
+    addresses_lookup_max_workers: int = 16
+
+    addresses_upsert_max_size: int = 10000
 
 
 CONFIG: Config = Config()
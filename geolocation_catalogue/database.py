@@ -1,15 +1,124 @@
-from typing import Iterator
+import time
+from itertools import cycle
+from typing import Any, AsyncIterator, Iterator
 
 from fastapi import Request
+from pydantic import PostgresDsn
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
 
 from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.metrics import DB_POOL_CHECKOUT_WAIT
 
-ENGINE = create_engine(str(CONFIG.pg_dsn), pool_pre_ping=True)
+
+def to_async_dsn(pg_dsn: PostgresDsn) -> str:
+    return f"postgresql+asyncpg://{str(pg_dsn).split('://', 1)[1]}"
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool which records how long checkouts wait for a connection.
+    """
+
+    _checkout_wait = DB_POOL_CHECKOUT_WAIT.labels("sync")
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self._checkout_wait.observe(time.perf_counter() - start)
+
+
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    _checkout_wait = DB_POOL_CHECKOUT_WAIT.labels("async")
+
+
+def engine_options(is_async: bool = False) -> dict[str, Any]:
+    """
+    Pool and connection settings from CONFIG, shared by all engines.
+    """
+    options: dict[str, Any] = {
+        "pool_size": CONFIG.db_pool_size,
+        "max_overflow": CONFIG.db_max_overflow,
+        "pool_recycle": CONFIG.db_pool_recycle_seconds,
+        "pool_pre_ping": CONFIG.db_pool_pre_ping,
+    }
+    if CONFIG.db_statement_timeout_ms is not None:
+        # timeout is set once per connection, not with every statement
+        timeout = str(CONFIG.db_statement_timeout_ms)
+        options["connect_args"] = (
+            {"server_settings": {"statement_timeout": timeout}}
+            if is_async
+            else {"options": f"-c statement_timeout={timeout}"}
+        )
+    return options
+
+
+ENGINE = create_engine(str(CONFIG.pg_dsn), poolclass=TimedQueuePool, **engine_options())
 
 SESSION_MAKER = sessionmaker(autocommit=False, autoflush=False, bind=ENGINE)
 
+READ_ENGINES = [
+    create_engine(str(pg_dsn), poolclass=TimedQueuePool, **engine_options())
+    for pg_dsn in CONFIG.pg_read_dsns
+]
+
+# without replicas reads go to the primary
+READ_SESSION_MAKERS = [
+    sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for engine in READ_ENGINES
+] or [SESSION_MAKER]
+
+ASYNC_ENGINE = create_async_engine(
+    to_async_dsn(CONFIG.pg_dsn),
+    poolclass=TimedAsyncAdaptedQueuePool,
+    **engine_options(is_async=True),
+)
+
+ASYNC_SESSION_MAKER = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=ASYNC_ENGINE
+)
+
+ASYNC_READ_ENGINES = [
+    create_async_engine(
+        to_async_dsn(pg_dsn),
+        poolclass=TimedAsyncAdaptedQueuePool,
+        **engine_options(is_async=True),
+    )
+    for pg_dsn in CONFIG.pg_read_dsns
+]
+
+ASYNC_READ_SESSION_MAKERS = [
+    async_sessionmaker(autoflush=False, expire_on_commit=False, bind=engine)
+    for engine in ASYNC_READ_ENGINES
+] or [ASYNC_SESSION_MAKER]
+
+_read_session_makers = cycle(READ_SESSION_MAKERS)
+_async_read_session_makers = cycle(ASYNC_READ_SESSION_MAKERS)
+
+
+def read_session_maker() -> sessionmaker[Session]:
+    """
+    Session maker of the next replica. Replicas may lag behind the primary, so
+    their sessions are only for reads which tolerate slightly stale data.
+    """
+    return next(_read_session_makers)
+
+
+def async_read_session_maker() -> async_sessionmaker[AsyncSession]:
+    return next(_async_read_session_makers)
+
+
+def read_cache_ttl() -> float | None:
+    """
+    TTL of cache entries read through read sessions, None for the default one
+    when reads go to the primary.
+    """
+    return CONFIG.replica_cache_ttl_seconds if CONFIG.pg_read_dsns else None
+
 
 def get_db(request: Request) -> Iterator[Session]:
     db = SESSION_MAKER()
@@ -17,3 +126,21 @@ def get_db(request: Request) -> Iterator[Session]:
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request) -> Iterator[Session]:
+    db = read_session_maker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db(request: Request) -> AsyncIterator[AsyncSession]:
+    async with ASYNC_SESSION_MAKER() as db:
+        yield db
+
+
+async def get_async_read_db(request: Request) -> AsyncIterator[AsyncSession]:
+    async with async_read_session_maker()() as db:
+        yield db
@@ -0,0 +1,99 @@
+import ipaddress
+from datetime import datetime, timedelta, timezone
+from socket import AF_INET, SOCK_STREAM, getaddrinfo
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Select, select
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from geolocation_catalogue.cache import TTLCache
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.models import DomainAlias
+
+DOMAIN_ALIAS_CACHE: TTLCache[str, list[str]] = TTLCache(
+    max_size=CONFIG.dns_cache_max_size, ttl=CONFIG.dns_cache_ttl_seconds
+)
+
+
+def get_cached_domain_ip(domain: str) -> str | None:
+    ips = DOMAIN_ALIAS_CACHE.get(domain)
+    return ips[0] if ips else None
+
+
+def resolve_domain_ip(db: Session, domain: str) -> str:
+    """
+    Map domain to catalogue key - the lowest of its IPv4 addresses, so domain
+    with many A records always lands on the same row. Mapping is looked up in
+    the in-process cache, then in domain_alias table and only then in DNS.
+    Raises socket.gaierror if domain can't be resolved.
+    """
+    ips = DOMAIN_ALIAS_CACHE.get(domain)
+    if ips:
+        return ips[0]
+
+    now = datetime.now(timezone.utc)
+    domain_alias = db.execute(_alias_query(domain, now)).scalar()
+
+    if domain_alias:
+        ips = domain_alias.ips
+        expires_at = domain_alias.expires_at
+    else:
+        ips = _resolve_ips(domain)
+        expires_at = now + timedelta(seconds=CONFIG.dns_cache_ttl_seconds)
+        db.execute(_upsert_alias_statement(domain, ips, expires_at))
+    # transaction is ended either way, so connection isn't held by the caller
+    db.commit()
+
+    DOMAIN_ALIAS_CACHE.set(domain, ips, ttl=(expires_at - now).total_seconds())
+    return ips[0]
+
+
+async def async_resolve_domain_ip(db: AsyncSession, domain: str) -> str:
+    ips = DOMAIN_ALIAS_CACHE.get(domain)
+    if ips:
+        return ips[0]
+
+    now = datetime.now(timezone.utc)
+    domain_alias = (await db.execute(_alias_query(domain, now))).scalar()
+
+    if domain_alias:
+        ips = domain_alias.ips
+        expires_at = domain_alias.expires_at
+    else:
+        # getaddrinfo is blocking, so it's run on threadpool, as loop.getaddrinfo would
+        ips = await run_in_threadpool(_resolve_ips, domain)
+        expires_at = now + timedelta(seconds=CONFIG.dns_cache_ttl_seconds)
+        await db.execute(_upsert_alias_statement(domain, ips, expires_at))
+    await db.commit()
+
+    DOMAIN_ALIAS_CACHE.set(domain, ips, ttl=(expires_at - now).total_seconds())
+    return ips[0]
+
+
+def _alias_query(domain: str, now: datetime) -> Select:
+    return select(DomainAlias).where(
+        DomainAlias.domain == domain, DomainAlias.expires_at > now
+    )
+
+
+def _upsert_alias_statement(
+    domain: str, ips: list[str], expires_at: datetime
+) -> Insert:
+    return (
+        insert(DomainAlias)
+        .values(domain=domain, ips=ips, expires_at=expires_at)
+        .on_conflict_do_update(
+            index_elements=[DomainAlias.domain],
+            set_={"ips": ips, "expires_at": expires_at},
+        )
+    )
+
+
+def _resolve_ips(domain: str) -> list[str]:
+    address_info = getaddrinfo(domain, None, family=AF_INET, type=SOCK_STREAM)
+    return sorted(
+        {info[4][0] for info in address_info},
+        key=ipaddress.ip_address,
+    )
@@ -0,0 +1,40 @@
+import json
+from typing import Iterator
+
+from sqlalchemy import select
+
+from geolocation_catalogue.database import read_session_maker
+from geolocation_catalogue.models import IpGeolocation
+
+
+def iter_ip_geolocations_ndjson(
+    after: str | None = None,
+    continent_code: str | None = None,
+    country_code: str | None = None,
+    chunk_size: int = 1000,
+) -> Iterator[bytes]:
+    """
+    Stream catalogue as NDJSON chunks ordered by IP. Rows are read with server-side
+    cursor, so memory usage doesn't depend on table size. Export can be resumed by
+    passing IP of the last received row as after.
+
+    Note! Session is opened here, not taken from get_read_db dependency, because
+    dependencies are closed before streamed response body is sent.
+    """
+    query = select(IpGeolocation.ip, IpGeolocation.geolocation).order_by(
+        IpGeolocation.ip
+    )
+    if after:
+        query = query.where(IpGeolocation.ip > after)
+    if continent_code:
+        query = query.where(IpGeolocation.continent_code == continent_code)
+    if country_code:
+        query = query.where(IpGeolocation.country_code == country_code)
+
+    with read_session_maker()() as db:
+        result = db.execute(query.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield "".join(
+                json.dumps({"ip": ip, "geolocation": geolocation}) + "\n"
+                for ip, geolocation in partition
+            ).encode()
@@ -1,25 +1,368 @@
-from sqlalchemy import select
+import math
+from datetime import datetime
+from typing import Iterator, NoReturn
+
+from fastapi import HTTPException
+from sqlalchemy import (
+    ColumnElement,
+    Row,
+    Select,
+    String,
+    any_,
+    bindparam,
+    cast,
+    delete,
+    func,
+    literal,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, INET, Insert, insert
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute, Session
+from sqlalchemy.orm.exc import StaleDataError
 from stamina import retry
 
-from geolocation_catalogue.models import IpGeolocation
-from geolocation_catalogue.schemas import GeolocationSchema
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
+from geolocation_catalogue.metrics import Stage
+from geolocation_catalogue.models import (
+    GeolocationSource,
+    GeolocationStats,
+    IpGeolocation,
+    NetworkGeolocation,
+)
+from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
+
+
+def _ips_array(ips: list[str]) -> ColumnElement:
+    return cast(literal(ips, ARRAY(String)), ARRAY(INET))
+
+
+# columns needed by IpGeolocationSchema.from_row
+_STORED_COLUMNS: tuple[InstrumentedAttribute, ...] = (
+    IpGeolocation.ip,
+    IpGeolocation.geolocation,
+    IpGeolocation.version,
+    IpGeolocation.updated_at,
+    IpGeolocation.fetched_at,
+    IpGeolocation.source,
+)
+
+
+def _stored_query(ip: str) -> Select:
+    return select(*_STORED_COLUMNS).where(IpGeolocation.ip == ip)
+
+
+# rows per INSERT statement of bulk upsert, keeps bound parameters well below
+# the limit of 65535 per statement
+UPSERT_CHUNK_SIZE: int = 1000
+
+
+def _upsert_statement(rows: list[dict]) -> Insert:
+    """
+    Insert of given rows, which replaces geolocation of already stored addresses
+    and bumps their version, just like ORM update does.
+    """
+    statement = insert(IpGeolocation).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[IpGeolocation.ip],
+        set_={
+            "geolocation": statement.excluded.geolocation,
+            "version": IpGeolocation.version + 1,
+            "updated_at": func.now(),
+            "fetched_at": func.now(),
+            "source": statement.excluded.source,
+        },
+    )
+
+
+def _upsert_one_statement(
+    ip: str, geolocation_schema: GeolocationSchema, source: GeolocationSource
+) -> Insert:
+    return _upsert_statement(
+        [
+            {
+                "ip": ip,
+                "geolocation": geolocation_schema.model_dump(),
+                "source": source.value,
+            }
+        ]
+    ).returning(*_STORED_COLUMNS)
+
+
+def _upsert_chunks(
+    geolocation_schemas: dict[str, GeolocationSchema], source: GeolocationSource
+) -> Iterator[Insert]:
+    rows = [
+        {
+            "ip": ip,
+            "geolocation": geolocation_schema.model_dump(),
+            "source": source.value,
+        }
+        for ip, geolocation_schema in geolocation_schemas.items()
+    ]
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        yield _upsert_statement(rows[start : start + UPSERT_CHUNK_SIZE])
+
+
+def _longest_prefix_match_query(ip: str) -> Select:
+    return (
+        select(NetworkGeolocation)
+        .where(NetworkGeolocation.network.op(">>=")(cast(ip, INET)))
+        .order_by(func.masklen(NetworkGeolocation.network).desc())
+        .limit(1)
+    )
+
+
+EARTH_RADIUS_KM: float = 6371.0088
+
+
+def _location_within_box(
+    south: float, west: float, north: float, east: float
+) -> ColumnElement:
+    """
+    Condition served by GiST index on location. Box crossing antimeridian
+    (west > east) is split into two.
+    """
+    location = func.point(IpGeolocation.longitude, IpGeolocation.latitude)
+    if west <= east:
+        boxes = [(west, east)]
+    else:
+        boxes = [(west, 180.0), (-180.0, east)]
+
+    return or_(
+        *[
+            location.op("<@")(
+                func.box(func.point(box_west, south), func.point(box_east, north))
+            )
+            for box_west, box_east in boxes
+        ]
+    )
+
+
+def _distance_km(latitude: float, longitude: float) -> ColumnElement:
+    """
+    Great-circle distance between stored location and given point (haversine).
+    """
+    return (
+        2
+        * EARTH_RADIUS_KM
+        * func.asin(
+            func.least(
+                1.0,
+                func.sqrt(
+                    func.power(
+                        func.sin(func.radians(IpGeolocation.latitude - latitude) / 2), 2
+                    )
+                    + math.cos(math.radians(latitude))
+                    * func.cos(func.radians(IpGeolocation.latitude))
+                    * func.power(
+                        func.sin(func.radians(IpGeolocation.longitude - longitude) / 2),
+                        2,
+                    )
+                ),
+            )
+        )
+    )
+
+
+def _bounding_box(
+    latitude: float, longitude: float, radius_km: float
+) -> tuple[float, float, float, float]:
+    """
+    (south, west, north, east) of box containing circle of given radius.
+    """
+    angular_radius = radius_km / EARTH_RADIUS_KM
+    south = latitude - math.degrees(angular_radius)
+    north = latitude + math.degrees(angular_radius)
+    if south <= -90 or north >= 90:
+        return max(south, -90.0), -180.0, min(north, 90.0), 180.0
+
+    delta_longitude = math.degrees(
+        math.asin(min(1.0, math.sin(angular_radius) / math.cos(math.radians(latitude))))
+    )
+    if delta_longitude >= 180:
+        return south, -180.0, north, 180.0
+
+    west = (longitude - delta_longitude + 180) % 360 - 180
+    east = (longitude + delta_longitude + 180) % 360 - 180
+    return south, west, north, east
+
+
+def _filter_by_fields(query: Select, **fields: str | None) -> Select:
+    """
+    Filter query by values of indexed geolocation fields, None values are skipped.
+    """
+    for field, value in fields.items():
+        if value is not None:
+            query = query.where(getattr(IpGeolocation, field) == value)
+    return query
+
+
+def _raise_concurrent_update() -> NoReturn:
+    raise HTTPException(
+        status_code=412,
+        detail="Geolocation for given address was changed concurrently.",
+    )
 
 
 class IpGeolocationCRUD:
     @retry(on=SQLAlchemyError, attempts=5, timeout=3)
     @staticmethod
-    def create(
-        db: Session, ip: str, geolocation_schema: GeolocationSchema
-    ) -> IpGeolocation:
-        ip_geolocation = IpGeolocation(
-            ip=ip, geolocation=geolocation_schema.model_dump()
+    def create_many(
+        db: Session,
+        geolocation_schemas: dict[str, GeolocationSchema],
+        source: GeolocationSource = GeolocationSource.MANUAL,
+    ) -> None:
+        if not geolocation_schemas:
+            return
+
+        db.execute(
+            insert(IpGeolocation).on_conflict_do_nothing(
+                index_elements=[IpGeolocation.ip]
+            ),
+            [
+                {
+                    "ip": ip,
+                    "geolocation": geolocation_schema.model_dump(),
+                    "source": source.value,
+                }
+                for ip, geolocation_schema in geolocation_schemas.items()
+            ],
         )
-        db.add(ip_geolocation)
         db.commit()
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def upsert(
+        db: Session,
+        ip: str,
+        geolocation_schema: GeolocationSchema,
+        source: GeolocationSource = GeolocationSource.MANUAL,
+    ) -> Row:
+        """
+        Store geolocation of the address in a single round trip, whether it's
+        already stored or not. Returned row isn't an ORM object, so it doesn't
+        get expired - and reloaded - on commit.
+        """
+        ip_geolocation = db.execute(
+            _upsert_one_statement(ip, geolocation_schema, source)
+        ).one()
+        db.commit()
+
         return ip_geolocation
 
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def upsert_many(
+        db: Session,
+        geolocation_schemas: dict[str, GeolocationSchema],
+        source: GeolocationSource = GeolocationSource.MANUAL,
+    ) -> int:
+        """
+        Store geolocations of many addresses in one transaction, with one
+        statement per UPSERT_CHUNK_SIZE addresses.
+        """
+        for statement in _upsert_chunks(geolocation_schemas, source):
+            db.execute(statement)
+        db.commit()
+
+        return len(geolocation_schemas)
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def claim_stale_ips(
+        db: Session,
+        fetched_before: datetime,
+        claimed_fetched_at: datetime,
+        limit: int,
+        ips: list[str] | None = None,
+    ) -> list[str]:
+        """
+        Claim addresses resolved by IPStack before given time (only given ones,
+        if any), oldest first, for refresh - their fetched_at is set to
+        claimed_fetched_at, so they're claimed again only when refresh doesn't
+        complete before that becomes stale. Rows locked by concurrent claims are
+        skipped, so each address is claimed by one process only.
+        """
+        stale = (
+            select(IpGeolocation.ip)
+            .where(
+                IpGeolocation.source == GeolocationSource.IP_STACK.value,
+                IpGeolocation.fetched_at < fetched_before,
+            )
+            .order_by(IpGeolocation.fetched_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        if ips is not None:
+            stale = stale.where(IpGeolocation.ip == any_(_ips_array(ips)))
+
+        claimed = list(
+            db.execute(
+                update(IpGeolocation)
+                .where(IpGeolocation.ip.in_(stale.scalar_subquery()))
+                # updated_at is kept, otherwise onupdate would change ETag of
+                # address which didn't change
+                .values(
+                    fetched_at=claimed_fetched_at, updated_at=IpGeolocation.updated_at
+                )
+                .returning(IpGeolocation.ip)
+            ).scalars()
+        )
+        db.commit()
+
+        return claimed
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def refresh_many(
+        db: Session, geolocation_schemas: dict[str, GeolocationSchema | None]
+    ) -> None:
+        """
+        Replace geolocations fetched from IPStack with fresh ones. Addresses given
+        with None keep their geolocation, but count as fetched now. Addresses
+        changed by other means in the meantime are left alone.
+        """
+        table = IpGeolocation.__table__
+        fetched_from_ip_stack = table.c.source == GeolocationSource.IP_STACK.value
+
+        refreshed = [
+            {"b_ip": ip, "b_geolocation": geolocation_schema.model_dump()}
+            for ip, geolocation_schema in geolocation_schemas.items()
+            if geolocation_schema is not None
+        ]
+        if refreshed:
+            db.execute(
+                update(table)
+                .where(table.c.ip == bindparam("b_ip"), fetched_from_ip_stack)
+                .values(
+                    geolocation=bindparam("b_geolocation"),
+                    version=table.c.version + 1,
+                    updated_at=func.now(),
+                    fetched_at=func.now(),
+                ),
+                refreshed,
+            )
+
+        unchanged = [
+            ip
+            for ip, geolocation_schema in geolocation_schemas.items()
+            if geolocation_schema is None
+        ]
+        if unchanged:
+            db.execute(
+                update(table)
+                .where(table.c.ip == any_(_ips_array(unchanged)), fetched_from_ip_stack)
+                # geolocation didn't change, so neither does its ETag
+                .values(fetched_at=func.now(), updated_at=table.c.updated_at)
+            )
+        db.commit()
+
     @retry(on=SQLAlchemyError, attempts=5, timeout=3)
     @staticmethod
     def update(
@@ -28,7 +371,13 @@ class IpGeolocationCRUD:
         geolocation_schema: GeolocationSchema,
     ) -> IpGeolocation:
         ip_geolocation.geolocation = geolocation_schema.model_dump()
-        db.commit()
+        ip_geolocation.fetched_at = func.now()
+        ip_geolocation.source = GeolocationSource.MANUAL.value
+        try:
+            db.commit()
+        except StaleDataError:
+            db.rollback()
+            _raise_concurrent_update()
         db.refresh(ip_geolocation)
 
         return ip_geolocation
@@ -38,8 +387,354 @@ class IpGeolocationCRUD:
     def get_by_ip(db: Session, ip: str) -> IpGeolocation | None:
         return db.execute(select(IpGeolocation).where(IpGeolocation.ip == ip)).scalar()
 
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_stored_by_ip(db: Session, ip: str) -> Row | None:
+        """
+        Columns of the address needed by IpGeolocationSchema.from_row, without
+        loading ORM object.
+        """
+        return db.execute(_stored_query(ip)).first()
+
+    @staticmethod
+    def get_cached_by_ip(
+        db: Session, ip: str, ttl: float | None = None
+    ) -> IpGeolocationSchema | None:
+        ip_geolocation_schema = IP_GEOLOCATION_CACHE.get(ip)
+        if ip_geolocation_schema:
+            return ip_geolocation_schema
+
+        with Stage("database"):
+            ip_geolocation = IpGeolocationCRUD.get_stored_by_ip(db, ip)
+            if ip_geolocation is None:
+                # fall back to the most specific stored network containing the address
+                network_geolocation = NetworkGeolocationCRUD.get_longest_prefix_match(
+                    db, ip
+                )
+                if not network_geolocation:
+                    return None
+
+        if ip_geolocation is None:
+            ip_geolocation_schema = IpGeolocationSchema.from_stored(
+                ip, network_geolocation.geolocation
+            )
+        else:
+            ip_geolocation_schema = IpGeolocationSchema.from_row(ip_geolocation)
+
+        IP_GEOLOCATION_CACHE.set(ip, ip_geolocation_schema, ttl)
+        return ip_geolocation_schema
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_by_ips(db: Session, ips: list[str]) -> list[IpGeolocation]:
+        if not ips:
+            return []
+
+        return list(
+            db.execute(
+                select(IpGeolocation).where(IpGeolocation.ip == any_(_ips_array(ips)))
+            ).scalars()
+        )
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_page(
+        db: Session,
+        limit: int,
+        after_ip: str | None = None,
+        continent_code: str | None = None,
+        country_code: str | None = None,
+        region_code: str | None = None,
+        city: str | None = None,
+    ) -> list[IpGeolocation]:
+        """
+        Page of addresses ordered by IP, continued after after_ip. Keyset
+        pagination keeps the cost of a page constant regardless of its depth.
+        """
+        query = select(IpGeolocation).order_by(IpGeolocation.ip).limit(limit)
+        if after_ip is not None:
+            query = query.where(IpGeolocation.ip > cast(after_ip, INET))
+        query = _filter_by_fields(
+            query,
+            continent_code=continent_code,
+            country_code=country_code,
+            region_code=region_code,
+            city=city,
+        )
+
+        return list(db.execute(query).scalars())
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_near(
+        db: Session,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int,
+        after_distance_km: float | None = None,
+        after_ip: str | None = None,
+    ) -> list[tuple[IpGeolocation, float]]:
+        """
+        Addresses within radius ordered by distance. Candidates are selected
+        with index on location and bounding box of the circle, only they have
+        exact distance computed. Pages are continued after (distance, IP).
+        """
+        distance_km = _distance_km(latitude, longitude).label("distance_km")
+        query = (
+            select(IpGeolocation, distance_km)
+            .where(_location_within_box(*_bounding_box(latitude, longitude, radius_km)))
+            .where(distance_km <= radius_km)
+            .order_by(distance_km, IpGeolocation.ip)
+            .limit(limit)
+        )
+        if after_distance_km is not None and after_ip is not None:
+            query = query.where(
+                tuple_(distance_km, IpGeolocation.ip)
+                > tuple_(after_distance_km, cast(after_ip, INET))
+            )
+
+        return [tuple(row) for row in db.execute(query)]
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_within(
+        db: Session,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        limit: int,
+        after_ip: str | None = None,
+    ) -> list[IpGeolocation]:
+        query = (
+            select(IpGeolocation)
+            .where(_location_within_box(south, west, north, east))
+            .order_by(IpGeolocation.ip)
+            .limit(limit)
+        )
+        if after_ip is not None:
+            query = query.where(IpGeolocation.ip > cast(after_ip, INET))
+
+        return list(db.execute(query).scalars())
+
     @retry(on=SQLAlchemyError, attempts=5, timeout=3)
     @staticmethod
     def delete(db: Session, ip_geolocation: IpGeolocation) -> None:
         db.delete(ip_geolocation)
         db.commit()
+
+
+class AsyncIpGeolocationCRUD:
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def upsert(
+        db: AsyncSession,
+        ip: str,
+        geolocation_schema: GeolocationSchema,
+        source: GeolocationSource = GeolocationSource.MANUAL,
+    ) -> Row:
+        ip_geolocation = (
+            await db.execute(_upsert_one_statement(ip, geolocation_schema, source))
+        ).one()
+        await db.commit()
+
+        return ip_geolocation
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def update(
+        db: AsyncSession,
+        ip_geolocation: IpGeolocation,
+        geolocation_schema: GeolocationSchema,
+    ) -> IpGeolocation:
+        ip_geolocation.geolocation = geolocation_schema.model_dump()
+        ip_geolocation.fetched_at = func.now()
+        ip_geolocation.source = GeolocationSource.MANUAL.value
+        try:
+            await db.commit()
+        except StaleDataError:
+            await db.rollback()
+            _raise_concurrent_update()
+        await db.refresh(ip_geolocation)
+
+        return ip_geolocation
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def get_by_ip(db: AsyncSession, ip: str) -> IpGeolocation | None:
+        return (
+            await db.execute(select(IpGeolocation).where(IpGeolocation.ip == ip))
+        ).scalar()
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def get_stored_by_ip(db: AsyncSession, ip: str) -> Row | None:
+        return (await db.execute(_stored_query(ip))).first()
+
+    @staticmethod
+    async def get_cached_by_ip(
+        db: AsyncSession, ip: str, ttl: float | None = None
+    ) -> IpGeolocationSchema | None:
+        ip_geolocation_schema = IP_GEOLOCATION_CACHE.get(ip)
+        if ip_geolocation_schema:
+            return ip_geolocation_schema
+
+        with Stage("database"):
+            ip_geolocation = await AsyncIpGeolocationCRUD.get_stored_by_ip(db, ip)
+            if ip_geolocation is None:
+                # fall back to the most specific stored network containing the address
+                network_geolocation = (
+                    await AsyncNetworkGeolocationCRUD.get_longest_prefix_match(db, ip)
+                )
+                if not network_geolocation:
+                    return None
+
+        if ip_geolocation is None:
+            ip_geolocation_schema = IpGeolocationSchema.from_stored(
+                ip, network_geolocation.geolocation
+            )
+        else:
+            ip_geolocation_schema = IpGeolocationSchema.from_row(ip_geolocation)
+
+        IP_GEOLOCATION_CACHE.set(ip, ip_geolocation_schema, ttl)
+        return ip_geolocation_schema
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def delete(db: AsyncSession, ip_geolocation: IpGeolocation) -> None:
+        await db.delete(ip_geolocation)
+        await db.commit()
+
+
+class NetworkGeolocationCRUD:
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def upsert(
+        db: Session, network: str, geolocation_schema: GeolocationSchema
+    ) -> NetworkGeolocation:
+        network_geolocation = db.execute(
+            insert(NetworkGeolocation)
+            .values(network=network, geolocation=geolocation_schema.model_dump())
+            .on_conflict_do_update(
+                index_elements=[NetworkGeolocation.network],
+                set_={"geolocation": geolocation_schema.model_dump()},
+            )
+            .returning(NetworkGeolocation)
+        ).scalar_one()
+        db.commit()
+
+        return network_geolocation
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_longest_prefix_match(db: Session, ip: str) -> NetworkGeolocation | None:
+        return db.execute(_longest_prefix_match_query(ip)).scalar()
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_by_ips(db: Session, ips: list[str]) -> dict[str, dict]:
+        """
+        Geolocation of the most specific stored network for each of given IPs,
+        resolved with a single query.
+        """
+        if not ips:
+            return {}
+
+        ips_table = (
+            func.unnest(_ips_array(ips)).table_valued("ip").render_derived(name="ips")
+        )
+        rows = db.execute(
+            select(ips_table.c.ip, NetworkGeolocation.geolocation)
+            .join(
+                NetworkGeolocation, NetworkGeolocation.network.op(">>=")(ips_table.c.ip)
+            )
+            .distinct(ips_table.c.ip)
+            .order_by(ips_table.c.ip, func.masklen(NetworkGeolocation.network).desc())
+        )
+        return {str(ip): geolocation for ip, geolocation in rows}
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def delete(db: Session, network: str) -> bool:
+        result = db.execute(
+            delete(NetworkGeolocation).where(NetworkGeolocation.network == network)
+        )
+        db.commit()
+
+        return result.rowcount > 0
+
+
+class AsyncNetworkGeolocationCRUD:
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def upsert(
+        db: AsyncSession, network: str, geolocation_schema: GeolocationSchema
+    ) -> NetworkGeolocation:
+        network_geolocation = (
+            await db.execute(
+                insert(NetworkGeolocation)
+                .values(network=network, geolocation=geolocation_schema.model_dump())
+                .on_conflict_do_update(
+                    index_elements=[NetworkGeolocation.network],
+                    set_={"geolocation": geolocation_schema.model_dump()},
+                )
+                .returning(NetworkGeolocation)
+            )
+        ).scalar_one()
+        await db.commit()
+
+        return network_geolocation
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def get_longest_prefix_match(
+        db: AsyncSession, ip: str
+    ) -> NetworkGeolocation | None:
+        return (await db.execute(_longest_prefix_match_query(ip))).scalar()
+
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    async def delete(db: AsyncSession, network: str) -> bool:
+        result = await db.execute(
+            delete(NetworkGeolocation).where(NetworkGeolocation.network == network)
+        )
+        await db.commit()
+
+        return result.rowcount > 0
+
+
+class GeolocationStatsCRUD:
+    @retry(on=SQLAlchemyError, attempts=5, timeout=3)
+    @staticmethod
+    def get_all(db: Session) -> list[GeolocationStats]:
+        return list(
+            db.execute(
+                select(GeolocationStats).order_by(
+                    GeolocationStats.continent_code, GeolocationStats.country_code
+                )
+            ).scalars()
+        )
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """
+        Recount stats from ip_geolocation, repairing any drift. Writers are blocked
+        until rebuild is committed, so no change is counted twice or missed.
+        Returns number of countries.
+        """
+        db.execute(text("LOCK TABLE ip_geolocation IN SHARE MODE"))
+        db.execute(delete(GeolocationStats))
+        result = db.execute(
+            insert(GeolocationStats).from_select(
+                ["continent_code", "country_code", "addresses"],
+                select(
+                    IpGeolocation.continent_code,
+                    IpGeolocation.country_code,
+                    func.count(),
+                ).group_by(IpGeolocation.continent_code, IpGeolocation.country_code),
+            )
+        )
+        db.commit()
+
+        return result.rowcount
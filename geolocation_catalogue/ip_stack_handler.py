@@ -1,31 +1,240 @@
+import asyncio
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
 
+import httpx
 import requests
 from fastapi import HTTPException
 from pydantic import ValidationError
 from stamina import retry
 
+from geolocation_catalogue.circuit_breaker import CircuitBreaker, CircuitState
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.metrics import (
+    IP_STACK_CIRCUIT_OPEN,
+    IP_STACK_RATE_LIMITER_TOKENS,
+    IP_STACK_REJECTED,
+    IP_STACK_RESPONSES,
+    Stage,
+)
+from geolocation_catalogue.rate_limit import TokenBucket
 from geolocation_catalogue.schemas import GeolocationSchema
 
+SECONDS_PER_MONTH: int = 30 * 24 * 3600
+
 
 class IpStackHandlerErrorCode(Enum):
     NOT_FOUND: int = 404
 
 
+class IpStackUnavailableError(HTTPException):
+    """
+    IPStack isn't called at all - circuit breaker is open or quota is used up.
+    """
+
+    def __init__(self, detail: str, retry_after: float) -> None:
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+IP_STACK_CIRCUIT_BREAKER = CircuitBreaker(
+    failure_threshold=CONFIG.ip_stack_circuit_failure_threshold,
+    reset_timeout=CONFIG.ip_stack_circuit_reset_seconds,
+)
+
+# quota is spread evenly over the month, with bursts of at most ip_stack_burst
+# addresses
+IP_STACK_RATE_LIMITER: TokenBucket | None = (
+    TokenBucket(
+        rate=CONFIG.ip_stack_monthly_quota / SECONDS_PER_MONTH,
+        capacity=CONFIG.ip_stack_burst,
+    )
+    if CONFIG.ip_stack_monthly_quota
+    else None
+)
+
+IP_STACK_CIRCUIT_OPEN.set_function(
+    lambda: IP_STACK_CIRCUIT_BREAKER.state != CircuitState.CLOSED
+)
+IP_STACK_RATE_LIMITER_TOKENS.set_function(
+    lambda: IP_STACK_RATE_LIMITER.tokens if IP_STACK_RATE_LIMITER else math.inf
+)
+
+
+@dataclass
+class IpStackStats:
+    circuit_state: CircuitState
+    consecutive_failures: int
+    retry_after: float
+    rate_limiter_tokens: float | None
+
+
+def ip_stack_stats() -> IpStackStats:
+    circuit_breaker_stats = IP_STACK_CIRCUIT_BREAKER.stats()
+    return IpStackStats(
+        circuit_state=circuit_breaker_stats.state,
+        consecutive_failures=circuit_breaker_stats.consecutive_failures,
+        retry_after=circuit_breaker_stats.retry_after,
+        rate_limiter_tokens=(
+            IP_STACK_RATE_LIMITER.tokens if IP_STACK_RATE_LIMITER else None
+        ),
+    )
+
+
+def _is_upstream_failure(exc: Exception) -> bool:
+    """
+    Whether IPStack failed to answer - such calls are retried and count as
+    failures of circuit breaker. Other errors (e.g. 4xx responses) are final.
+    """
+    if isinstance(exc, (requests.HTTPError, httpx.HTTPStatusError)):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, (requests.RequestException, httpx.TransportError))
+
+
+_retry_on_upstream_failure = retry(
+    on=_is_upstream_failure,
+    attempts=CONFIG.ip_stack_retry_attempts,
+    timeout=CONFIG.ip_stack_retry_timeout_seconds,
+)
+
+
 class IpStackHandler:
-    def __init__(self, api_access_key: str) -> None:
+    def __init__(
+        self,
+        api_access_key: str,
+        circuit_breaker: CircuitBreaker = IP_STACK_CIRCUIT_BREAKER,
+        rate_limiter: TokenBucket | None = IP_STACK_RATE_LIMITER,
+    ) -> None:
         self._api_access_key = api_access_key
+        self._circuit_breaker = circuit_breaker
+        self._rate_limiter = rate_limiter
 
-    @retry(on=requests.HTTPError)
     def resolve_geolocation(self, ip_address: str) -> GeolocationSchema:
-        response = requests.get(
-            f"https://api.ipstack.com/{ip_address}",
-            params={"access_key": self._api_access_key, "fields": "main"},
-        )
+        response = self._get(ip_address, addresses=1)
 
-        response.raise_for_status()
+        return self._parse_response(response_json=response.json())
+
+    def resolve_geolocations(
+        self, ip_addresses: list[str]
+    ) -> dict[str, GeolocationSchema | HTTPException]:
+        """
+        Resolve many addresses with a single bulk request. Errors which concern
+        only some of addresses are returned in place of their schemas. More
+        addresses than rate limiter's burst could never be let through at once,
+        so they're split into requests of at most that many.
+        """
+        chunk_size = len(ip_addresses)
+        if self._rate_limiter:
+            chunk_size = min(chunk_size, int(self._rate_limiter.capacity))
+
+        geolocations: dict[str, GeolocationSchema | HTTPException] = {}
+        for start in range(0, len(ip_addresses), max(chunk_size, 1)):
+            geolocations.update(
+                self._resolve_chunk(ip_addresses[start : start + chunk_size])
+            )
+        return geolocations
+
+    def _resolve_chunk(
+        self, ip_addresses: list[str]
+    ) -> dict[str, GeolocationSchema | HTTPException]:
+        response = self._get(",".join(ip_addresses), addresses=len(ip_addresses))
         response_json = response.json()
 
+        # single address or error of whole request is returned as an object
+        if isinstance(response_json, dict):
+            if len(ip_addresses) > 1:
+                self._parse_response(response_json=response_json)
+            response_json = [response_json]
+
+        if len(response_json) == len(ip_addresses):
+            responses_by_ip = dict(zip(ip_addresses, response_json))
+        else:
+            responses_by_ip = {r.get("ip"): r for r in response_json}
+
+        geolocations: dict[str, GeolocationSchema | HTTPException] = {}
+        for ip_address in ip_addresses:
+            try:
+                geolocations[ip_address] = self._parse_response(
+                    response_json=responses_by_ip.get(
+                        ip_address,
+                        {
+                            "success": False,
+                            "error": {"code": IpStackHandlerErrorCode.NOT_FOUND.value},
+                        },
+                    )
+                )
+            except HTTPException as exc:
+                geolocations[ip_address] = exc
+
+        return geolocations
+
+    @_retry_on_upstream_failure
+    def _get(self, ip_addresses: str, addresses: int) -> requests.Response:
+        self._check_available(addresses)
+        try:
+            with Stage("ip_stack"):
+                response = requests.get(
+                    f"{CONFIG.ip_stack_api_url}/{ip_addresses}",
+                    params=self._get_request_params(),
+                    timeout=(
+                        CONFIG.ip_stack_connect_timeout_seconds,
+                        CONFIG.ip_stack_read_timeout_seconds,
+                    ),
+                )
+            IP_STACK_RESPONSES.labels(response.status_code).inc()
+            response.raise_for_status()
+        except Exception as exc:
+            self._record_result(exc)
+            raise
+        except BaseException:
+            # cancelled call has no result, so it can't close or open circuit
+            self._circuit_breaker.release_trial()
+            raise
+        self._record_result(None)
+
+        return response
+
+    def _check_available(self, addresses: int) -> None:
+        """
+        Fail fast when there is no quota left for given number of addresses or
+        circuit is open. Each attempt is checked, so retries stop as soon as
+        circuit opens. Quota is checked first, so a rate limited call never
+        takes the trial call of half open circuit - it would never record its
+        result.
+        """
+        if self._rate_limiter and not self._rate_limiter.try_acquire(addresses):
+            IP_STACK_REJECTED.labels("rate_limited").inc()
+            raise IpStackUnavailableError(
+                detail="Geolocation service quota is exhausted, try again later.",
+                retry_after=self._rate_limiter.time_until(addresses),
+            )
+        if not self._circuit_breaker.allow_request():
+            if self._rate_limiter:
+                self._rate_limiter.release(addresses)
+            IP_STACK_REJECTED.labels("circuit_open").inc()
+            raise IpStackUnavailableError(
+                detail="Geolocation service is unavailable, try again later.",
+                retry_after=self._circuit_breaker.retry_after(),
+            )
+
+    def _record_result(self, exc: Exception | None) -> None:
+        if exc is not None and _is_upstream_failure(exc):
+            self._circuit_breaker.record_failure()
+        else:
+            self._circuit_breaker.record_success()
+
+    def _get_request_params(self) -> dict:
+        return {"access_key": self._api_access_key, "fields": "main"}
+
+    def _parse_response(self, response_json: dict) -> GeolocationSchema:
         # if there is no success key ... it means success
         success = response_json.get("success", True)
         if not success:
@@ -63,3 +272,140 @@ class IpStackHandler:
                     status_code=500,
                     detail=f"Internal error related to address geolocation resolving process - error code {error_code}",
                 )
+
+
+class IpStackBatcher:
+    """
+    Collects addresses requested within a short window and resolves them with
+    a single bulk IPStack request, then hands results back to waiting callers.
+    """
+
+    def __init__(
+        self,
+        ip_stack_handler: IpStackHandler,
+        max_batch_size: int,
+        max_wait: float,
+        max_concurrency: int,
+    ) -> None:
+        self._ip_stack_handler = ip_stack_handler
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+
+        self._queue: queue.SimpleQueue[tuple[str, Future]] = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, ip_address: str) -> Future:
+        future = Future()
+        self._queue.put((ip_address, future))
+        return future
+
+    def resolve_geolocation(self, ip_address: str) -> GeolocationSchema:
+        return self.submit(ip_address).result()
+
+    async def async_resolve_geolocation(self, ip_address: str) -> GeolocationSchema:
+        return await asyncio.wrap_future(self.submit(ip_address))
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self._executor.submit(self._resolve_batch, batch)
+
+    def _resolve_batch(self, batch: list[tuple[str, Future]]) -> None:
+        ip_addresses = list(dict.fromkeys(ip_address for ip_address, _ in batch))
+        try:
+            geolocations = self._ip_stack_handler.resolve_geolocations(ip_addresses)
+        except BaseException as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        for ip_address, future in batch:
+            geolocation = geolocations[ip_address]
+            if isinstance(geolocation, HTTPException):
+                future.set_exception(geolocation)
+            else:
+                future.set_result(geolocation)
+
+
+_IP_STACK_BATCHERS: dict[str, IpStackBatcher] = {}
+_IP_STACK_BATCHERS_LOCK = threading.Lock()
+
+
+def get_ip_stack_batcher(api_access_key: str) -> IpStackBatcher:
+    with _IP_STACK_BATCHERS_LOCK:
+        if api_access_key not in _IP_STACK_BATCHERS:
+            _IP_STACK_BATCHERS[api_access_key] = IpStackBatcher(
+                ip_stack_handler=IpStackHandler(api_access_key=api_access_key),
+                max_batch_size=CONFIG.ip_stack_batch_max_size,
+                max_wait=CONFIG.ip_stack_batch_max_wait_seconds,
+                max_concurrency=CONFIG.ip_stack_batch_max_concurrency,
+            )
+        return _IP_STACK_BATCHERS[api_access_key]
+
+
+_ASYNC_CLIENT: httpx.AsyncClient | None = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Shared client, so connections to IPStack are pooled between requests.
+    """
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=CONFIG.ip_stack_max_connections),
+            timeout=httpx.Timeout(
+                CONFIG.ip_stack_read_timeout_seconds,
+                connect=CONFIG.ip_stack_connect_timeout_seconds,
+            ),
+        )
+    return _ASYNC_CLIENT
+
+
+async def close_async_client() -> None:
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is not None:
+        await _ASYNC_CLIENT.aclose()
+        _ASYNC_CLIENT = None
+
+
+class AsyncIpStackHandler(IpStackHandler):
+    async def resolve_geolocation(self, ip_address: str) -> GeolocationSchema:
+        response = await self._async_get(ip_address)
+
+        return self._parse_response(response_json=response.json())
+
+    @_retry_on_upstream_failure
+    async def _async_get(self, ip_address: str) -> httpx.Response:
+        self._check_available(1)
+        try:
+            with Stage("ip_stack"):
+                response = await get_async_client().get(
+                    f"{CONFIG.ip_stack_api_url}/{ip_address}",
+                    params=self._get_request_params(),
+                )
+            IP_STACK_RESPONSES.labels(response.status_code).inc()
+            response.raise_for_status()
+        except Exception as exc:
+            self._record_result(exc)
+            raise
+        except BaseException:
+            # cancelled call has no result, so it can't close or open circuit
+            self._circuit_breaker.release_trial()
+            raise
+        self._record_result(None)
+
+        return response
@@ -1,20 +1,129 @@
-from typing import Annotated
+from contextlib import asynccontextmanager
+from typing import Annotated, AsyncIterator
 
-from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from pydantic import AfterValidator
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from geolocation_catalogue.address_validator import validate_address
+from geolocation_catalogue.address_validator import (
+    IpValidator,
+    is_network,
+    normalize_address,
+    validate_address,
+    validate_address_or_network,
+)
+from geolocation_catalogue.addresses_lookup import lookup_addresses
+from geolocation_catalogue.async_routes import router as async_address_router
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE, CacheStats
 from geolocation_catalogue.config import CONFIG
-from geolocation_catalogue.database import get_db
-from geolocation_catalogue.ip_geolocation_crud import IpGeolocationCRUD
-from geolocation_catalogue.ip_stack_handler import IpStackHandler
-from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
+from geolocation_catalogue.database import (
+    ASYNC_ENGINE,
+    ASYNC_READ_ENGINES,
+    get_db,
+    get_read_db,
+    read_cache_ttl,
+)
+from geolocation_catalogue.domain_alias import DOMAIN_ALIAS_CACHE
+from geolocation_catalogue.export import iter_ip_geolocations_ndjson
+from geolocation_catalogue.ip_geolocation_crud import (
+    GeolocationStatsCRUD,
+    IpGeolocationCRUD,
+    NetworkGeolocationCRUD,
+)
+from geolocation_catalogue.ip_stack_handler import (
+    IpStackHandler,
+    IpStackStats,
+    close_async_client,
+    get_ip_stack_batcher,
+    ip_stack_stats,
+)
+from geolocation_catalogue.metrics import (
+    CacheCollector,
+    RequestDurationMiddleware,
+    Stage,
+)
+from geolocation_catalogue.models import GeolocationSource
+from geolocation_catalogue.negative_cache import (
+    NEGATIVE_CACHE,
+    NegativeLookupKind,
+    purge_negatives,
+    raise_if_negative,
+    set_negatives,
+)
+from geolocation_catalogue.refresh import (
+    schedule_refresh_if_stale,
+    start_refresher,
+    stop_refresher,
+)
+from geolocation_catalogue.responses import (
+    check_if_match,
+    entity_tag,
+    ip_geolocation_response,
+)
+from geolocation_catalogue.schemas import (
+    AddressesLookupSchema,
+    AddressesUpsertResultSchema,
+    AddressesUpsertSchema,
+    AddressLookupResultSchema,
+    GeolocationSchema,
+    GeolocationStatsSchema,
+    IpGeolocationSchema,
+    NearbyIpGeolocationSchema,
+    NegativeCachePurgeSchema,
+)
+from geolocation_catalogue.single_flight import (
+    IP_GEOLOCATION_SINGLE_FLIGHT,
+    SingleFlightStats,
+)
+from geolocation_catalogue.snapshot import get_snapshot
+from geolocation_catalogue.warmup import save_hot_keys, warm_up
 
 DESCRIPTION: str = "API which stores geolocation info of IP addresses and hostnames."
 
-app = FastAPI(description=DESCRIPTION)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    await warm_up()
+    start_refresher()
+    yield
+    stop_refresher()
+    save_hot_keys()
+    await close_async_client()
+    await ASYNC_ENGINE.dispose()
+    for engine in ASYNC_READ_ENGINES:
+        await engine.dispose()
+
+
+app = FastAPI(description=DESCRIPTION, lifespan=lifespan)
+
+# Note! Endpoints of /address are served either by sync handlers below or by their
+# async counterparts from async_routes module, depending on CONFIG.async_mode.
+address_router = APIRouter()
+
+REGISTRY.register(
+    CacheCollector(
+        {
+            "ip_geolocation": IP_GEOLOCATION_CACHE,
+            "domain_alias": DOMAIN_ALIAS_CACHE,
+            "negative": NEGATIVE_CACHE,
+        }
+    )
+)
+
+
+app.add_middleware(RequestDurationMiddleware)
 
 
 @app.get("/")
@@ -34,46 +143,139 @@ def exception_handler(request: Request, exc: Exception) -> None:
     raise Response(status_code=500, content="Unknown error during query execution.")
 
 
-@app.get("/address", response_model=IpGeolocationSchema)
+@address_router.get("/address", response_model=IpGeolocationSchema)
 def get_address_geolocation(
-    address: Annotated[str, AfterValidator(validate_address)],
+    address: str,
+    if_none_match: Annotated[str | None, Header()] = None,
+    read_db: Session = Depends(get_read_db),
     db: Session = Depends(get_db),
-) -> IpGeolocationSchema:
-    ip_geolocation = IpGeolocationCRUD.get_by_ip(db, address)
+) -> Response:
+    # domain may need domain_alias query and DNS, so it's resolved here, on threadpool
+    address = validate_address(db, address)
 
-    if ip_geolocation:
-        return ip_geolocation
+    # zero database fast path - address is looked up in memory-mapped snapshot
+    snapshot = get_snapshot()
+    if snapshot:
+        with Stage("snapshot"):
+            geolocation_schema = snapshot.lookup(address)
+        if geolocation_schema:
+            return ip_geolocation_response(
+                IpGeolocationSchema.model_construct(
+                    ip=address, geolocation=geolocation_schema
+                ),
+                if_none_match,
+            )
 
-    if not ip_geolocation and not CONFIG.ip_stack_api_access_key:
+    # misses are read from a replica, which may lag behind, so they're cached briefly
+    ip_geolocation_schema = IpGeolocationCRUD.get_cached_by_ip(
+        read_db, address, read_cache_ttl()
+    )
+
+    if ip_geolocation_schema:
+        # stale geolocation is served anyway, refresh happens in background
+        schedule_refresh_if_stale(ip_geolocation_schema)
+        return ip_geolocation_response(ip_geolocation_schema, if_none_match)
+
+    # connection isn't held while IPStack is called, miss is stored on primary
+    read_db.close()
+
+    if not CONFIG.ip_stack_api_access_key:
         raise HTTPException(
             status_code=404, detail="Geolocation for address not found."
         )
 
-    ip_stack_handler = IpStackHandler(api_access_key=CONFIG.ip_stack_api_access_key)
-    geolocation_schema = ip_stack_handler.resolve_geolocation(ip_address=address)
+    # addresses which IPStack recently didn't find aren't looked up again
+    raise_if_negative(NegativeLookupKind.ADDRESS, address)
 
-    return IpGeolocationCRUD.create(db, address, geolocation_schema)
+    def resolve_and_store() -> IpGeolocationSchema:
+        if CONFIG.ip_stack_batch_mode:
+            ip_stack_handler = get_ip_stack_batcher(CONFIG.ip_stack_api_access_key)
+        else:
+            ip_stack_handler = IpStackHandler(
+                api_access_key=CONFIG.ip_stack_api_access_key
+            )
+        try:
+            geolocation_schema = ip_stack_handler.resolve_geolocation(
+                ip_address=address
+            )
+        except HTTPException as exc:
+            if exc.status_code == 404:
+                set_negatives(NegativeLookupKind.ADDRESS, {address: exc.detail})
+            raise
+
+        ip_geolocation = IpGeolocationCRUD.upsert(
+            db, address, geolocation_schema, GeolocationSource.IP_STACK
+        )
+        ip_geolocation_schema = IpGeolocationSchema.from_row(ip_geolocation)
+        IP_GEOLOCATION_CACHE.set(address, ip_geolocation_schema)
 
+        return ip_geolocation_schema
 
-@app.put("/address", response_model=IpGeolocationSchema)
+    # concurrent misses of the same address share one IPStack call and one insert
+    return ip_geolocation_response(
+        IP_GEOLOCATION_SINGLE_FLIGHT.do(address, resolve_and_store), if_none_match
+    )
+
+
+@address_router.put("/address", response_model=IpGeolocationSchema)
 def put_address_geolocation(
-    address: Annotated[str, AfterValidator(validate_address)],
+    address: str,
     geolocation: GeolocationSchema,
+    response: Response,
+    if_match: Annotated[str | None, Header()] = None,
     db=Depends(get_db),
 ) -> IpGeolocationSchema:
-    ip_geolocation = IpGeolocationCRUD.get_by_ip(db, address)
+    address = validate_address_or_network(db, address)
+
+    if is_network(address):
+        # networks aren't versioned, so no precondition can be fulfilled
+        if if_match is not None:
+            raise HTTPException(
+                status_code=412, detail="Geolocation for given network not versioned."
+            )
+        network_geolocation = NetworkGeolocationCRUD.upsert(db, address, geolocation)
+        # network may cover any of cached addresses
+        IP_GEOLOCATION_CACHE.clear()
 
-    if ip_geolocation:
-        return IpGeolocationCRUD.update(db, ip_geolocation, geolocation)
+        return IpGeolocationSchema(
+            ip=network_geolocation.network,
+            geolocation=network_geolocation.geolocation,
+        )
+
+    if if_match is None:
+        ip_geolocation = IpGeolocationCRUD.upsert(db, address, geolocation)
     else:
-        return IpGeolocationCRUD.create(db, address, geolocation)
+        # precondition needs the stored version, so the row is read first
+        ip_geolocation = IpGeolocationCRUD.get_by_ip(db, address)
+        check_if_match(if_match, ip_geolocation)
+        ip_geolocation = IpGeolocationCRUD.update(db, ip_geolocation, geolocation)
+
+    # stored row is cached right away, so the next lookup needn't read it again
+    IP_GEOLOCATION_CACHE.set(address, IpGeolocationSchema.from_row(ip_geolocation))
+    purge_negatives([address])
+    response.headers["ETag"] = entity_tag(
+        ip_geolocation.version, ip_geolocation.updated_at
+    )
 
+    return ip_geolocation
 
-@app.delete("/address")
+
+@address_router.delete("/address")
 def delete_address_geolocation(
-    address: Annotated[str, AfterValidator(validate_address)],
+    address: str,
     db: Session = Depends(get_db),
 ) -> Response:
+    address = validate_address_or_network(db, address)
+
+    if is_network(address):
+        if not NetworkGeolocationCRUD.delete(db, address):
+            raise HTTPException(
+                status_code=404, detail="Geolocation for given network not found."
+            )
+        IP_GEOLOCATION_CACHE.clear()
+
+        return Response(status_code=204)
+
     ip_geolocation = IpGeolocationCRUD.get_by_ip(db, address)
 
     if not ip_geolocation:
@@ -82,5 +284,217 @@ def delete_address_geolocation(
         )
 
     IpGeolocationCRUD.delete(db, ip_geolocation)
+    IP_GEOLOCATION_CACHE.invalidate(address)
 
     return Response(status_code=204)
+
+
+@app.get("/cache/stats")
+def get_cache_stats() -> CacheStats:
+    return IP_GEOLOCATION_CACHE.stats()
+
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/single-flight/stats")
+def get_single_flight_stats() -> SingleFlightStats:
+    return IP_GEOLOCATION_SINGLE_FLIGHT.stats()
+
+
+@app.get("/ip-stack/stats")
+def get_ip_stack_stats() -> IpStackStats:
+    return ip_stack_stats()
+
+
+@app.delete("/negative-cache")
+def purge_negative_cache(address: str | None = None) -> NegativeCachePurgeSchema:
+    """
+    Forget failed lookups of given address or domain, or of all of them.
+    """
+    keys = None if address is None else [normalize_address(address)[1]]
+    return NegativeCachePurgeSchema(purged=purge_negatives(keys))
+
+
+@app.get("/stats")
+def get_stats(db: Session = Depends(get_read_db)) -> GeolocationStatsSchema:
+    """
+    Number of catalogued addresses in total, per continent and per country.
+    """
+    stats = GeolocationStatsSchema(addresses=0, continents={}, countries={})
+    for country_stats in GeolocationStatsCRUD.get_all(db):
+        stats.addresses += country_stats.addresses
+        stats.continents[country_stats.continent_code] = (
+            stats.continents.get(country_stats.continent_code, 0)
+            + country_stats.addresses
+        )
+        stats.countries[country_stats.country_code] = country_stats.addresses
+
+    return stats
+
+
+@app.post("/addresses/lookup", response_model=list[AddressLookupResultSchema])
+def lookup_addresses_geolocation(
+    lookup: AddressesLookupSchema,
+    db: Session = Depends(get_db),
+) -> list[AddressLookupResultSchema]:
+    if len(lookup.addresses) > CONFIG.addresses_lookup_max_size:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many addresses! At most {CONFIG.addresses_lookup_max_size} can be looked up at once.",
+        )
+
+    return lookup_addresses(db, lookup.addresses)
+
+
+@app.put("/addresses/batch")
+def put_addresses_geolocation(
+    upsert: AddressesUpsertSchema,
+    db: Session = Depends(get_db),
+) -> AddressesUpsertResultSchema:
+    """
+    Store geolocations of many IP addresses at once. When an address is given
+    more than once, its last geolocation is stored.
+    """
+    if len(upsert.addresses) > CONFIG.addresses_upsert_max_size:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many addresses! At most {CONFIG.addresses_upsert_max_size} can be stored at once.",
+        )
+
+    geolocation_schemas = {}
+    for ip_geolocation in upsert.addresses:
+        ip = IpValidator.normalize(ip_geolocation.ip)
+        if ip is None:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Address {ip_geolocation.ip!r} given in wrong format!",
+            )
+        geolocation_schemas[ip] = ip_geolocation.geolocation
+
+    upserted = IpGeolocationCRUD.upsert_many(db, geolocation_schemas)
+    for ip in geolocation_schemas:
+        IP_GEOLOCATION_CACHE.invalidate(ip)
+    purge_negatives(list(geolocation_schemas))
+
+    return AddressesUpsertResultSchema(upserted=upserted)
+
+
+def validate_ip(address: str | None) -> str | None:
+    if address is None:
+        return None
+
+    ip = IpValidator.normalize(address)
+    if ip is None:
+        raise HTTPException(status_code=422, detail="Address given in wrong format!")
+    return ip
+
+
+@app.get("/addresses", response_model=list[IpGeolocationSchema])
+def get_addresses(
+    after: Annotated[str | None, AfterValidator(validate_ip)] = None,
+    continent_code: str | None = None,
+    country_code: str | None = None,
+    region_code: str | None = None,
+    city: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    db: Session = Depends(get_read_db),
+) -> list[IpGeolocationSchema]:
+    """
+    Addresses matching all given filters, ordered by ip. Next page is requested
+    with after set to ip of the last address of previous one.
+    """
+    return IpGeolocationCRUD.get_page(
+        db,
+        limit=limit,
+        after_ip=after,
+        continent_code=continent_code,
+        country_code=country_code,
+        region_code=region_code,
+        city=city,
+    )
+
+
+@app.get("/addresses/export")
+def export_addresses_geolocation(
+    after: Annotated[str | None, AfterValidator(validate_ip)] = None,
+    continent_code: str | None = None,
+    country_code: str | None = None,
+) -> StreamingResponse:
+    return StreamingResponse(
+        iter_ip_geolocations_ndjson(
+            after=after, continent_code=continent_code, country_code=country_code
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.get("/addresses/near", response_model=list[NearbyIpGeolocationSchema])
+def get_addresses_near(
+    latitude: Annotated[float, Query(ge=-90, le=90)],
+    longitude: Annotated[float, Query(ge=-180, le=180)],
+    radius_km: Annotated[float, Query(gt=0, le=20000)],
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    after_distance_km: Annotated[float | None, Query(ge=0)] = None,
+    after: Annotated[str | None, AfterValidator(validate_ip)] = None,
+    db: Session = Depends(get_read_db),
+) -> list[NearbyIpGeolocationSchema]:
+    """
+    Addresses within radius_km of given point, nearest first. Next page starts
+    after distance_km and ip of the last address of previous one.
+    """
+    if (after_distance_km is None) != (after is None):
+        raise HTTPException(
+            status_code=422,
+            detail="Both after_distance_km and after must be given to continue listing.",
+        )
+
+    return [
+        NearbyIpGeolocationSchema(
+            ip=ip_geolocation.ip,
+            geolocation=ip_geolocation.geolocation,
+            distance_km=distance_km,
+        )
+        for ip_geolocation, distance_km in IpGeolocationCRUD.get_near(
+            db,
+            latitude=latitude,
+            longitude=longitude,
+            radius_km=radius_km,
+            limit=limit,
+            after_distance_km=after_distance_km,
+            after_ip=after,
+        )
+    ]
+
+
+@app.get("/addresses/within", response_model=list[IpGeolocationSchema])
+def get_addresses_within(
+    south: Annotated[float, Query(ge=-90, le=90)],
+    west: Annotated[float, Query(ge=-180, le=180)],
+    north: Annotated[float, Query(ge=-90, le=90)],
+    east: Annotated[float, Query(ge=-180, le=180)],
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    after: Annotated[str | None, AfterValidator(validate_ip)] = None,
+    db: Session = Depends(get_read_db),
+) -> list[IpGeolocationSchema]:
+    """
+    Addresses within bounding box, ordered by ip. Box with west > east crosses
+    the antimeridian.
+    """
+    if south > north:
+        raise HTTPException(status_code=422, detail="South can't be above north!")
+
+    return IpGeolocationCRUD.get_within(
+        db,
+        south=south,
+        west=west,
+        north=north,
+        east=east,
+        limit=limit,
+        after_ip=after,
+    )
+
+
+app.include_router(async_address_router if CONFIG.async_mode else address_router)
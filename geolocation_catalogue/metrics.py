@@ -0,0 +1,190 @@
+import time
+from typing import Iterable
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.metrics_core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    Metric,
+)
+from prometheus_client.registry import Collector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from geolocation_catalogue.cache import TTLCache
+
+# Note! Retries of functions decorated with stamina.retry are counted by stamina
+# itself in stamina_retries_total, as soon as prometheus_client is installed.
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+REQUEST_DURATION = Histogram(
+    "geolocation_request_duration_seconds",
+    "Time of handling HTTP request.",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+
+STAGE_DURATION = Histogram(
+    "geolocation_stage_duration_seconds",
+    "Time spent in stages of address geolocation lookup.",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "geolocation_db_pool_checkout_wait_seconds",
+    "Time of waiting for database connection from the pool.",
+    ["pool"],
+    buckets=LATENCY_BUCKETS,
+)
+
+IP_STACK_RESPONSES = Counter(
+    "geolocation_ip_stack_responses",
+    "Responses of IPStack API by HTTP status code.",
+    ["status_code"],
+)
+
+IP_STACK_REJECTED = Counter(
+    "geolocation_ip_stack_rejected",
+    "IPStack calls not made because circuit breaker was open or quota exhausted.",
+    ["reason"],
+)
+
+IP_STACK_CIRCUIT_OPEN = Gauge(
+    "geolocation_ip_stack_circuit_open",
+    "Whether circuit breaker of IPStack calls is open (or half open).",
+)
+
+IP_STACK_RATE_LIMITER_TOKENS = Gauge(
+    "geolocation_ip_stack_rate_limiter_tokens",
+    "Number of addresses which can be resolved by IPStack right away.",
+)
+
+STARTUP_PHASE_DURATION = Gauge(
+    "geolocation_startup_phase_duration_seconds",
+    "Duration of phases of the last application startup.",
+    ["phase"],
+)
+
+REFRESHED_ADDRESSES = Counter(
+    "geolocation_refreshed_addresses",
+    "Addresses re-resolved by background refresher by result.",
+    ["result"],
+)
+
+
+class Stage:
+    """
+    Context manager which records its duration as given stage. Label lookup is
+    done once per stage, so timing costs two perf_counter calls.
+    """
+
+    __slots__ = ("_histogram", "_start")
+
+    _histograms: dict[str, Histogram] = {}
+
+    def __init__(self, stage: str) -> None:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms[stage] = STAGE_DURATION.labels(stage)
+        self._histogram = histogram
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class RequestDurationMiddleware:
+    """
+    Records time until response headers are sent as REQUEST_DURATION. Plain
+    ASGI middleware - unlike BaseHTTPMiddleware, it doesn't run handlers in a
+    separate task nor pass the response body through a memory stream.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        observed = False
+
+        def observe() -> None:
+            nonlocal observed
+            observed = True
+            # route template instead of path, so number of label values stays bounded
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                scope["method"], route.path if route else "unmatched"
+            ).observe(time.perf_counter() - start)
+
+        async def send_observed(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                observe()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            # handler failed before sending any response
+            if not observed:
+                observe()
+
+
+class CacheCollector(Collector):
+    """
+    Exposes counters of in-process caches, read only when metrics are scraped.
+    """
+
+    def __init__(self, caches: dict[str, TTLCache]) -> None:
+        self._caches = caches
+
+    def collect(self) -> Iterable[Metric]:
+        hits = CounterMetricFamily(
+            "geolocation_cache_hits",
+            "Cache lookups which found entry.",
+            labels=["cache"],
+        )
+        misses = CounterMetricFamily(
+            "geolocation_cache_misses",
+            "Cache lookups which didn't find entry.",
+            labels=["cache"],
+        )
+        hit_ratio = GaugeMetricFamily(
+            "geolocation_cache_hit_ratio",
+            "Ratio of cache hits to all lookups since start.",
+            labels=["cache"],
+        )
+        size = GaugeMetricFamily(
+            "geolocation_cache_size", "Number of cache entries.", labels=["cache"]
+        )
+
+        for name, cache in self._caches.items():
+            stats = cache.stats()
+            lookups = stats.hits + stats.misses
+            hits.add_metric([name], stats.hits)
+            misses.add_metric([name], stats.misses)
+            hit_ratio.add_metric([name], stats.hits / lookups if lookups else 0.0)
+            size.add_metric([name], stats.size)
+
+        yield from (hits, misses, hit_ratio, size)
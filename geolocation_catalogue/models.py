@@ -1,15 +1,240 @@
+from datetime import datetime
+from enum import Enum
 from typing import Any
 
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import (
+    DDL,
+    Computed,
+    DateTime,
+    Index,
+    String,
+    TypeDecorator,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, CIDR, INET, JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
+class Inet(TypeDecorator):
+    """
+    PostgreSQL INET column with values represented as strings. Note! psycopg2 returns
+    them as strings already, but asyncpg returns ipaddress objects.
+    """
+
+    impl = INET
+    cache_ok = True
+
+    def process_result_value(self, value: Any, dialect: Any) -> str | None:
+        return None if value is None else str(value)
+
+
+class Cidr(Inet):
+    impl = CIDR
+    cache_ok = True
+
+
 class Base(DeclarativeBase):
-    type_annotation_map = {dict[str, Any]: JSONB}
+    type_annotation_map = {
+        dict[str, Any]: JSONB,
+        list[str]: ARRAY(String),
+        datetime: DateTime(timezone=True),
+    }
+
+
+class GeolocationSource(str, Enum):
+    MANUAL = "manual"
+    IMPORT = "import"
+    IP_STACK = "ip_stack"
+
+
+def _geolocation_field(field: str) -> Computed:
+    return Computed(f"geolocation ->> '{field}'", persisted=True)
 
 
 class IpGeolocation(Base):
     __tablename__ = "ip_geolocation"
+    # each filter is paired with ip, so filtered listing ordered by ip is served
+    # straight from the index
+    __table_args__ = (
+        Index("ix_ip_geolocation_continent_code_ip", "continent_code", "ip"),
+        Index("ix_ip_geolocation_country_code_ip", "country_code", "ip"),
+        Index("ix_ip_geolocation_region_code_ip", "region_code", "ip"),
+        Index("ix_ip_geolocation_city_ip", "city", "ip"),
+        # only geolocations fetched from IPStack are refreshed, oldest first
+        Index(
+            "ix_ip_geolocation_ip_stack_fetched_at",
+            "fetched_at",
+            postgresql_where=text(f"source = '{GeolocationSource.IP_STACK.value}'"),
+        ),
+    )
+
+    ip: Mapped[str] = mapped_column(Inet, primary_key=True)
+    geolocation: Mapped[dict[str, Any]] = mapped_column(nullable=False)
+
+    # fields used in filters are extracted from geolocation, so they can be indexed
+    continent_code: Mapped[str] = mapped_column(_geolocation_field("continent_code"))
+    country_code: Mapped[str] = mapped_column(_geolocation_field("country_code"))
+    region_code: Mapped[str] = mapped_column(_geolocation_field("region_code"))
+    city: Mapped[str] = mapped_column(_geolocation_field("city"))
+
+    # coordinates are extracted from geolocation, so they can be indexed
+    latitude: Mapped[float] = mapped_column(
+        Computed("(geolocation ->> 'latitude')::double precision", persisted=True)
+    )
+    longitude: Mapped[float] = mapped_column(
+        Computed("(geolocation ->> 'longitude')::double precision", persisted=True)
+    )
+
+    # version is bumped by every ORM update, which fails with StaleDataError if
+    # row was changed concurrently
+    version: Mapped[int] = mapped_column(nullable=False, server_default=text("1"))
+    updated_at: Mapped[datetime] = mapped_column(
+        nullable=False, server_default=func.now(), onupdate=func.now()
+    )
+
+    # when and from where geolocation was obtained, rows from IPStack are refreshed
+    # once they're older than CONFIG.geolocation_ttl_seconds
+    fetched_at: Mapped[datetime] = mapped_column(
+        nullable=False, server_default=func.now()
+    )
+    source: Mapped[str] = mapped_column(
+        nullable=False, server_default=GeolocationSource.MANUAL.value
+    )
+
+    __mapper_args__ = {"version_id_col": version, "eager_defaults": True}
+
 
-    ip: Mapped[str] = mapped_column(primary_key=True)
+Index(
+    "ix_ip_geolocation_location_gist",
+    func.point(IpGeolocation.longitude, IpGeolocation.latitude),
+    postgresql_using="gist",
+)
+
+
+class NetworkGeolocation(Base):
+    __tablename__ = "network_geolocation"
+    __table_args__ = (
+        Index(
+            "ix_network_geolocation_network_gist",
+            "network",
+            postgresql_using="gist",
+            postgresql_ops={"network": "inet_ops"},
+        ),
+    )
+
+    network: Mapped[str] = mapped_column(Cidr, primary_key=True)
     geolocation: Mapped[dict[str, Any]] = mapped_column(nullable=False)
+
+
+class DomainAlias(Base):
+    __tablename__ = "domain_alias"
+
+    domain: Mapped[str] = mapped_column(primary_key=True)
+    ips: Mapped[list[str]] = mapped_column(nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(nullable=False)
+
+
+class NegativeLookup(Base):
+    """
+    Addresses and domains which couldn't be resolved, shared by all processes.
+    """
+
+    __tablename__ = "negative_lookup"
+
+    kind: Mapped[str] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(primary_key=True)
+    detail: Mapped[str] = mapped_column(nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(nullable=False)
+
+
+class GeolocationStats(Base):
+    """
+    Number of catalogued addresses per country, maintained by triggers on
+    ip_geolocation.
+    """
+
+    __tablename__ = "geolocation_stats"
+
+    continent_code: Mapped[str] = mapped_column(primary_key=True)
+    country_code: Mapped[str] = mapped_column(primary_key=True)
+    addresses: Mapped[int] = mapped_column(nullable=False)
+
+
+# Note! Triggers are statement-level with transition tables, so bulk statements
+# (executemany, COPY merge) update each country once, not once per row.
+GEOLOCATION_STATS_FUNCTION_DDL: str = """
+CREATE OR REPLACE FUNCTION apply_geolocation_stats() RETURNS trigger AS $$
+DECLARE
+    changed_countries integer;
+BEGIN
+    -- deltas of all rows are applied in a single statement, in order of stats
+    -- key, so concurrent statements lock stats rows in the same order
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO geolocation_stats (continent_code, country_code, addresses)
+        SELECT continent_code, country_code, count(*)
+        FROM new_rows
+        GROUP BY continent_code, country_code
+        ORDER BY continent_code, country_code
+        ON CONFLICT (continent_code, country_code)
+        DO UPDATE SET addresses = geolocation_stats.addresses + EXCLUDED.addresses;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO geolocation_stats (continent_code, country_code, addresses)
+        SELECT continent_code, country_code, -count(*)
+        FROM old_rows
+        GROUP BY continent_code, country_code
+        ORDER BY continent_code, country_code
+        ON CONFLICT (continent_code, country_code)
+        DO UPDATE SET addresses = geolocation_stats.addresses + EXCLUDED.addresses;
+    ELSE
+        -- rows which kept their continent and country cancel out, so updates
+        -- of other columns don't touch stats at all
+        INSERT INTO geolocation_stats (continent_code, country_code, addresses)
+        SELECT continent_code, country_code, sum(delta)
+        FROM (
+            SELECT continent_code, country_code, -1 AS delta FROM old_rows
+            UNION ALL
+            SELECT continent_code, country_code, 1 AS delta FROM new_rows
+        ) AS deltas
+        GROUP BY continent_code, country_code
+        HAVING sum(delta) <> 0
+        ORDER BY continent_code, country_code
+        ON CONFLICT (continent_code, country_code)
+        DO UPDATE SET addresses = geolocation_stats.addresses + EXCLUDED.addresses;
+    END IF;
+    GET DIAGNOSTICS changed_countries = ROW_COUNT;
+    IF changed_countries > 0 THEN
+        DELETE FROM geolocation_stats WHERE addresses = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+GEOLOCATION_STATS_TRIGGERS_DDL: tuple[str, ...] = (
+    """
+    CREATE TRIGGER ip_geolocation_stats_insert
+    AFTER INSERT ON ip_geolocation
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_geolocation_stats()
+    """,
+    """
+    CREATE TRIGGER ip_geolocation_stats_update
+    AFTER UPDATE ON ip_geolocation
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_geolocation_stats()
+    """,
+    """
+    CREATE TRIGGER ip_geolocation_stats_delete
+    AFTER DELETE ON ip_geolocation
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_geolocation_stats()
+    """,
+)
+
+event.listen(
+    IpGeolocation.__table__, "after_create", DDL(GEOLOCATION_STATS_FUNCTION_DDL)
+)
+for trigger_ddl in GEOLOCATION_STATS_TRIGGERS_DDL:
+    event.listen(IpGeolocation.__table__, "after_create", DDL(trigger_ddl))
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from geolocation_catalogue.cache import TTLCache
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.database import SESSION_MAKER
+from geolocation_catalogue.models import NegativeLookup
+
+
+class NegativeLookupKind(str, Enum):
+    # address which IPStack reported as not found
+    ADDRESS = "address"
+    # domain which couldn't be resolved to IP
+    DOMAIN = "domain"
+
+
+NEGATIVE_CACHE: TTLCache[tuple[str, str], str] = TTLCache(
+    max_size=CONFIG.negative_cache_max_size, ttl=CONFIG.negative_cache_ttl_seconds
+)
+
+
+def get_cached_negative(kind: NegativeLookupKind, key: str) -> str | None:
+    """
+    Detail of failed lookup of the key, if it's in the in-process cache.
+    """
+    return NEGATIVE_CACHE.get((kind.value, key))
+
+
+def get_negatives(kind: NegativeLookupKind, keys: list[str]) -> dict[str, str]:
+    """
+    Details of recently failed lookups of given keys. Keys are looked up in the
+    in-process cache and, with negative_cache_persist, the rest of them in
+    negative_lookup table with a single query.
+    """
+    details = {}
+    for key in keys:
+        detail = get_cached_negative(kind, key)
+        if detail is not None:
+            details[key] = detail
+
+    uncached_keys = [key for key in keys if key not in details]
+    if not uncached_keys or not CONFIG.negative_cache_persist:
+        return details
+
+    now = datetime.now(timezone.utc)
+    with SESSION_MAKER() as db:
+        negative_lookups = db.execute(
+            select(NegativeLookup).where(
+                NegativeLookup.kind == kind.value,
+                NegativeLookup.key.in_(uncached_keys),
+                NegativeLookup.expires_at > now,
+            )
+        ).scalars()
+        for negative_lookup in negative_lookups:
+            details[negative_lookup.key] = negative_lookup.detail
+            NEGATIVE_CACHE.set(
+                (kind.value, negative_lookup.key),
+                negative_lookup.detail,
+                ttl=(negative_lookup.expires_at - now).total_seconds(),
+            )
+
+    return details
+
+
+def raise_if_negative(kind: NegativeLookupKind, key: str) -> None:
+    detail = get_negatives(kind, [key]).get(key)
+    if detail is not None:
+        raise HTTPException(status_code=404, detail=detail)
+
+
+async def async_raise_if_negative(kind: NegativeLookupKind, key: str) -> None:
+    detail = get_cached_negative(kind, key)
+    if detail is not None:
+        raise HTTPException(status_code=404, detail=detail)
+
+    if CONFIG.negative_cache_persist:
+        await run_in_threadpool(raise_if_negative, kind, key)
+
+
+def set_negatives(kind: NegativeLookupKind, details: dict[str, str]) -> None:
+    """
+    Remember failed lookups for negative_cache_ttl_seconds, which should be
+    shorter than TTL of positive results.
+    """
+    for key, detail in details.items():
+        NEGATIVE_CACHE.set((kind.value, key), detail)
+
+    if not details or not CONFIG.negative_cache_persist:
+        return
+
+    expires_at = datetime.now(timezone.utc) + timedelta(
+        seconds=CONFIG.negative_cache_ttl_seconds
+    )
+    statement = insert(NegativeLookup).values(
+        [
+            {"kind": kind.value, "key": key, "detail": detail, "expires_at": expires_at}
+            for key, detail in details.items()
+        ]
+    )
+    with SESSION_MAKER() as db:
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[NegativeLookup.kind, NegativeLookup.key],
+                set_={
+                    "detail": statement.excluded.detail,
+                    "expires_at": statement.excluded.expires_at,
+                },
+            )
+        )
+        db.commit()
+
+
+async def async_set_negatives(
+    kind: NegativeLookupKind, details: dict[str, str]
+) -> None:
+    if CONFIG.negative_cache_persist:
+        await run_in_threadpool(set_negatives, kind, details)
+    else:
+        set_negatives(kind, details)
+
+
+def purge_negatives(keys: list[str] | None = None) -> int:
+    """
+    Forget failed lookups of given keys, or all of them. Returns number of
+    forgotten entries - of persisted ones when they're persisted, as those are
+    shared by all processes.
+    """
+    if keys is None:
+        purged = NEGATIVE_CACHE.stats().size
+        NEGATIVE_CACHE.clear()
+    else:
+        purged = sum(
+            NEGATIVE_CACHE.invalidate((kind.value, key))
+            for kind in NegativeLookupKind
+            for key in keys
+        )
+
+    if not CONFIG.negative_cache_persist or keys == []:
+        return purged
+
+    statement = delete(NegativeLookup)
+    if keys is not None:
+        statement = statement.where(NegativeLookup.key.in_(keys))
+    with SESSION_MAKER() as db:
+        purged = db.execute(statement).rowcount
+        db.commit()
+
+    return purged
+
+
+async def async_purge_negatives(keys: list[str] | None = None) -> int:
+    if CONFIG.negative_cache_persist:
+        return await run_in_threadpool(purge_negatives, keys)
+    return purge_negatives(keys)
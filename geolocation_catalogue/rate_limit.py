@@ -0,0 +1,60 @@
+import math
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Allows rate tokens per second on average, in bursts of at most capacity
+    tokens. Bucket starts full.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Take tokens if they're available, without waiting.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def release(self, tokens: float = 1.0) -> None:
+        """
+        Give back tokens which were acquired, but not used.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+    def time_until(self, tokens: float = 1.0) -> float:
+        """
+        Seconds until given number of tokens will be available.
+        """
+        with self._lock:
+            self._refill()
+            missing = tokens - self._tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate if self.rate > 0 else math.inf
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._refilled_at) * self.rate
+        )
+        self._refilled_at = now
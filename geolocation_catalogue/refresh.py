@@ -0,0 +1,270 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, sessionmaker
+
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.database import SESSION_MAKER
+from geolocation_catalogue.ip_geolocation_crud import IpGeolocationCRUD
+from geolocation_catalogue.ip_stack_handler import (
+    IpStackHandler,
+    IpStackUnavailableError,
+)
+from geolocation_catalogue.metrics import REFRESHED_ADDRESSES
+from geolocation_catalogue.models import GeolocationSource
+from geolocation_catalogue.rate_limit import TokenBucket
+from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
+
+logger = logging.getLogger(__name__)
+
+STOP_TIMEOUT_SECONDS: float = 5.0
+
+# claimed addresses which weren't refreshed in this time (e.g. because IPStack
+# was unavailable or the process died) are claimed again
+CLAIM_TIMEOUT_SECONDS: float = 300.0
+
+
+class GeolocationRefresher:
+    """
+    Re-resolves geolocations fetched from IPStack once they're older than ttl.
+    Stale addresses served to clients are scheduled by request handlers and
+    refreshed first, with sweep also the oldest stale addresses in the catalogue
+    are refreshed when none are scheduled. Addresses are claimed in database
+    before refresh, so concurrent refreshers never refresh the same ones.
+    Refresh runs within budget of rate addresses per second.
+    """
+
+    def __init__(
+        self,
+        ip_stack_handler: IpStackHandler,
+        ttl: float,
+        rate: float,
+        batch_size: int,
+        interval: float,
+        max_scheduled: int,
+        bulk: bool = False,
+        sweep: bool = False,
+        session_maker: sessionmaker[Session] = SESSION_MAKER,
+    ) -> None:
+        self._ip_stack_handler = ip_stack_handler
+        self._ttl = timedelta(seconds=ttl)
+        self._bucket = TokenBucket(rate=rate, capacity=batch_size)
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_scheduled = max_scheduled
+        self._bulk = bulk
+        self._sweep = sweep
+        self._session_maker = session_maker
+
+        # insertion ordered set of addresses, so they're refreshed in order
+        self._scheduled: dict[str, None] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def scheduled(self) -> int:
+        return len(self._scheduled)
+
+    def is_stale(self, ip_geolocation_schema: IpGeolocationSchema) -> bool:
+        return (
+            ip_geolocation_schema.source == GeolocationSource.IP_STACK.value
+            and ip_geolocation_schema.fetched_at is not None
+            and ip_geolocation_schema.fetched_at
+            < datetime.now(timezone.utc) - self._ttl
+        )
+
+    def schedule_if_stale(self, ip_geolocation_schema: IpGeolocationSchema) -> None:
+        """
+        Schedule refresh of served address, if it's stale. Doesn't block - when
+        too many addresses are scheduled already, address is left for refresh of
+        the oldest ones.
+        """
+        if not self.is_stale(ip_geolocation_schema):
+            return
+
+        ip = ip_geolocation_schema.ip
+        with self._lock:
+            if (
+                ip in self._scheduled
+                or ip in self._refreshing
+                or len(self._scheduled) >= self._max_scheduled
+            ):
+                return
+            self._scheduled[ip] = None
+        self._wakeup.set()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=STOP_TIMEOUT_SECONDS)
+
+    def refresh_next(self) -> bool:
+        """
+        Refresh next batch of scheduled or oldest stale addresses. Returns False
+        when there was nothing to refresh.
+        """
+        ips = self._next_batch()
+        if not ips:
+            return False
+
+        try:
+            if not self._take_budget(len(ips)):
+                return False
+            self.refresh(ips)
+        except Exception:
+            REFRESHED_ADDRESSES.labels("failed").inc(len(ips))
+            raise
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(ips)
+
+        return True
+
+    def refresh(self, ips: list[str]) -> None:
+        """
+        Re-resolve given addresses. Addresses which IPStack fails to resolve keep
+        their last known geolocation, and are tried again after another ttl.
+        """
+        geolocation_schemas: dict[str, GeolocationSchema | None] = {}
+        for ip, geolocation_schema in self._resolve(ips).items():
+            if isinstance(geolocation_schema, HTTPException):
+                geolocation_schemas[ip] = None
+                REFRESHED_ADDRESSES.labels(
+                    "not_found" if geolocation_schema.status_code == 404 else "failed"
+                ).inc()
+            else:
+                geolocation_schemas[ip] = geolocation_schema
+                REFRESHED_ADDRESSES.labels("refreshed").inc()
+
+        with self._session_maker() as db:
+            IpGeolocationCRUD.refresh_many(db, geolocation_schemas)
+
+        for ip in geolocation_schemas:
+            IP_GEOLOCATION_CACHE.invalidate(ip)
+
+    def _resolve(self, ips: list[str]) -> dict[str, GeolocationSchema | HTTPException]:
+        if self._bulk:
+            return self._ip_stack_handler.resolve_geolocations(ips)
+
+        geolocation_schemas: dict[str, GeolocationSchema | HTTPException] = {}
+        for ip in ips:
+            try:
+                geolocation_schemas[ip] = self._ip_stack_handler.resolve_geolocation(
+                    ip_address=ip
+                )
+            except IpStackUnavailableError:
+                # the whole batch is tried again later
+                raise
+            except HTTPException as exc:
+                geolocation_schemas[ip] = exc
+        return geolocation_schemas
+
+    def _next_batch(self) -> list[str]:
+        with self._lock:
+            scheduled = list(islice(self._scheduled, self._batch_size))
+            for ip in scheduled:
+                del self._scheduled[ip]
+            self._refreshing.update(scheduled)
+
+        try:
+            ips = []
+            if scheduled:
+                # addresses may have been claimed by other refresher meanwhile
+                ips = self._claim(scheduled)
+            elif self._sweep:
+                ips = self._claim(None)
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(scheduled)
+                self._refreshing.update(ips)
+
+        return ips
+
+    def _claim(self, ips: list[str] | None) -> list[str]:
+        now = datetime.now(timezone.utc)
+        fetched_before = now - self._ttl
+        claimed_fetched_at = min(
+            now, fetched_before + timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+        )
+        with self._session_maker() as db:
+            return IpGeolocationCRUD.claim_stale_ips(
+                db, fetched_before, claimed_fetched_at, self._batch_size, ips
+            )
+
+    def _take_budget(self, tokens: int) -> bool:
+        while not self._bucket.try_acquire(tokens):
+            if self._stopped.wait(self._bucket.time_until(tokens)):
+                return False
+        return True
+
+    def run(self) -> None:
+        """
+        Refresh until stopped, waiting interval when there's nothing to refresh.
+        """
+        while not self._stopped.is_set():
+            try:
+                if self.refresh_next():
+                    continue
+            except Exception:
+                logger.exception("Refresh of geolocations failed.")
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+
+
+def create_refresher(sweep: bool) -> GeolocationRefresher | None:
+    """
+    Refresher configured with CONFIG, if geolocations expire and there is IPStack
+    key to refresh them with.
+    """
+    if not CONFIG.geolocation_ttl_seconds or not CONFIG.ip_stack_api_access_key:
+        return None
+
+    return GeolocationRefresher(
+        ip_stack_handler=IpStackHandler(api_access_key=CONFIG.ip_stack_api_access_key),
+        ttl=CONFIG.geolocation_ttl_seconds,
+        rate=CONFIG.refresh_rate_per_second,
+        batch_size=CONFIG.refresh_batch_size,
+        interval=CONFIG.refresh_interval_seconds,
+        max_scheduled=CONFIG.refresh_queue_max_size,
+        bulk=CONFIG.ip_stack_batch_mode,
+        sweep=sweep,
+    )
+
+
+_REFRESHER: GeolocationRefresher | None = None
+
+
+def start_refresher() -> None:
+    """
+    Start refresher of stale addresses served by this worker. The oldest stale
+    addresses are swept by a single refresh command per deployment instead, so
+    IPStack isn't called by every worker.
+    """
+    global _REFRESHER
+    _REFRESHER = create_refresher(sweep=False)
+    if _REFRESHER is not None:
+        _REFRESHER.start()
+
+
+def stop_refresher() -> None:
+    global _REFRESHER
+    if _REFRESHER is not None:
+        _REFRESHER.stop()
+        _REFRESHER = None
+
+
+def schedule_refresh_if_stale(ip_geolocation_schema: IpGeolocationSchema) -> None:
+    if _REFRESHER is not None:
+        _REFRESHER.schedule_if_stale(ip_geolocation_schema)
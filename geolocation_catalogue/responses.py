@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+from fastapi import HTTPException, Response
+
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.metrics import Stage
+from geolocation_catalogue.models import IpGeolocation
+from geolocation_catalogue.schemas import IpGeolocationSchema
+
+
+def entity_tag(version: int, updated_at: datetime) -> str:
+    """
+    ETag of stored address. Update time is included, so the tag changes also
+    when address was deleted and stored again with the same version.
+    """
+    return f'"{version}-{int(updated_at.timestamp() * 1_000_000):x}"'
+
+
+def etag_matches(header: str, etag: str, weak: bool) -> bool:
+    """
+    Whether If-Match (strong comparison) or If-None-Match (weak comparison)
+    header matches etag.
+    """
+    if header.strip() == "*":
+        return True
+
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def check_if_match(if_match: str | None, ip_geolocation: IpGeolocation | None) -> None:
+    """
+    Raise 412 when If-Match header was sent and stored address doesn't match it,
+    so client doesn't overwrite changes it hasn't seen.
+    """
+    if if_match is None:
+        return
+
+    if ip_geolocation is None or not etag_matches(
+        if_match,
+        entity_tag(ip_geolocation.version, ip_geolocation.updated_at),
+        weak=False,
+    ):
+        raise HTTPException(
+            status_code=412, detail="Geolocation for given address was changed."
+        )
+
+
+def ip_geolocation_response(
+    ip_geolocation_schema: IpGeolocationSchema, if_none_match: str | None = None
+) -> Response:
+    """
+    Serialize schema straight to JSON response, skipping validation against
+    response_model, which would produce the same document. Serialization is
+    timed here - FastAPI would otherwise do it after handler returns. Stored
+    addresses get ETag and Last-Modified, and if client already has current
+    version, 304 is returned without serializing anything.
+    """
+    headers = {"Cache-Control": f"public, max-age={CONFIG.http_cache_max_age_seconds}"}
+    if ip_geolocation_schema.version is not None:
+        etag = entity_tag(
+            ip_geolocation_schema.version, ip_geolocation_schema.updated_at
+        )
+        headers["ETag"] = etag
+        headers["Last-Modified"] = format_datetime(
+            ip_geolocation_schema.updated_at.astimezone(timezone.utc), usegmt=True
+        )
+        if if_none_match and etag_matches(if_none_match, etag, weak=True):
+            return Response(status_code=304, headers=headers)
+
+    with Stage("serialization"):
+        content = ip_geolocation_schema.to_json()
+    return Response(content=content, media_type="application/json", headers=headers)
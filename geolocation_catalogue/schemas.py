@@ -1,6 +1,7 @@
-from typing import Annotated, Literal
+from datetime import datetime
+from typing import Annotated, Any, Literal
 
-from pydantic import BaseModel, ConfigDict, StringConstraints
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, StringConstraints
 
 
 class GeolocationSchema(BaseModel):
@@ -23,9 +24,109 @@ class GeolocationSchema(BaseModel):
     latitude: float
     longitude: float
 
+    @classmethod
+    def from_stored(cls, geolocation: dict) -> "GeolocationSchema":
+        """
+        Schema of geolocation read from database, which was validated before it
+        was stored. Coordinates are the only values which may be decoded with
+        another type (whole numbers as int), so only they are converted.
+        """
+        return cls.model_construct(
+            **{
+                **geolocation,
+                "latitude": float(geolocation["latitude"]),
+                "longitude": float(geolocation["longitude"]),
+            }
+        )
+
 
 class IpGeolocationSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     ip: str
     geolocation: GeolocationSchema
+
+    _json: bytes | None = PrivateAttr(default=None)
+    _version: int | None = PrivateAttr(default=None)
+    _updated_at: datetime | None = PrivateAttr(default=None)
+    _fetched_at: datetime | None = PrivateAttr(default=None)
+    _source: str | None = PrivateAttr(default=None)
+
+    @classmethod
+    def from_stored(cls, ip: str, geolocation: dict) -> "IpGeolocationSchema":
+        return cls.model_construct(
+            ip=ip, geolocation=GeolocationSchema.from_stored(geolocation)
+        )
+
+    @classmethod
+    def from_row(cls, row: Any) -> "IpGeolocationSchema":
+        """
+        Schema of ip_geolocation row or ORM object. Its version and freshness
+        aren't part of the document, but are kept for response headers and
+        refreshing.
+        """
+        schema = cls.from_stored(row.ip, row.geolocation)
+        schema._version = row.version
+        schema._updated_at = row.updated_at
+        schema._fetched_at = row.fetched_at
+        schema._source = row.source
+        return schema
+
+    @property
+    def version(self) -> int | None:
+        return self._version
+
+    @property
+    def updated_at(self) -> datetime | None:
+        return self._updated_at
+
+    @property
+    def fetched_at(self) -> datetime | None:
+        return self._fetched_at
+
+    @property
+    def source(self) -> str | None:
+        return self._source
+
+    def to_json(self) -> bytes:
+        """
+        JSON of the schema, serialized on first call only - cached schemas are
+        shared by all responses for their address.
+        """
+        if self._json is None:
+            self._json = self.__pydantic_serializer__.to_json(self)
+        return self._json
+
+
+class AddressesLookupSchema(BaseModel):
+    addresses: Annotated[list[str], Field(min_length=1)]
+
+
+class AddressLookupResultSchema(BaseModel):
+    address: str
+    status_code: int
+    ip: str | None = None
+    geolocation: GeolocationSchema | None = None
+    detail: str | None = None
+
+
+class AddressesUpsertSchema(BaseModel):
+    addresses: Annotated[list[IpGeolocationSchema], Field(min_length=1)]
+
+
+class AddressesUpsertResultSchema(BaseModel):
+    upserted: int
+
+
+class NegativeCachePurgeSchema(BaseModel):
+    purged: int
+
+
+class NearbyIpGeolocationSchema(IpGeolocationSchema):
+    distance_km: float
+
+
+class GeolocationStatsSchema(BaseModel):
+    addresses: int
+    continents: dict[str, int]
+    countries: dict[str, int]
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+from geolocation_catalogue.schemas import IpGeolocationSchema
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class SingleFlightStats:
+    in_flight: int
+    calls: int
+    executions: int
+    shared: int
+
+
+class _LeaderAbandoned(Exception):
+    """
+    Set to waiters when leader is cancelled - one of them takes over the call.
+    """
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Coalesces concurrent calls for the same key - only the first caller executes
+    the function, all callers which arrive while it is running get its result.
+    Works both for threads and for coroutines, as waiters share concurrent Future.
+    Only exceptions are shared - when the leader is cancelled (or interrupted),
+    the next waiter executes the function instead.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[K, Future] = {}
+        self._lock = threading.Lock()
+
+        self._calls = 0
+        self._executions = 0
+        self._shared = 0
+
+    def do(self, key: K, fn: Callable[[], V]) -> V:
+        future, is_leader = self._join(key)
+        while not is_leader:
+            try:
+                return future.result()
+            except _LeaderAbandoned:
+                future, is_leader = self._join(key, rejoin=True)
+
+        try:
+            result = fn()
+        except Exception as exc:
+            self._finish(key, future, exception=exc)
+            raise
+        except BaseException:
+            self._finish(key, future, exception=_LeaderAbandoned())
+            raise
+
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: K, fn: Callable[[], Awaitable[V]]) -> V:
+        future, is_leader = self._join(key)
+        while not is_leader:
+            try:
+                # shielded, so cancelled waiter doesn't cancel the shared future
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderAbandoned:
+                future, is_leader = self._join(key, rejoin=True)
+
+        try:
+            result = await fn()
+        except Exception as exc:
+            self._finish(key, future, exception=exc)
+            raise
+        except BaseException:
+            self._finish(key, future, exception=_LeaderAbandoned())
+            raise
+
+        self._finish(key, future, result=result)
+        return result
+
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(
+                in_flight=len(self._in_flight),
+                calls=self._calls,
+                executions=self._executions,
+                shared=self._shared,
+            )
+
+    def _join(self, key: K, rejoin: bool = False) -> tuple[Future, bool]:
+        with self._lock:
+            if not rejoin:
+                self._calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                if not rejoin:
+                    self._shared += 1
+                return future, False
+
+            future = Future()
+            self._in_flight[key] = future
+            self._executions += 1
+            return future, True
+
+    def _finish(
+        self,
+        key: K,
+        future: Future,
+        result: V | None = None,
+        exception: Exception | None = None,
+    ) -> None:
+        with self._lock:
+            del self._in_flight[key]
+
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+
+IP_GEOLOCATION_SINGLE_FLIGHT: SingleFlight[str, IpGeolocationSchema] = SingleFlight()
@@ -0,0 +1,378 @@
+import ipaddress
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.models import IpGeolocation, NetworkGeolocation
+from geolocation_catalogue.schemas import GeolocationSchema
+
+logger = logging.getLogger(__name__)
+
+# Snapshot file layout (all integers little-endian, except keys):
+#   header   - magic, version, number of segments, keys, records and strings
+#   segments - (family, prefix length, first key index, number of keys), in order
+#              in which they are searched
+#   keys     - 16 byte big-endian network addresses, sorted within each segment
+#   key ids  - record index of each key
+#   records  - string table indexes of text fields followed by latitude and longitude
+#   strings  - offsets of strings in blob followed by utf-8 blob
+# Addresses from ip_geolocation are stored as networks with full prefix length, in
+# a segment placed before segments of networks, so they take precedence in lookups.
+
+SNAPSHOT_MAGIC: bytes = b"GEOSNAP1"
+SNAPSHOT_VERSION: int = 1
+
+_HEADER = struct.Struct("<8sIQQQQ")
+_SEGMENT = struct.Struct("<BBxxxxxxQQ")
+_KEY_SIZE: int = 16
+_KEY_ID = struct.Struct("<I")
+_STRING_FIELDS: tuple[str, ...] = (
+    "continent_code",
+    "continent_name",
+    "country_code",
+    "country_name",
+    "region_code",
+    "region_name",
+    "city",
+    "zip",
+)
+_RECORD = struct.Struct(f"<{len(_STRING_FIELDS)}I2d")
+_STRING_OFFSET = struct.Struct("<Q")
+
+_MAX_PREFIX_LENGTH: dict[int, int] = {4: 32, 6: 128}
+
+
+@dataclass
+class SnapshotStats:
+    keys: int
+    records: int
+    strings: int
+
+
+def write_snapshot(db: Session, path: str, yield_per: int = 10000) -> SnapshotStats:
+    """
+    Stream catalogue into snapshot file. Keys are spooled to temporary files, so
+    only distinct geolocations and strings are held in memory. File is replaced
+    atomically, so readers never see half written snapshot.
+    """
+    records: dict[tuple, int] = {}
+    strings: dict[str, int] = {}
+    segments: list[tuple[int, int, int, int]] = []
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with (
+        tempfile.TemporaryFile(dir=directory) as keys_file,
+        tempfile.TemporaryFile(dir=directory) as key_ids_file,
+    ):
+        key_count = 0
+        last_is_address = True
+        for family, prefix_length, address, geolocation, is_address in _iter_entries(
+            db, yield_per
+        ):
+            # addresses and single address networks have the same prefix length,
+            # but are written one after another, so they start separate segments
+            if (
+                not segments
+                or segments[-1][:2] != (family, prefix_length)
+                or is_address != last_is_address
+            ):
+                segments.append((family, prefix_length, key_count, 0))
+            segment_family, segment_prefix_length, start, count = segments[-1]
+            segments[-1] = (segment_family, segment_prefix_length, start, count + 1)
+
+            record = tuple(
+                strings.setdefault(geolocation[f], len(strings)) for f in _STRING_FIELDS
+            ) + (geolocation["latitude"], geolocation["longitude"])
+            record_id = records.setdefault(record, len(records))
+
+            keys_file.write(address.to_bytes(_KEY_SIZE, "big"))
+            key_ids_file.write(_KEY_ID.pack(record_id))
+            key_count += 1
+            last_is_address = is_address
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    SNAPSHOT_MAGIC,
+                    SNAPSHOT_VERSION,
+                    len(segments),
+                    key_count,
+                    len(records),
+                    len(strings),
+                )
+            )
+            for segment in segments:
+                f.write(_SEGMENT.pack(*segment))
+
+            for spooled_file in (keys_file, key_ids_file):
+                spooled_file.seek(0)
+                shutil.copyfileobj(spooled_file, f)
+
+            for record in records:
+                f.write(_RECORD.pack(*record))
+
+            encoded_strings = [s.encode() for s in strings]
+            offset = 0
+            for encoded_string in encoded_strings:
+                f.write(_STRING_OFFSET.pack(offset))
+                offset += len(encoded_string)
+            f.write(_STRING_OFFSET.pack(offset))
+            for encoded_string in encoded_strings:
+                f.write(encoded_string)
+
+        os.replace(tmp_path, path)
+
+    return SnapshotStats(keys=key_count, records=len(records), strings=len(strings))
+
+
+def _iter_entries(
+    db: Session, yield_per: int
+) -> Iterable[tuple[int, int, int, dict, bool]]:
+    """
+    Yield (family, prefix length, address, geolocation, is address) in segment
+    order - for each family addresses go first, then networks by descending
+    prefix length.
+    """
+    for family in (4, 6):
+        addresses = db.execute(
+            select(IpGeolocation.ip, IpGeolocation.geolocation)
+            .where(func.family(IpGeolocation.ip) == family)
+            .order_by(IpGeolocation.ip)
+            .execution_options(yield_per=yield_per)
+        )
+        for ip, geolocation in addresses:
+            yield (
+                family,
+                _MAX_PREFIX_LENGTH[family],
+                int(ipaddress.ip_address(ip)),
+                geolocation,
+                True,
+            )
+
+        networks = db.execute(
+            select(NetworkGeolocation.network, NetworkGeolocation.geolocation)
+            .where(func.family(NetworkGeolocation.network) == family)
+            .order_by(
+                func.masklen(NetworkGeolocation.network).desc(),
+                NetworkGeolocation.network,
+            )
+            .execution_options(yield_per=yield_per)
+        )
+        for network, geolocation in networks:
+            network = ipaddress.ip_network(network)
+            yield (
+                family,
+                network.prefixlen,
+                int(network.network_address),
+                geolocation,
+                False,
+            )
+
+
+class GeolocationSnapshot:
+    """
+    Read-only view of snapshot file. File is memory-mapped, so lookups don't
+    load it into memory and the page cache is shared by all worker processes.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self.file_id = _file_id(os.fstat(f.fileno()))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            (
+                magic,
+                version,
+                segment_count,
+                key_count,
+                record_count,
+                string_count,
+            ) = _HEADER.unpack_from(self._mmap, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(
+                    f"File {path} is not a supported geolocation snapshot."
+                )
+
+            offset = _HEADER.size
+            self._segments: dict[int, list[tuple[int, int, int]]] = {4: [], 6: []}
+            for _ in range(segment_count):
+                family, prefix_length, start, count = _SEGMENT.unpack_from(
+                    self._mmap, offset
+                )
+                self._segments[family].append((prefix_length, start, count))
+                offset += _SEGMENT.size
+
+            self._keys_offset = offset
+            self._key_ids_offset = self._keys_offset + key_count * _KEY_SIZE
+            self._records_offset = self._key_ids_offset + key_count * _KEY_ID.size
+            self._string_offsets_offset = (
+                self._records_offset + record_count * _RECORD.size
+            )
+            self._strings_offset = (
+                self._string_offsets_offset + (string_count + 1) * _STRING_OFFSET.size
+            )
+            (strings_size,) = _STRING_OFFSET.unpack_from(
+                self._mmap, self._strings_offset - _STRING_OFFSET.size
+            )
+        except (struct.error, KeyError) as exc:
+            self._mmap.close()
+            raise ValueError(
+                f"Snapshot file {path} is truncated or corrupted."
+            ) from exc
+        if self._strings_offset + strings_size != len(self._mmap):
+            self._mmap.close()
+            raise ValueError(f"Snapshot file {path} is truncated or corrupted.")
+
+    def lookup(self, ip: str) -> GeolocationSchema | None:
+        """
+        Geolocation of the address or of the most specific network containing it.
+        """
+        address = ipaddress.ip_address(ip)
+        address_int = int(address)
+        max_prefix_length = _MAX_PREFIX_LENGTH[address.version]
+
+        for prefix_length, start, count in self._segments[address.version]:
+            mask = ((1 << prefix_length) - 1) << (max_prefix_length - prefix_length)
+            key = (address_int & mask).to_bytes(_KEY_SIZE, "big")
+            index = self._search(key, start, start + count)
+            if index is not None:
+                return self._read_record(index)
+
+        return None
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _search(self, key: bytes, low: int, high: int) -> int | None:
+        mm = self._mmap
+        while low < high:
+            middle = (low + high) // 2
+            key_offset = self._keys_offset + middle * _KEY_SIZE
+            middle_key = mm[key_offset : key_offset + _KEY_SIZE]
+            if middle_key < key:
+                low = middle + 1
+            elif middle_key > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _read_record(self, key_index: int) -> GeolocationSchema:
+        (record_id,) = _KEY_ID.unpack_from(
+            self._mmap, self._key_ids_offset + key_index * _KEY_ID.size
+        )
+        *string_ids, latitude, longitude = _RECORD.unpack_from(
+            self._mmap, self._records_offset + record_id * _RECORD.size
+        )
+
+        # data was validated when it was stored, so there is no need to do it again
+        return GeolocationSchema.model_construct(
+            **{
+                field: self._read_string(string_id)
+                for field, string_id in zip(_STRING_FIELDS, string_ids)
+            },
+            latitude=latitude,
+            longitude=longitude,
+        )
+
+    def _read_string(self, string_id: int) -> str:
+        start, end = struct.unpack_from(
+            "<2Q",
+            self._mmap,
+            self._string_offsets_offset + string_id * _STRING_OFFSET.size,
+        )
+        return self._mmap[
+            self._strings_offset + start : self._strings_offset + end
+        ].decode()
+
+
+def _file_id(stat: os.stat_result) -> tuple[int, int, int]:
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+
+# snapshot file is checked for replacement at most this often, not on every lookup
+SNAPSHOT_CHECK_INTERVAL_SECONDS: float = 1.0
+
+
+class SnapshotReloader:
+    """
+    Keeps snapshot of configured path open and reopens it once the file is
+    replaced by a newer export. When the file is missing or broken, the last
+    snapshot opened is kept (or there is none, so addresses are looked up in
+    database) and the error is logged once per file.
+    """
+
+    def __init__(self) -> None:
+        self._snapshot: GeolocationSnapshot | None = None
+        self._path: str | None = None
+        self._checked_at = -math.inf
+        # file id of broken file or type of error of missing one, logged once
+        self._failure: tuple[int, int, int] | type | None = None
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> GeolocationSnapshot | None:
+        if (
+            path == self._path
+            and time.monotonic() - self._checked_at < SNAPSHOT_CHECK_INTERVAL_SECONDS
+        ):
+            return self._snapshot
+
+        with self._lock:
+            now = time.monotonic()
+            if path != self._path:
+                self._path, self._snapshot, self._failure = path, None, None
+            elif now - self._checked_at < SNAPSHOT_CHECK_INTERVAL_SECONDS:
+                return self._snapshot
+            self._checked_at = now
+            self._reopen_if_replaced(path)
+            return self._snapshot
+
+    def _reopen_if_replaced(self, path: str) -> None:
+        file_id = None
+        try:
+            file_id = _file_id(os.stat(path))
+            if file_id == self._failure or (
+                self._snapshot is not None and self._snapshot.file_id == file_id
+            ):
+                return
+            # previous snapshot isn't closed, lookups in progress may still use
+            # it - it's unmapped once they drop it
+            self._snapshot = GeolocationSnapshot(path)
+            self._failure = None
+        except (OSError, ValueError) as exc:
+            failure = type(exc) if file_id is None else file_id
+            if failure != self._failure:
+                logger.warning(
+                    "Snapshot %s can't be opened, %s: %s",
+                    path,
+                    "the last one is used" if self._snapshot else "it's not used",
+                    exc,
+                )
+            self._failure = failure
+
+
+_SNAPSHOT_RELOADER = SnapshotReloader()
+
+
+def get_snapshot() -> GeolocationSnapshot | None:
+    """
+    Snapshot configured with CONFIG.snapshot_path, opened on first use.
+    """
+    if not CONFIG.snapshot_path:
+        return None
+    return _SNAPSHOT_RELOADER.get(CONFIG.snapshot_path)
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from itertools import islice
+from typing import Iterator
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.database import (
+    ASYNC_ENGINE,
+    ASYNC_READ_ENGINES,
+    ENGINE,
+    READ_ENGINES,
+    SESSION_MAKER,
+)
+from geolocation_catalogue.ip_geolocation_crud import IpGeolocationCRUD
+from geolocation_catalogue.metrics import STARTUP_PHASE_DURATION
+from geolocation_catalogue.schemas import IpGeolocationSchema
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def startup_phase(phase: str) -> Iterator[None]:
+    """
+    Time startup phase, its duration is logged and exposed as a metric.
+    """
+    start = time.perf_counter()
+    yield
+    duration = time.perf_counter() - start
+    STARTUP_PHASE_DURATION.labels(phase).set(duration)
+    logger.info("Startup phase %s took %.3fs.", phase, duration)
+
+
+def open_connections(engine: Engine, count: int) -> None:
+    """
+    Open count connections of engine's pool, so first requests don't wait for
+    them. All of them are held until the last one is opened, otherwise the pool
+    would hand out the same connection again. Connections beyond pool size
+    wouldn't be kept, so they aren't opened.
+    """
+    connections = []
+    try:
+        for _ in range(min(count, engine.pool.size())):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def async_open_connections(engine: AsyncEngine, count: int) -> None:
+    """
+    Open connections of async engine's pool concurrently.
+    """
+    connections = await asyncio.gather(
+        *(engine.connect().start() for _ in range(min(count, engine.pool.size()))),
+        return_exceptions=True,
+    )
+    for connection in connections:
+        if not isinstance(connection, BaseException):
+            await connection.close()
+    for connection in connections:
+        if isinstance(connection, BaseException):
+            raise connection
+
+
+def read_hot_keys(path: str, limit: int) -> list[str]:
+    try:
+        with open(path) as f:
+            return list(islice(filter(None, (line.strip() for line in f)), limit))
+    except FileNotFoundError:
+        return []
+
+
+def write_hot_keys(path: str, keys: list[str]) -> None:
+    # every worker writes its own keys, the last one to stop wins
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(f"{key}\n" for key in keys)
+    os.replace(tmp_path, path)
+
+
+def preload_addresses(ips: list[str]) -> int:
+    """
+    Load stored addresses to cache with a single query to the primary, just like
+    cache misses. Returns number of loaded addresses - hot keys removed from
+    catalogue since are skipped.
+    """
+    with SESSION_MAKER() as db:
+        ip_geolocations = IpGeolocationCRUD.get_by_ips(db, ips)
+    for ip_geolocation in ip_geolocations:
+        IP_GEOLOCATION_CACHE.set(
+            ip_geolocation.ip, IpGeolocationSchema.from_row(ip_geolocation)
+        )
+    return len(ip_geolocations)
+
+
+async def warm_up() -> None:
+    """
+    Prepare worker for serving before it accepts requests: open connections of
+    pools used by its handlers and load addresses which were hot before the
+    last shutdown to cache.
+    """
+    with startup_phase("warmup"):
+        if CONFIG.warmup_db_connections > 0:
+            with startup_phase("db_connections"):
+                if CONFIG.async_mode:
+                    for engine in [ASYNC_ENGINE, *ASYNC_READ_ENGINES]:
+                        await async_open_connections(
+                            engine, CONFIG.warmup_db_connections
+                        )
+                for engine in [ENGINE, *READ_ENGINES]:
+                    await run_in_threadpool(
+                        open_connections, engine, CONFIG.warmup_db_connections
+                    )
+
+        if CONFIG.hot_keys_path and CONFIG.warmup_hot_keys > 0:
+            with startup_phase("hot_keys"):
+                ips = read_hot_keys(CONFIG.hot_keys_path, CONFIG.warmup_hot_keys)
+                loaded = await run_in_threadpool(preload_addresses, ips)
+            logger.info("Loaded %d of %d hot addresses to cache.", loaded, len(ips))
+
+
+def save_hot_keys() -> None:
+    if CONFIG.hot_keys_path and CONFIG.warmup_hot_keys > 0:
+        write_hot_keys(
+            CONFIG.hot_keys_path, IP_GEOLOCATION_CACHE.keys(CONFIG.warmup_hot_keys)
+        )
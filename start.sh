@@ -1,4 +1,5 @@
 #!/bin/bash
 
-alembic upgrade head
+# Note! Migrations aren't run here, so workers start without waiting for them -
+# run migrate.sh once per deployment, before the application is started.
 uvicorn geolocation_catalogue.main:app --port 8000 --host 0.0.0.0
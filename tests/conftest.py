@@ -1,11 +1,26 @@
+from typing import AsyncIterator
+
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
 
+from geolocation_catalogue.async_routes import router as async_address_router
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
 from geolocation_catalogue.config import CONFIG
-from geolocation_catalogue.main import app, get_db
+from geolocation_catalogue.database import (
+    get_async_db,
+    get_async_read_db,
+    get_read_db,
+    to_async_dsn,
+)
+from geolocation_catalogue.domain_alias import DOMAIN_ALIAS_CACHE
+from geolocation_catalogue.main import app, get_db, lifespan
 from geolocation_catalogue.models import Base, IpGeolocation
+from geolocation_catalogue.negative_cache import NEGATIVE_CACHE
 from geolocation_catalogue.schemas import GeolocationSchema
 
 IP_STACK_RESPONSES: dict[str, dict] = {
@@ -58,6 +73,14 @@ TEST_ENGINE = create_engine(str(CONFIG.pg_dsn))
 TEST_SESSION_MAKER = sessionmaker(autocommit=False, autoflush=False, bind=TEST_ENGINE)
 
 
+# Note! Every TestClient runs its own event loop, so async connections can't be pooled.
+TEST_ASYNC_ENGINE = create_async_engine(to_async_dsn(CONFIG.pg_dsn), poolclass=NullPool)
+
+TEST_ASYNC_SESSION_MAKER = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=TEST_ASYNC_ENGINE
+)
+
+
 def override_get_db() -> Session:
     try:
         db = TEST_SESSION_MAKER()
@@ -66,16 +89,25 @@ def override_get_db() -> Session:
         db.close()
 
 
+async def override_get_async_db() -> AsyncIterator[AsyncSession]:
+    async with TEST_ASYNC_SESSION_MAKER() as db:
+        yield db
+
+
 @pytest.fixture(autouse=True)
 def test_db() -> None:
     Base.metadata.drop_all(bind=TEST_ENGINE)
     Base.metadata.create_all(bind=TEST_ENGINE)
+    IP_GEOLOCATION_CACHE.clear()
+    DOMAIN_ALIAS_CACHE.clear()
+    NEGATIVE_CACHE.clear()
 
 
 @pytest.fixture()
 def test_app() -> TestClient:
     with TestClient(app) as c:
         app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
         yield c
 
 
@@ -84,10 +116,28 @@ def test_app_ip_stack_on() -> TestClient:
     with TestClient(app) as c:
         CONFIG.ip_stack_api_access_key = "test"
         app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
         yield c
         CONFIG.ip_stack_api_access_key = None
 
 
+@pytest.fixture()
+def test_async_app() -> TestClient:
+    async_app = FastAPI(lifespan=lifespan)
+    async_app.include_router(async_address_router)
+    async_app.dependency_overrides[get_async_db] = override_get_async_db
+    async_app.dependency_overrides[get_async_read_db] = override_get_async_db
+    with TestClient(async_app) as c:
+        yield c
+
+
+@pytest.fixture()
+def test_async_app_ip_stack_on(test_async_app: TestClient) -> TestClient:
+    CONFIG.ip_stack_api_access_key = TEST_IP_STACK_API_ACCESS_KEY
+    yield test_async_app
+    CONFIG.ip_stack_api_access_key = None
+
+
 def insert_into_database(ip: str, geolocation: dict) -> None:
     try:
         db = next(override_get_db())
@@ -109,3 +159,12 @@ def get_ip_geolocation_from_db(ip: str) -> IpGeolocation:
         db.close()
 
     return res
+
+
+def delete_from_database(ip: str) -> None:
+    try:
+        db = next(override_get_db())
+        db.execute(delete(IpGeolocation).where(IpGeolocation.ip == ip))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,76 @@
+import pytest
+from fastapi import HTTPException
+
+from geolocation_catalogue.address_validator import (
+    DomainNameValidator,
+    IpValidator,
+    classify_address,
+    normalize_address,
+    normalize_network,
+)
+
+
+@pytest.mark.parametrize(
+    "address, normalized_address",
+    [
+        ("57.144.110.1", "57.144.110.1"),
+        ("::ffff:57.144.110.1", "57.144.110.1"),
+        ("::FFFF:3990:6E01", "57.144.110.1"),
+        ("2001:0DB8:0000:0000:0000:0000:0000:0001", "2001:db8::1"),
+        ("2001:db8::1", "2001:db8::1"),
+        ("fe80::1%eth0", None),
+        ("57.144.110", None),
+        ("57.144.110.256", None),
+    ],
+)
+def test_normalize_ip(address: str, normalized_address: str | None) -> None:
+    assert IpValidator.normalize(address) == normalized_address
+
+
+@pytest.mark.parametrize(
+    "address, normalized_address",
+    [
+        ("example.com", "example.com"),
+        ("WWW.Example.COM.", "www.example.com"),
+        ("bücher.example", "xn--bcher-kva.example"),
+        ("exa_mple.com", None),
+        ("example..com", None),
+        ("localhost", None),
+    ],
+)
+def test_normalize_domain_name(address: str, normalized_address: str | None) -> None:
+    assert DomainNameValidator.normalize(address) == normalized_address
+
+
+@pytest.mark.parametrize(
+    "address, validator",
+    [
+        ("57.144.110.1", IpValidator),
+        ("::1", IpValidator),
+        ("57.144.110", IpValidator),
+        ("example.com", DomainNameValidator),
+        ("1.example.com", DomainNameValidator),
+    ],
+)
+def test_classify_address(address: str, validator: type) -> None:
+    assert classify_address(address) is validator
+
+
+@pytest.mark.parametrize("address", ["", "57.144.110", "exa_mple.com", "Zürich"])
+def test_normalize_address_wrong_format(address: str) -> None:
+    with pytest.raises(HTTPException) as exc_info:
+        normalize_address(address)
+    assert exc_info.value.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "network, normalized_network",
+    [
+        ("57.144.0.0/16", "57.144.0.0/16"),
+        ("::ffff:57.144.0.0/112", "57.144.0.0/16"),
+        ("2001:DB8::/32", "2001:db8::/32"),
+        ("::/95", "::/95"),
+    ],
+)
+def test_validate_network(network: str, normalized_network: str) -> None:
+    assert normalize_network(network) == normalized_network
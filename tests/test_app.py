@@ -1,17 +1,24 @@
+import ipaddress
+import json
 from copy import deepcopy
 
 import pytest
 import responses
 from fastapi import Response, status
 from fastapi.testclient import TestClient
+from sqlalchemy import text
 
-from geolocation_catalogue.schemas import GeolocationSchema
+from geolocation_catalogue import ip_geolocation_crud
+from geolocation_catalogue.ip_geolocation_crud import GeolocationStatsCRUD
+from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
 
 from .conftest import (
     IP_STACK_RESPONSES,
     TEST_IP_STACK_API_ACCESS_KEY,
+    delete_from_database,
     get_ip_geolocation_from_db,
     insert_into_database,
+    override_get_db,
 )
 
 
@@ -91,6 +98,52 @@ def test_get_address_geolocation_ip_stack_call_on_not_found_error(
     assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
+@responses.activate
+def test_get_address_geolocation_ip_stack_not_found_is_cached(
+    test_app_ip_stack_on: TestClient,
+) -> None:
+    ip = "216.58.209.4"
+    responses.add(
+        responses.GET,
+        f"https://api.ipstack.com/{ip}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main",
+        json={
+            "success": False,
+            "error": {"code": 404, "type": "404_not_found", "info": ""},
+        },
+        status=200,
+    )
+
+    for _ in range(2):
+        response = test_app_ip_stack_on.get("/address", params={"address": ip})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = test_app_ip_stack_on.post("/addresses/lookup", json={"addresses": [ip]})
+    assert response.json()[0]["status_code"] == 404
+    assert len(responses.calls) == 1
+
+    # stored geolocation replaces the negative result
+    data = GeolocationSchema(**IP_STACK_RESPONSES["57.144.110.1"]).model_dump()
+    response = test_app_ip_stack_on.put("/address", params={"address": ip}, json=data)
+    assert response.status_code == status.HTTP_200_OK
+    response = test_app_ip_stack_on.get("/address", params={"address": ip})
+    check_response_against_data(response, ip, data)
+
+    response = test_app_ip_stack_on.delete("/address", params={"address": ip})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = test_app_ip_stack_on.get("/address", params={"address": ip})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert len(responses.calls) == 2
+
+    response = test_app_ip_stack_on.delete(
+        "/negative-cache", params={"address": f"::ffff:{ip}"}
+    )
+    assert response.json() == {"purged": 1}
+    response = test_app_ip_stack_on.delete("/negative-cache")
+    assert response.json() == {"purged": 0}
+    response = test_app_ip_stack_on.get("/address", params={"address": ip})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert len(responses.calls) == 3
+
+
 @responses.activate
 def test_get_address_geolocation_ip_stack_call_on_success_false(
     test_app_ip_stack_on: TestClient,
@@ -159,6 +212,22 @@ def test_put_address_geolocation_update_entry(
     check_response_again_database(response, ip)
 
 
+def test_put_address_geolocation_normalizes_address(test_app: TestClient) -> None:
+    ip = "57.144.110.1"
+    data = GeolocationSchema(**IP_STACK_RESPONSES[ip]).model_dump()
+
+    response = test_app.put("/address", params={"address": f"::ffff:{ip}"}, json=data)
+    check_response_against_data(response, ip, data)
+
+    for address in (ip, "::FFFF:3990:6E01"):
+        response = test_app.get("/address", params={"address": address})
+        check_response_against_data(response, ip, data)
+
+    response = test_app.put("/address", params={"address": "2001:DB8:0::1"}, json=data)
+    check_response_against_data(response, "2001:db8::1", data)
+    check_response_again_database(response, "2001:db8::1")
+
+
 @pytest.mark.parametrize("ip", list(IP_STACK_RESPONSES))
 def test_delete_address_geolocation_not_existing(test_app: TestClient, ip: str) -> None:
     response = test_app.delete("/address", params={"address": ip})
@@ -188,3 +257,497 @@ def test_delete_address_geolocation_multiple_existing(test_app: TestClient) -> N
 
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert not get_ip_geolocation_from_db(ip)
+
+
+def test_lookup_addresses_geolocation(test_app: TestClient) -> None:
+    known_ip, unknown_ip = list(IP_STACK_RESPONSES)
+    insert_into_database(known_ip, IP_STACK_RESPONSES[known_ip])
+
+    addresses = [known_ip, "155.52.187.7.2", unknown_ip, known_ip]
+    response = test_app.post("/addresses/lookup", json={"addresses": addresses})
+
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [r["address"] for r in results] == addresses
+    assert [r["status_code"] for r in results] == [200, 422, 404, 200]
+    for k in results[0]["geolocation"]:
+        assert results[0]["geolocation"][k] == IP_STACK_RESPONSES[known_ip][k]
+    assert results[2]["ip"] == unknown_ip
+    assert results[2]["geolocation"] is None
+
+
+@responses.activate
+def test_lookup_addresses_geolocation_ip_stack_call_on(
+    test_app_ip_stack_on: TestClient,
+) -> None:
+    for ip, ip_stack_response in IP_STACK_RESPONSES.items():
+        responses.add(
+            responses.GET,
+            f"https://api.ipstack.com/{ip}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main",
+            json=ip_stack_response,
+            status=200,
+        )
+
+    addresses = list(IP_STACK_RESPONSES)
+    response = test_app_ip_stack_on.post(
+        "/addresses/lookup", json={"addresses": addresses}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    for result in response.json():
+        assert result["status_code"] == 200
+        geolocation = get_ip_geolocation_from_db(result["ip"])
+        assert geolocation
+        assert result["geolocation"] == geolocation.geolocation
+
+
+def test_get_address_geolocation_cached(test_app: TestClient) -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    insert_into_database(ip, IP_STACK_RESPONSES[ip])
+    stats_before = test_app.get("/cache/stats").json()
+
+    response = test_app.get("/address", params={"address": ip})
+    check_response_against_data(response, ip, IP_STACK_RESPONSES[ip])
+
+    # row is gone from database, but response is still served from cache
+    delete_from_database(ip)
+    response = test_app.get("/address", params={"address": ip})
+    check_response_against_data(response, ip, IP_STACK_RESPONSES[ip])
+
+    stats = test_app.get("/cache/stats").json()
+    assert stats["hits"] - stats_before["hits"] == 1
+    assert stats["misses"] - stats_before["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_put_and_delete_address_geolocation_update_cache(
+    test_app: TestClient,
+) -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    insert_into_database(ip, IP_STACK_RESPONSES[ip])
+    test_app.get("/address", params={"address": ip})
+
+    request_data = deepcopy(IP_STACK_RESPONSES[ip])
+    request_data["city"] = "test"
+    test_app.put("/address", params={"address": ip}, json=request_data)
+    hits = test_app.get("/cache/stats").json()["hits"]
+    response = test_app.get("/address", params={"address": ip})
+    check_response_against_data(response, ip, request_data)
+    # stored geolocation was cached by PUT
+    assert test_app.get("/cache/stats").json()["hits"] == hits + 1
+
+    test_app.delete("/address", params={"address": ip})
+    response = test_app.get("/address", params={"address": ip})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_put_network_geolocation_and_get_most_specific_prefix(
+    test_app: TestClient,
+) -> None:
+    ip_us, ip_pl = list(IP_STACK_RESPONSES)
+    response = test_app.put(
+        "/address",
+        params={"address": "57.144.0.0/16"},
+        json=GeolocationSchema(**IP_STACK_RESPONSES[ip_us]).model_dump(),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["ip"] == "57.144.0.0/16"
+
+    test_app.put(
+        "/address",
+        params={"address": "57.144.110.0/24"},
+        json=GeolocationSchema(**IP_STACK_RESPONSES[ip_pl]).model_dump(),
+    )
+
+    response = test_app.get("/address", params={"address": ip_pl})
+    check_response_against_data(response, ip_pl, IP_STACK_RESPONSES[ip_pl])
+
+    response = test_app.get("/address", params={"address": "57.144.1.1"})
+    check_response_against_data(response, "57.144.1.1", IP_STACK_RESPONSES[ip_us])
+
+    response = test_app.post(
+        "/addresses/lookup", json={"addresses": [ip_pl, "57.144.1.1", "58.0.0.1"]}
+    )
+    results = response.json()
+    assert [r["status_code"] for r in results] == [200, 200, 404]
+    assert results[0]["geolocation"]["city"] == IP_STACK_RESPONSES[ip_pl]["city"]
+    assert results[1]["geolocation"]["city"] == IP_STACK_RESPONSES[ip_us]["city"]
+
+    response = test_app.delete("/address", params={"address": "57.144.110.0/24"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = test_app.get("/address", params={"address": ip_pl})
+    check_response_against_data(response, ip_pl, IP_STACK_RESPONSES[ip_us])
+
+
+@pytest.mark.parametrize("address", ["57.144.110.1/24", "57.144.0.0/33"])
+def test_put_network_geolocation_wrong_network_value(
+    test_app: TestClient, address: str
+) -> None:
+    response = test_app.put(
+        "/address",
+        params={"address": address},
+        json=list(IP_STACK_RESPONSES.values())[0],
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_delete_network_geolocation_not_existing(test_app: TestClient) -> None:
+    response = test_app.delete("/address", params={"address": "57.144.0.0/16"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_export_addresses_geolocation(test_app: TestClient) -> None:
+    for ip, data in IP_STACK_RESPONSES.items():
+        insert_into_database(ip, data)
+    first_ip, second_ip = sorted(IP_STACK_RESPONSES, key=ipaddress.ip_address)
+
+    response = test_app.get("/addresses/export")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["ip"] for row in rows] == [first_ip, second_ip]
+    for row in rows:
+        for k in row["geolocation"]:
+            assert row["geolocation"][k] == IP_STACK_RESPONSES[row["ip"]][k]
+
+    response = test_app.get("/addresses/export", params={"after": first_ip})
+    assert [json.loads(line)["ip"] for line in response.text.splitlines()] == [
+        second_ip
+    ]
+
+    response = test_app.get("/addresses/export", params={"country_code": "US"})
+    assert [json.loads(line)["ip"] for line in response.text.splitlines()] == [
+        "216.58.209.14"
+    ]
+
+    response = test_app.get("/addresses/export", params={"after": "not-ip"})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def insert_warsaw_addresses() -> dict[str, dict]:
+    """
+    Two addresses in Warsaw, one 10 km north of it and one in Mountain View.
+    """
+    warsaw = IP_STACK_RESPONSES["57.144.110.1"]
+    addresses = dict(IP_STACK_RESPONSES)
+    addresses["10.0.0.1"] = deepcopy(warsaw)
+    addresses["10.0.0.2"] = {**deepcopy(warsaw), "latitude": warsaw["latitude"] + 0.09}
+    for ip, data in addresses.items():
+        insert_into_database(ip, data)
+    return addresses
+
+
+def test_get_addresses_near(test_app: TestClient) -> None:
+    addresses = insert_warsaw_addresses()
+    warsaw_ip = "57.144.110.1"
+    warsaw = addresses[warsaw_ip]
+    params = {"latitude": warsaw["latitude"], "longitude": warsaw["longitude"]}
+
+    response = test_app.get("/addresses/near", params={**params, "radius_km": 50})
+    assert response.status_code == status.HTTP_200_OK
+    rows = response.json()
+    assert [row["ip"] for row in rows] == sorted(
+        [warsaw_ip, "10.0.0.1"], key=ipaddress.ip_address
+    ) + ["10.0.0.2"]
+    assert rows[0]["distance_km"] == pytest.approx(0, abs=1e-6)
+    assert rows[2]["distance_km"] == pytest.approx(10, abs=0.1)
+
+    response = test_app.get(
+        "/addresses/near", params={**params, "radius_km": 50, "limit": 1}
+    )
+    (first,) = response.json()
+    response = test_app.get(
+        "/addresses/near",
+        params={
+            **params,
+            "radius_km": 50,
+            "after_distance_km": first["distance_km"],
+            "after": first["ip"],
+        },
+    )
+    assert [row["ip"] for row in response.json()] == [row["ip"] for row in rows[1:]]
+
+    response = test_app.get("/addresses/near", params={**params, "radius_km": 20000})
+    assert len(response.json()) == len(addresses)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"latitude": 91, "longitude": 0, "radius_km": 1},
+        {"latitude": 0, "longitude": 0, "radius_km": 0},
+        {"latitude": 0, "longitude": 0, "radius_km": 1, "after": "10.0.0.1"},
+    ],
+)
+def test_get_addresses_near_wrong_params(test_app: TestClient, params: dict) -> None:
+    response = test_app.get("/addresses/near", params=params)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_get_addresses_within(test_app: TestClient) -> None:
+    addresses = insert_warsaw_addresses()
+    poland = {"south": 49, "west": 14, "north": 55, "east": 24.2}
+
+    response = test_app.get("/addresses/within", params=poland)
+    assert response.status_code == status.HTTP_200_OK
+    ips = [row["ip"] for row in response.json()]
+    assert ips == sorted(
+        [ip for ip, d in addresses.items() if d["country_code"] == "PL"],
+        key=ipaddress.ip_address,
+    )
+
+    response = test_app.get("/addresses/within", params={**poland, "after": ips[0]})
+    assert [row["ip"] for row in response.json()] == ips[1:]
+
+    # box crossing antimeridian, from Poland eastwards to California
+    response = test_app.get(
+        "/addresses/within",
+        params={"south": 30, "west": 20, "north": 60, "east": -120},
+    )
+    assert len(response.json()) == len(addresses)
+
+    response = test_app.get(
+        "/addresses/within", params={**poland, "south": 56, "north": 55}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_get_addresses(test_app: TestClient) -> None:
+    addresses = insert_warsaw_addresses()
+    ips = sorted(addresses, key=ipaddress.ip_address)
+
+    response = test_app.get("/addresses")
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["ip"] for row in response.json()] == ips
+    for row in response.json():
+        for k in row["geolocation"]:
+            assert row["geolocation"][k] == addresses[row["ip"]][k]
+
+    response = test_app.get("/addresses", params={"limit": 2})
+    assert [row["ip"] for row in response.json()] == ips[:2]
+    response = test_app.get("/addresses", params={"limit": 2, "after": ips[1]})
+    assert [row["ip"] for row in response.json()] == ips[2:4]
+
+    response = test_app.get(
+        "/addresses", params={"country_code": "PL", "region_code": "MZ"}
+    )
+    assert [row["ip"] for row in response.json()] == [
+        ip for ip in ips if addresses[ip]["country_code"] == "PL"
+    ]
+
+    response = test_app.get("/addresses", params={"city": "Mountain View"})
+    assert [row["ip"] for row in response.json()] == ["216.58.209.14"]
+
+    response = test_app.get("/addresses", params={"continent_code": "AF"})
+    assert response.json() == []
+
+
+@pytest.mark.parametrize("params", [{"after": "not-ip"}, {"limit": 0}])
+def test_get_addresses_wrong_params(test_app: TestClient, params: dict) -> None:
+    response = test_app.get("/addresses", params=params)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_get_stats(test_app: TestClient) -> None:
+    response = test_app.get("/stats")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"addresses": 0, "continents": {}, "countries": {}}
+
+    insert_warsaw_addresses()
+    response = test_app.get("/stats")
+    assert response.json() == {
+        "addresses": 4,
+        "continents": {"EU": 3, "NA": 1},
+        "countries": {"PL": 3, "US": 1},
+    }
+
+    geolocation = {**IP_STACK_RESPONSES["216.58.209.14"], "ip": "10.0.0.1"}
+    test_app.put("/address", params={"address": "10.0.0.1"}, json=geolocation)
+    test_app.delete("/address", params={"address": "57.144.110.1"})
+    response = test_app.get("/stats")
+    assert response.json() == {
+        "addresses": 3,
+        "continents": {"EU": 1, "NA": 2},
+        "countries": {"PL": 1, "US": 2},
+    }
+
+
+def test_stats_of_updated_addresses(test_app: TestClient) -> None:
+    insert_warsaw_addresses()
+    db = next(override_get_db())
+    try:
+        stats_versions = "SELECT country_code, xmin::text FROM geolocation_stats"
+        versions = dict(db.execute(text(stats_versions)).all())
+        # updates which keep continent and country don't touch stats
+        db.execute(text("UPDATE ip_geolocation SET fetched_at = now()"))
+        db.commit()
+        assert dict(db.execute(text(stats_versions)).all()) == versions
+
+        # the same country is both decremented and incremented by one statement
+        db.execute(
+            text(
+                "UPDATE ip_geolocation SET geolocation = geolocation "
+                "|| jsonb_build_object('country_code', "
+                "CASE country_code WHEN 'PL' THEN 'US' ELSE 'PL' END)"
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    response = test_app.get("/stats")
+    assert response.json()["countries"] == {"PL": 1, "US": 3}
+
+
+def test_rebuild_stats(test_app: TestClient) -> None:
+    insert_warsaw_addresses()
+    db = next(override_get_db())
+    try:
+        db.execute(text("UPDATE geolocation_stats SET addresses = 100"))
+        db.commit()
+
+        assert GeolocationStatsCRUD.rebuild(db) == 2
+    finally:
+        db.close()
+
+    response = test_app.get("/stats")
+    assert response.json()["countries"] == {"PL": 3, "US": 1}
+
+
+def test_get_address_geolocation_response_document(test_app: TestClient) -> None:
+    ip = "57.144.110.1"
+    data = {**IP_STACK_RESPONSES[ip], "city": "Krakow", "latitude": 50.0}
+    insert_into_database(ip, data)
+    # whole number coordinates can also be stored as JSON integers
+    db = next(override_get_db())
+    try:
+        db.execute(
+            text(
+                "UPDATE ip_geolocation SET geolocation = "
+                "jsonb_set(geolocation, '{latitude}', '50') WHERE ip = :ip"
+            ),
+            {"ip": ip},
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    expected = IpGeolocationSchema(
+        ip=ip, geolocation=GeolocationSchema(**data)
+    ).model_dump_json()
+    # first response comes from database, second one from cache
+    for _ in range(2):
+        response = test_app.get("/address", params={"address": ip})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == expected.encode()
+
+
+def test_get_address_geolocation_conditional(test_app: TestClient) -> None:
+    ip = "57.144.110.1"
+    insert_into_database(ip, IP_STACK_RESPONSES[ip])
+
+    response = test_app.get("/address", params={"address": ip})
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+    assert response.headers["last-modified"]
+    assert response.headers["cache-control"] == "public, max-age=60"
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = test_app.get(
+            "/address",
+            params={"address": ip},
+            headers={"If-None-Match": if_none_match},
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.headers["etag"] == etag
+        assert not response.content
+
+    data = GeolocationSchema(**{**IP_STACK_RESPONSES[ip], "city": "test"})
+    response = test_app.put("/address", params={"address": ip}, json=data.model_dump())
+    new_etag = response.headers["etag"]
+    assert new_etag != etag
+
+    response = test_app.get(
+        "/address", params={"address": ip}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] == new_etag
+
+
+def test_put_address_geolocation_if_match(test_app: TestClient) -> None:
+    ip = "57.144.110.1"
+    data = GeolocationSchema(**IP_STACK_RESPONSES[ip]).model_dump()
+
+    # nothing stored yet, so even "*" fails
+    response = test_app.put(
+        "/address", params={"address": ip}, json=data, headers={"If-Match": "*"}
+    )
+    assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    etag = test_app.put("/address", params={"address": ip}, json=data).headers["etag"]
+
+    data["city"] = "test"
+    for if_match in ('"1-0"', f"W/{etag}"):
+        response = test_app.put(
+            "/address",
+            params={"address": ip},
+            json=data,
+            headers={"If-Match": if_match},
+        )
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+    response = test_app.put(
+        "/address", params={"address": ip}, json=data, headers={"If-Match": etag}
+    )
+    check_response_against_data(response, ip, data)
+    assert response.headers["etag"].startswith('"2-')
+
+    # the same tag is stale after the update
+    response = test_app.put(
+        "/address", params={"address": ip}, json=data, headers={"If-Match": etag}
+    )
+    assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+
+
+def test_put_addresses_geolocation_batch(
+    test_app: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(ip_geolocation_crud, "UPSERT_CHUNK_SIZE", 2)
+    ip = "57.144.110.1"
+    data = GeolocationSchema(**IP_STACK_RESPONSES[ip]).model_dump()
+    insert_into_database(ip, data)
+    test_app.get("/address", params={"address": ip})
+
+    updated_data = {**data, "city": "test"}
+    addresses = [
+        {"ip": f"::ffff:{ip}", "geolocation": updated_data},
+        {"ip": "2001:DB8::1", "geolocation": data},
+        {"ip": "192.0.2.1", "geolocation": data},
+        {"ip": "192.0.2.1", "geolocation": updated_data},
+    ]
+    response = test_app.put("/addresses/batch", json={"addresses": addresses})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"upserted": 3}
+
+    # cached response of updated address is invalidated
+    response = test_app.get("/address", params={"address": ip})
+    check_response_against_data(response, ip, updated_data)
+    assert response.headers["etag"].startswith('"2-')
+    for address, expected in (("2001:db8::1", data), ("192.0.2.1", updated_data)):
+        response = test_app.get("/address", params={"address": address})
+        check_response_against_data(response, address, expected)
+        check_response_again_database(response, address)
+
+
+def test_put_addresses_geolocation_batch_wrong_address(test_app: TestClient) -> None:
+    data = GeolocationSchema(**IP_STACK_RESPONSES["57.144.110.1"]).model_dump()
+    addresses = [
+        {"ip": "192.0.2.1", "geolocation": data},
+        {"ip": "google.com", "geolocation": data},
+    ]
+
+    response = test_app.put("/addresses/batch", json={"addresses": addresses})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert get_ip_geolocation_from_db(ip="192.0.2.1") is None
@@ -0,0 +1,142 @@
+from copy import deepcopy
+
+import httpx
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from geolocation_catalogue import ip_stack_handler
+from geolocation_catalogue.schemas import GeolocationSchema
+
+from .conftest import (
+    IP_STACK_RESPONSES,
+    TEST_IP_STACK_API_ACCESS_KEY,
+    get_ip_geolocation_from_db,
+    insert_into_database,
+)
+from .test_app import check_response_again_database, check_response_against_data
+
+
+@pytest.fixture()
+def ip_stack_mock(monkeypatch: pytest.MonkeyPatch) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.params["access_key"] == TEST_IP_STACK_API_ACCESS_KEY
+        ip = request.url.path.lstrip("/")
+        if ip not in IP_STACK_RESPONSES:
+            return httpx.Response(
+                200,
+                json={
+                    "success": False,
+                    "error": {"code": 404, "type": "404_not_found", "info": ""},
+                },
+            )
+        return httpx.Response(200, json=IP_STACK_RESPONSES[ip])
+
+    monkeypatch.setattr(
+        ip_stack_handler,
+        "_ASYNC_CLIENT",
+        httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+@pytest.mark.parametrize(
+    "ip, ip_stack_response", [(k, IP_STACK_RESPONSES[k]) for k in IP_STACK_RESPONSES]
+)
+def test_async_get_address_geolocation(
+    test_async_app: TestClient, ip: str, ip_stack_response: dict
+) -> None:
+    insert_into_database(ip, ip_stack_response)
+
+    response = test_async_app.get("/address", params={"address": ip})
+
+    check_response_against_data(response, ip, ip_stack_response)
+
+
+@pytest.mark.parametrize("address", ["http://test.com/aaa", "155.52.187.7.2"])
+def test_async_get_address_geolocation_wrong_address_value(
+    test_async_app: TestClient, address: str
+) -> None:
+    response = test_async_app.get("/address", params={"address": address})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_async_get_address_geolocation_empty_catalogue(
+    test_async_app: TestClient,
+) -> None:
+    response = test_async_app.get("/address", params={"address": "155.52.187.7"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.parametrize(
+    "ip, ip_stack_response", [(k, IP_STACK_RESPONSES[k]) for k in IP_STACK_RESPONSES]
+)
+def test_async_get_address_geolocation_ip_stack_call_on(
+    test_async_app_ip_stack_on: TestClient,
+    ip_stack_mock: None,
+    ip: str,
+    ip_stack_response: dict,
+) -> None:
+    response = test_async_app_ip_stack_on.get("/address", params={"address": ip})
+
+    check_response_against_data(response, ip, ip_stack_response)
+    check_response_again_database(response, ip)
+
+
+def test_async_get_address_geolocation_ip_stack_call_on_not_found_error(
+    test_async_app_ip_stack_on: TestClient, ip_stack_mock: None
+) -> None:
+    response = test_async_app_ip_stack_on.get(
+        "/address", params={"address": "216.58.209.4"}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.parametrize(
+    "ip, ip_stack_response", [(k, IP_STACK_RESPONSES[k]) for k in IP_STACK_RESPONSES]
+)
+def test_async_put_address_geolocation(
+    test_async_app: TestClient, ip: str, ip_stack_response: dict
+) -> None:
+    data = GeolocationSchema(**ip_stack_response)
+    response = test_async_app.put(
+        "/address", params={"address": ip}, json=data.model_dump()
+    )
+    check_response_against_data(response, ip, ip_stack_response)
+
+    request_data = deepcopy(ip_stack_response)
+    request_data["city"] = "test"
+    data = GeolocationSchema(**request_data)
+    response = test_async_app.put(
+        "/address", params={"address": ip}, json=data.model_dump()
+    )
+    check_response_against_data(response, ip, request_data)
+    check_response_again_database(response, ip)
+
+
+def test_async_delete_address_geolocation(test_async_app: TestClient) -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    response = test_async_app.delete("/address", params={"address": ip})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    insert_into_database(ip, IP_STACK_RESPONSES[ip])
+    response = test_async_app.delete("/address", params={"address": ip})
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert not get_ip_geolocation_from_db(ip)
+
+
+def test_async_put_network_geolocation(test_async_app: TestClient) -> None:
+    ip = list(IP_STACK_RESPONSES)[1]
+    response = test_async_app.put(
+        "/address",
+        params={"address": "57.144.0.0/16"},
+        json=GeolocationSchema(**IP_STACK_RESPONSES[ip]).model_dump(),
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["ip"] == "57.144.0.0/16"
+
+    response = test_async_app.get("/address", params={"address": ip})
+    check_response_against_data(response, ip, IP_STACK_RESPONSES[ip])
+
+    response = test_async_app.delete("/address", params={"address": "57.144.0.0/16"})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
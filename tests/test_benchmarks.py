@@ -0,0 +1,58 @@
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from benchmarks.compare import compare
+from benchmarks.fake_ip_stack import create_app
+from benchmarks.results import summarize
+from geolocation_catalogue.schemas import GeolocationSchema
+
+
+def test_fake_ip_stack() -> None:
+    client = TestClient(create_app())
+
+    response = client.get("/57.144.110.1")
+    assert response.status_code == status.HTTP_200_OK
+    geolocation = response.json()
+    GeolocationSchema(**geolocation)
+    assert client.get("/57.144.110.1").json() == geolocation
+
+    response = client.get("/57.144.110.1,216.58.209.14")
+    assert [r["ip"] for r in response.json()] == ["57.144.110.1", "216.58.209.14"]
+
+
+def test_fake_ip_stack_errors() -> None:
+    client = TestClient(create_app(error_rate=1.0))
+    assert client.get("/57.144.110.1").status_code == 503
+
+    client = TestClient(create_app(not_found_rate=1.0))
+    assert client.get("/57.144.110.1").json()["error"]["code"] == 404
+
+
+def test_summarize() -> None:
+    summary = summarize([0.001 * i for i in range(1, 101)])
+    assert summary["count"] == 100
+    assert summary["p50_us"] == pytest.approx(51000)
+    assert summary["max_us"] == pytest.approx(100000)
+
+
+def test_compare() -> None:
+    baseline = {
+        "results": {
+            "a": {"mean_us": 100.0, "ops_per_sec": 1000.0},
+            "b": {"latency": {"p95_us": 10.0}, "requests_per_sec": 50.0},
+        }
+    }
+    current = {
+        "results": {
+            "a": {"mean_us": 110.0, "ops_per_sec": 700.0},
+            "b": {"latency": {"p95_us": 20.0}, "requests_per_sec": 60.0},
+        }
+    }
+
+    regressions = compare(baseline, current, threshold=0.2)
+
+    assert [regression.split(":")[0] for regression in regressions] == [
+        "a.ops_per_sec",
+        "b.latency.p95_us",
+    ]
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+
+from geolocation_catalogue.bulk_import import import_rows, read_rows
+
+from .conftest import (
+    IP_STACK_RESPONSES,
+    get_ip_geolocation_from_db,
+    insert_into_database,
+)
+
+GEOLOCATION_FIELDS: list[str] = [
+    "continent_code",
+    "continent_name",
+    "country_code",
+    "country_name",
+    "region_code",
+    "region_name",
+    "city",
+    "zip",
+    "latitude",
+    "longitude",
+]
+
+
+def test_import_csv() -> None:
+    ip_us, ip_pl = list(IP_STACK_RESPONSES)
+    insert_into_database(ip_pl, IP_STACK_RESPONSES[ip_us])
+
+    file = io.StringIO()
+    writer = csv.DictWriter(file, fieldnames=["ip", *GEOLOCATION_FIELDS])
+    writer.writeheader()
+    for ip, data in IP_STACK_RESPONSES.items():
+        writer.writerow({"ip": ip, **{k: data[k] for k in GEOLOCATION_FIELDS}})
+    valid_data = {k: IP_STACK_RESPONSES[ip_us][k] for k in GEOLOCATION_FIELDS}
+    writer.writerow({"ip": "1.2.3.4.5", **valid_data})
+    writer.writerow({"ip": "1.2.3.4", **valid_data, "latitude": "north"})
+    file.seek(0)
+
+    rejected = io.StringIO()
+    stats = import_rows(read_rows(file, "csv"), chunk_size=1, rejected_file=rejected)
+
+    assert (stats.read, stats.imported, stats.rejected) == (4, 2, 2)
+    for ip, data in IP_STACK_RESPONSES.items():
+        geolocation = get_ip_geolocation_from_db(ip).geolocation
+        for k in GEOLOCATION_FIELDS:
+            assert geolocation[k] == data[k]
+    assert [json.loads(r)["line"] for r in rejected.getvalue().splitlines()] == [3, 4]
+    assert not get_ip_geolocation_from_db("1.2.3.4")
+
+
+def test_import_ndjson_last_duplicate_wins() -> None:
+    ip_us, ip_pl = list(IP_STACK_RESPONSES)
+    rows = [
+        {"ip": ip_pl, "geolocation": IP_STACK_RESPONSES[ip_us]},
+        {"ip": ip_us, **IP_STACK_RESPONSES[ip_us]},
+        {"ip": ip_pl, "geolocation": IP_STACK_RESPONSES[ip_pl]},
+    ]
+    file = io.StringIO("\n".join(json.dumps(r) for r in rows) + "\n\n")
+
+    stats = import_rows(read_rows(file, "ndjson"), chunk_size=10)
+
+    assert (stats.read, stats.imported, stats.rejected) == (3, 2, 0)
+    assert get_ip_geolocation_from_db(ip_pl).geolocation["city"] == "Warsaw"
+    assert get_ip_geolocation_from_db(ip_us).geolocation["city"] == "Mountain View"
+
+
+def test_import_rejects_malformed_rows() -> None:
+    ip_us, ip_pl = list(IP_STACK_RESPONSES)
+    ndjson = io.StringIO(
+        "\n".join(
+            [
+                '{"ip": "216.58.209.14", "geolocation": ',
+                "[1, 2]",
+                '"x"',
+                json.dumps({"ip": ip_us, **IP_STACK_RESPONSES[ip_us]}),
+            ]
+        )
+    )
+    csv_file = io.StringIO()
+    writer = csv.writer(csv_file)
+    writer.writerow(["ip", *GEOLOCATION_FIELDS])
+    data = IP_STACK_RESPONSES[ip_pl]
+    writer.writerow([ip_pl, *(data[k] for k in GEOLOCATION_FIELDS), "extra"])
+    writer.writerow([ip_pl, *(data[k] for k in GEOLOCATION_FIELDS)])
+    csv_file.seek(0)
+
+    for file, file_format, rejected_lines in (
+        (ndjson, "ndjson", [1, 2, 3]),
+        (csv_file, "csv", [1]),
+    ):
+        rejected = io.StringIO()
+        stats = import_rows(read_rows(file, file_format), rejected_file=rejected)
+
+        assert (stats.read, stats.imported, stats.rejected) == (
+            len(rejected_lines) + 1,
+            1,
+            len(rejected_lines),
+        )
+        assert [
+            json.loads(r)["line"] for r in rejected.getvalue().splitlines()
+        ] == rejected_lines
+
+    assert get_ip_geolocation_from_db(ip_us)
+    assert get_ip_geolocation_from_db(ip_pl)
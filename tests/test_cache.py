@@ -0,0 +1,197 @@
+import multiprocessing
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from geolocation_catalogue import cache as cache_module
+from geolocation_catalogue.cache import SET_WAYS, SharedMemoryCache, TTLCache
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
+
+from .conftest import IP_STACK_RESPONSES
+
+
+def test_ttl_cache_evicts_least_recently_used() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats.evictions == 1
+    assert stats.hits == 3
+    assert stats.misses == 1
+
+
+def test_ttl_cache_expires_entries() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=2, ttl=0.01)
+    cache.set("a", 1)
+
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats().expirations == 1
+
+
+def test_ttl_cache_disabled() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_size=0, ttl=60)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+
+
+@pytest.fixture()
+def shared_cache_path(tmp_path: Path) -> str:
+    return str(tmp_path / "cache")
+
+
+def ip_geolocation_schema(ip: str, city: str = "Warsaw") -> IpGeolocationSchema:
+    geolocation = {**IP_STACK_RESPONSES["57.144.110.1"], "city": city}
+    schema = IpGeolocationSchema.from_stored(
+        ip, GeolocationSchema(**geolocation).model_dump()
+    )
+    schema._version = 3
+    schema._updated_at = datetime(2026, 10, 18, 12, 0, 0, 123457, timezone.utc)
+    schema._fetched_at = schema._updated_at
+    schema._source = "ip_stack"
+    return schema
+
+
+def set_in_other_process(path: str, ip: str) -> None:
+    cache = SharedMemoryCache(path, max_size=16, ttl=60, slot_size=1024)
+    cache.set(ip, ip_geolocation_schema(ip, "Krakow"))
+
+
+def test_shared_memory_cache_keeps_schema(shared_cache_path: str) -> None:
+    cache = SharedMemoryCache(shared_cache_path, max_size=16, ttl=60, slot_size=1024)
+    schema = ip_geolocation_schema("57.144.110.1")
+    cache.set(schema.ip, schema)
+
+    cached = cache.get(schema.ip)
+
+    assert cached == schema
+    assert cached.to_json() == schema.to_json()
+    assert (cached.version, cached.updated_at, cached.fetched_at, cached.source) == (
+        3,
+        schema.updated_at,
+        schema.fetched_at,
+        "ip_stack",
+    )
+    # network fallback isn't versioned
+    network_schema = IpGeolocationSchema.from_stored(
+        "57.144.110.2", schema.geolocation.model_dump()
+    )
+    cache.set(network_schema.ip, network_schema)
+    assert cache.get(network_schema.ip).version is None
+    assert cache.keys(1) == ["57.144.110.1"]
+
+
+def test_shared_memory_cache_is_shared_by_processes(shared_cache_path: str) -> None:
+    cache = SharedMemoryCache(shared_cache_path, max_size=16, ttl=60, slot_size=1024)
+    other_cache = SharedMemoryCache(
+        shared_cache_path, max_size=16, ttl=60, slot_size=1024
+    )
+
+    process = multiprocessing.get_context("fork").Process(
+        target=set_in_other_process, args=(shared_cache_path, "57.144.110.1")
+    )
+    process.start()
+    process.join()
+    assert cache.get("57.144.110.1").geolocation.city == "Krakow"
+
+    other_cache.set("192.0.2.1", ip_geolocation_schema("192.0.2.1"))
+    assert cache.get("192.0.2.1") is not None
+    assert other_cache.invalidate("57.144.110.1")
+    assert not cache.invalidate("57.144.110.1")
+    assert cache.get("57.144.110.1") is None
+    assert cache.stats().size == 1
+
+    other_cache.clear()
+    assert cache.get("192.0.2.1") is None
+    assert cache.stats().size == 0
+
+
+def test_shared_memory_cache_with_other_settings_keeps_mapped_file(
+    shared_cache_path: str,
+) -> None:
+    cache = SharedMemoryCache(shared_cache_path, max_size=16, ttl=60, slot_size=1024)
+    cache.set("57.144.110.1", ip_geolocation_schema("57.144.110.1"))
+
+    other_cache = SharedMemoryCache(
+        shared_cache_path, max_size=64, ttl=60, slot_size=512
+    )
+    other_cache.set("192.0.2.1", ip_geolocation_schema("192.0.2.1"))
+
+    assert cache.get("57.144.110.1").geolocation.city == "Warsaw"
+    assert cache.get("192.0.2.1") is None
+    assert other_cache.get("192.0.2.1") is not None
+    assert sorted(path.name for path in Path(shared_cache_path).parent.iterdir()) == [
+        "cache.16x1024",
+        "cache.64x512",
+    ]
+
+
+def test_shared_memory_cache_refuses_file_of_other_layout(
+    shared_cache_path: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache = SharedMemoryCache(shared_cache_path, max_size=16, ttl=60, slot_size=1024)
+    cache.set("57.144.110.1", ip_geolocation_schema("57.144.110.1"))
+    # file of the same name left by other version of the layout
+    file_path = Path(f"{shared_cache_path}.16x1024")
+    content = b"GEOCACH0" + file_path.read_bytes()[8:]
+    file_path.write_bytes(content)
+
+    with pytest.raises(ValueError):
+        SharedMemoryCache(shared_cache_path, max_size=16, ttl=60, slot_size=1024)
+    assert file_path.read_bytes() == content
+
+    monkeypatch.setattr(CONFIG, "shared_cache_path", shared_cache_path)
+    monkeypatch.setattr(CONFIG, "cache_max_size", 16)
+    monkeypatch.setattr(CONFIG, "shared_cache_slot_size", 1024)
+    assert isinstance(cache_module._ip_geolocation_cache(), TTLCache)
+
+
+def test_shared_memory_cache_evicts_not_recently_read(shared_cache_path: str) -> None:
+    # single set, so every key competes for the same slots
+    cache = SharedMemoryCache(
+        shared_cache_path, max_size=SET_WAYS, ttl=60, slot_size=1024
+    )
+    ips = [f"192.0.2.{i}" for i in range(SET_WAYS)]
+    for ip in ips:
+        cache.set(ip, ip_geolocation_schema(ip))
+    for ip in ips[1:]:
+        assert cache.get(ip) is not None
+
+    cache.set("192.0.2.100", ip_geolocation_schema("192.0.2.100"))
+
+    assert cache.get(ips[0]) is None
+    assert all(cache.get(ip) is not None for ip in ips[1:] + ["192.0.2.100"])
+    stats = cache.stats()
+    assert (stats.size, stats.max_size, stats.evictions) == (SET_WAYS, SET_WAYS, 1)
+
+
+def test_shared_memory_cache_expires_entries(shared_cache_path: str) -> None:
+    cache = SharedMemoryCache(shared_cache_path, max_size=16, ttl=0.01, slot_size=1024)
+    cache.set("192.0.2.1", ip_geolocation_schema("192.0.2.1"))
+
+    time.sleep(0.02)
+
+    assert cache.get("192.0.2.1") is None
+    assert cache.stats().expirations == 1
+
+
+def test_shared_memory_cache_skips_entries_over_slot_size(
+    shared_cache_path: str,
+) -> None:
+    cache = SharedMemoryCache(shared_cache_path, max_size=16, ttl=60, slot_size=256)
+    cache.set("192.0.2.1", ip_geolocation_schema("192.0.2.1", "Krakow" * 50))
+
+    assert cache.get("192.0.2.1") is None
+    assert cache.stats().size == 0
@@ -0,0 +1,53 @@
+import time
+
+from geolocation_catalogue.circuit_breaker import CircuitBreaker, CircuitState
+
+
+def test_circuit_breaker_opens_after_consecutive_failures() -> None:
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    circuit_breaker.record_failure()
+    circuit_breaker.record_success()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.allow_request()
+
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.state == CircuitState.OPEN
+    assert not circuit_breaker.allow_request()
+    stats = circuit_breaker.stats()
+    assert stats.consecutive_failures == 2
+    assert 59 < stats.retry_after <= 60
+
+
+def test_circuit_breaker_lets_single_trial_call_through() -> None:
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    circuit_breaker.record_failure()
+
+    time.sleep(0.02)
+
+    assert circuit_breaker.allow_request()
+    assert circuit_breaker.state == CircuitState.HALF_OPEN
+    assert not circuit_breaker.allow_request()
+
+    # failed trial opens circuit again, successful one closes it
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitState.OPEN
+    time.sleep(0.02)
+    assert circuit_breaker.allow_request()
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CircuitState.CLOSED
+    assert circuit_breaker.allow_request()
+
+
+def test_circuit_breaker_released_trial_is_let_through_again() -> None:
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    circuit_breaker.record_failure()
+    time.sleep(0.02)
+    assert circuit_breaker.allow_request()
+
+    circuit_breaker.release_trial()
+
+    assert circuit_breaker.state == CircuitState.OPEN
+    assert circuit_breaker.allow_request()
+    assert not circuit_breaker.allow_request()
@@ -0,0 +1,106 @@
+from itertools import cycle
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from geolocation_catalogue import database
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.database import (
+    ENGINE,
+    TimedQueuePool,
+    engine_options,
+    get_db,
+    get_read_db,
+    read_session_maker,
+)
+from geolocation_catalogue.main import app
+
+from .conftest import (
+    IP_STACK_RESPONSES,
+    TEST_ENGINE,
+    insert_into_database,
+    override_get_db,
+)
+
+
+def test_engine_options_from_config() -> None:
+    CONFIG.db_pool_size = 2
+    CONFIG.db_pool_pre_ping = False
+    CONFIG.db_statement_timeout_ms = 1500
+    try:
+        engine = create_engine(
+            str(CONFIG.pg_dsn), poolclass=TimedQueuePool, **engine_options()
+        )
+        assert engine_options(is_async=True)["connect_args"] == {
+            "server_settings": {"statement_timeout": "1500"}
+        }
+    finally:
+        CONFIG.db_pool_size = 5
+        CONFIG.db_pool_pre_ping = True
+        CONFIG.db_statement_timeout_ms = None
+
+    try:
+        assert engine.pool.size() == 2
+        assert not engine.pool._pre_ping
+        with engine.connect() as connection:
+            timeout = connection.execute(text("SHOW statement_timeout")).scalar()
+        assert timeout == "1500ms"
+    finally:
+        engine.dispose()
+
+
+def test_reads_go_to_primary_without_replicas() -> None:
+    with read_session_maker()() as db:
+        assert db.get_bind() is ENGINE
+
+
+def test_read_only_endpoints_read_from_replicas(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    insert_into_database(ip, IP_STACK_RESPONSES[ip])
+    # replica is the tests database too, but behind an engine of its own
+    replica_engine = create_engine(str(CONFIG.pg_dsn))
+    queries = {TEST_ENGINE: 0, replica_engine: 0}
+
+    def count_query(connection, *args) -> None:
+        queries[connection.engine] += 1
+
+    for engine in queries:
+        event.listen(engine, "before_cursor_execute", count_query)
+    monkeypatch.setattr(
+        database,
+        "_read_session_makers",
+        cycle([sessionmaker(autoflush=False, bind=replica_engine)]),
+    )
+    monkeypatch.setattr(CONFIG, "pg_read_dsns", [CONFIG.pg_dsn])
+    monkeypatch.setattr(CONFIG, "replica_cache_ttl_seconds", 0.0)
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.delitem(app.dependency_overrides, get_read_db, raising=False)
+
+    try:
+        with TestClient(app) as client:
+            for path, params in (
+                ("/stats", {}),
+                ("/addresses", {}),
+                ("/addresses/near", {"latitude": 0, "longitude": 0, "radius_km": 1}),
+                (
+                    "/addresses/within",
+                    {"south": 0, "west": 0, "north": 1, "east": 1},
+                ),
+                ("/addresses/export", {}),
+                ("/address", {"address": ip}),
+                # address read from replica was cached only briefly
+                ("/address", {"address": ip}),
+            ):
+                replica_queries = queries[replica_engine]
+                assert client.get(path, params=params).status_code == status.HTTP_200_OK
+                assert queries[replica_engine] > replica_queries, path
+            assert queries[TEST_ENGINE] == 0
+    finally:
+        for engine in queries:
+            event.remove(engine, "before_cursor_execute", count_query)
+        replica_engine.dispose()
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+from socket import gaierror
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from geolocation_catalogue import domain_alias
+from geolocation_catalogue.domain_alias import DOMAIN_ALIAS_CACHE, resolve_domain_ip
+from geolocation_catalogue.models import DomainAlias
+
+from .conftest import IP_STACK_RESPONSES, TEST_SESSION_MAKER, insert_into_database
+
+DOMAIN: str = "example.com"
+
+
+@pytest.fixture()
+def dns_calls(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    calls = []
+
+    def getaddrinfo(host, port, family, type):
+        calls.append(host)
+        if host != DOMAIN:
+            raise gaierror()
+        return [
+            (family, type, 6, "", ("93.184.216.34", 0)),
+            (family, type, 6, "", ("23.192.228.80", 0)),
+            (family, type, 6, "", ("93.184.216.34", 0)),
+        ]
+
+    monkeypatch.setattr(domain_alias, "getaddrinfo", getaddrinfo)
+    return calls
+
+
+def test_resolve_domain_ip_is_stable_and_cached(dns_calls: list[str]) -> None:
+    with TEST_SESSION_MAKER() as db:
+        assert resolve_domain_ip(db, DOMAIN) == "23.192.228.80"
+        assert resolve_domain_ip(db, DOMAIN) == "23.192.228.80"
+    assert dns_calls == [DOMAIN]
+
+
+def test_resolve_domain_ip_from_alias_table(dns_calls: list[str]) -> None:
+    with TEST_SESSION_MAKER() as db:
+        resolve_domain_ip(db, DOMAIN)
+        DOMAIN_ALIAS_CACHE.clear()
+
+        assert resolve_domain_ip(db, DOMAIN) == "23.192.228.80"
+        assert dns_calls == [DOMAIN]
+
+        db.execute(
+            update(DomainAlias).values(
+                expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+            )
+        )
+        db.commit()
+        DOMAIN_ALIAS_CACHE.clear()
+
+        assert resolve_domain_ip(db, DOMAIN) == "23.192.228.80"
+    assert dns_calls == [DOMAIN, DOMAIN]
+
+
+def test_resolve_domain_ip_not_existing(dns_calls: list[str]) -> None:
+    with TEST_SESSION_MAKER() as db, pytest.raises(gaierror):
+        resolve_domain_ip(db, "not-existing.com")
+
+
+@pytest.mark.parametrize("app_fixture", ["test_app", "test_async_app"])
+def test_get_address_of_domain_resolves_it_in_endpoint(
+    request: pytest.FixtureRequest, app_fixture: str, dns_calls: list[str]
+) -> None:
+    client: TestClient = request.getfixturevalue(app_fixture)
+    insert_into_database("23.192.228.80", IP_STACK_RESPONSES["216.58.209.14"])
+
+    response = client.get("/address", params={"address": DOMAIN.upper()})
+
+    assert response.status_code == 200
+    assert response.json()["ip"] == "23.192.228.80"
+    assert dns_calls == [DOMAIN]
+    with TEST_SESSION_MAKER() as db:
+        domain_alias = db.execute(select(DomainAlias)).scalar_one()
+    assert domain_alias.ips == ["23.192.228.80", "93.184.216.34"]
@@ -0,0 +1,222 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import responses
+import stamina
+from fastapi import HTTPException
+
+from geolocation_catalogue import ip_stack_handler
+from geolocation_catalogue.circuit_breaker import CircuitBreaker, CircuitState
+from geolocation_catalogue.ip_stack_handler import (
+    AsyncIpStackHandler,
+    IpStackBatcher,
+    IpStackHandler,
+    IpStackUnavailableError,
+)
+from geolocation_catalogue.rate_limit import TokenBucket
+
+from .conftest import IP_STACK_RESPONSES, TEST_IP_STACK_API_ACCESS_KEY
+
+NOT_FOUND_IP: str = "216.58.209.4"
+
+IP_STACK_NOT_FOUND: dict = {
+    "success": False,
+    "error": {"code": 404, "type": "404_not_found", "info": ""},
+}
+
+
+def add_bulk_response(ips: list[str]) -> None:
+    responses.add(
+        responses.GET,
+        f"https://api.ipstack.com/{','.join(ips)}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main",
+        json=[IP_STACK_RESPONSES.get(ip, IP_STACK_NOT_FOUND) for ip in ips],
+        status=200,
+    )
+
+
+@responses.activate
+def test_resolve_geolocations() -> None:
+    ips = [*IP_STACK_RESPONSES, NOT_FOUND_IP]
+    add_bulk_response(ips)
+
+    handler = IpStackHandler(api_access_key=TEST_IP_STACK_API_ACCESS_KEY)
+    geolocations = handler.resolve_geolocations(ips)
+
+    for ip in IP_STACK_RESPONSES:
+        assert geolocations[ip].city == IP_STACK_RESPONSES[ip]["city"]
+    assert isinstance(geolocations[NOT_FOUND_IP], HTTPException)
+    assert geolocations[NOT_FOUND_IP].status_code == 404
+
+
+@responses.activate
+def test_ip_stack_batcher_resolves_burst_with_single_request() -> None:
+    ips = [*IP_STACK_RESPONSES, NOT_FOUND_IP]
+    add_bulk_response(ips)
+
+    batcher = IpStackBatcher(
+        ip_stack_handler=IpStackHandler(api_access_key=TEST_IP_STACK_API_ACCESS_KEY),
+        max_batch_size=len(ips),
+        max_wait=1,
+        max_concurrency=1,
+    )
+    futures = [batcher.submit(ip) for ip in ips]
+
+    for ip, future in zip(IP_STACK_RESPONSES, futures):
+        assert future.result().city == IP_STACK_RESPONSES[ip]["city"]
+    with pytest.raises(HTTPException):
+        futures[-1].result()
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_ip_stack_batcher_blocking_callers() -> None:
+    ips = list(IP_STACK_RESPONSES)
+    # order of addresses in bulk request depends on thread scheduling
+    add_bulk_response(ips)
+    add_bulk_response(ips[::-1])
+
+    batcher = IpStackBatcher(
+        ip_stack_handler=IpStackHandler(api_access_key=TEST_IP_STACK_API_ACCESS_KEY),
+        max_batch_size=len(ips),
+        max_wait=1,
+        max_concurrency=1,
+    )
+    with ThreadPoolExecutor(max_workers=len(ips)) as executor:
+        geolocations = list(executor.map(batcher.resolve_geolocation, ips))
+
+    assert [g.city for g in geolocations] == [
+        IP_STACK_RESPONSES[ip]["city"] for ip in ips
+    ]
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_ip_stack_handler_circuit_breaker_fails_fast() -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    url = f"https://api.ipstack.com/{ip}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main"
+    responses.add(responses.GET, url, status=503)
+    handler = IpStackHandler(
+        api_access_key=TEST_IP_STACK_API_ACCESS_KEY,
+        circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+    )
+
+    with stamina.set_testing(True, attempts=3):
+        with pytest.raises(IpStackUnavailableError) as exc_info:
+            handler.resolve_geolocation(ip)
+
+    # third attempt isn't made, circuit opened after the second one
+    assert len(responses.calls) == 2
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "60"
+
+
+@responses.activate
+def test_ip_stack_handler_doesnt_retry_client_errors() -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    url = f"https://api.ipstack.com/{ip}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main"
+    responses.add(responses.GET, url, status=401)
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    handler = IpStackHandler(
+        api_access_key=TEST_IP_STACK_API_ACCESS_KEY, circuit_breaker=circuit_breaker
+    )
+
+    with stamina.set_testing(True, attempts=3):
+        with pytest.raises(requests.HTTPError):
+            handler.resolve_geolocation(ip)
+
+    assert len(responses.calls) == 1
+    assert circuit_breaker.state == CircuitState.CLOSED
+
+
+@responses.activate
+def test_ip_stack_handler_rate_limiter() -> None:
+    ips = list(IP_STACK_RESPONSES)
+    add_bulk_response(ips)
+    handler = IpStackHandler(
+        api_access_key=TEST_IP_STACK_API_ACCESS_KEY,
+        rate_limiter=TokenBucket(rate=0.001, capacity=3),
+    )
+
+    handler.resolve_geolocations(ips)
+    with pytest.raises(IpStackUnavailableError):
+        handler.resolve_geolocations(ips)
+
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_ip_stack_batcher_splits_batch_larger_than_burst() -> None:
+    ips = [*IP_STACK_RESPONSES, NOT_FOUND_IP]
+    add_bulk_response(ips[:2])
+    add_bulk_response(ips[2:])
+
+    batcher = IpStackBatcher(
+        ip_stack_handler=IpStackHandler(
+            api_access_key=TEST_IP_STACK_API_ACCESS_KEY,
+            rate_limiter=TokenBucket(rate=1_000_000, capacity=2),
+        ),
+        max_batch_size=len(ips),
+        max_wait=1,
+        max_concurrency=1,
+    )
+    futures = [batcher.submit(ip) for ip in ips]
+
+    for ip, future in zip(IP_STACK_RESPONSES, futures):
+        assert future.result().city == IP_STACK_RESPONSES[ip]["city"]
+    with pytest.raises(HTTPException) as exc_info:
+        futures[-1].result()
+    assert exc_info.value.status_code == 404
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_ip_stack_handler_rate_limited_call_doesnt_take_trial() -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    url = f"https://api.ipstack.com/{ip}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main"
+    responses.add(responses.GET, url, json=IP_STACK_RESPONSES[ip], status=200)
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    rate_limiter = TokenBucket(rate=0.001, capacity=1)
+    circuit_breaker.record_failure()
+    rate_limiter.try_acquire()
+    handler = IpStackHandler(
+        api_access_key=TEST_IP_STACK_API_ACCESS_KEY,
+        circuit_breaker=circuit_breaker,
+        rate_limiter=rate_limiter,
+    )
+
+    with pytest.raises(IpStackUnavailableError):
+        handler.resolve_geolocation(ip)
+    assert circuit_breaker.state == CircuitState.OPEN
+
+    rate_limiter.release()
+    handler.resolve_geolocation(ip)
+    assert circuit_breaker.state == CircuitState.CLOSED
+
+
+def test_cancelled_trial_call_is_released(monkeypatch: pytest.MonkeyPatch) -> None:
+    class HangingClient:
+        async def get(self, *args, **kwargs) -> None:
+            await asyncio.sleep(10)
+
+    monkeypatch.setattr(ip_stack_handler, "get_async_client", HangingClient)
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    circuit_breaker.record_failure()
+    handler = AsyncIpStackHandler(
+        api_access_key=TEST_IP_STACK_API_ACCESS_KEY, circuit_breaker=circuit_breaker
+    )
+
+    async def cancel_trial() -> None:
+        task = asyncio.create_task(handler.resolve_geolocation("192.0.2.1"))
+        await asyncio.sleep(0.01)
+        assert circuit_breaker.state == CircuitState.HALF_OPEN
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+
+    # next call is let through as the trial
+    assert circuit_breaker.state == CircuitState.OPEN
+    assert circuit_breaker.allow_request()
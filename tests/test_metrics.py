@@ -0,0 +1,81 @@
+import responses
+from fastapi import status
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from .conftest import IP_STACK_RESPONSES, TEST_IP_STACK_API_ACCESS_KEY
+
+
+def get_sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@responses.activate
+def test_metrics_of_address_lookup(test_app_ip_stack_on: TestClient) -> None:
+    ip = "216.58.209.14"
+    responses.add(
+        responses.GET,
+        f"https://api.ipstack.com/{ip}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main",
+        json=IP_STACK_RESPONSES[ip],
+        status=200,
+    )
+    stages = ("validate_address", "database", "ip_stack", "serialization")
+    before = {
+        stage: get_sample("geolocation_stage_duration_seconds_count", stage=stage)
+        for stage in stages
+    }
+    ip_stack_responses = get_sample(
+        "geolocation_ip_stack_responses_total", status_code="200"
+    )
+    cache_hits = get_sample("geolocation_cache_hits_total", cache="ip_geolocation")
+
+    assert (
+        test_app_ip_stack_on.get("/address", params={"address": ip}).json()["ip"] == ip
+    )
+    assert (
+        test_app_ip_stack_on.get("/address", params={"address": ip}).json()["ip"] == ip
+    )
+
+    for stage, stage_count in {
+        "validate_address": 2,
+        "database": 1,
+        "ip_stack": 1,
+        "serialization": 2,
+    }.items():
+        assert (
+            get_sample("geolocation_stage_duration_seconds_count", stage=stage)
+            == before[stage] + stage_count
+        )
+    assert (
+        get_sample("geolocation_ip_stack_responses_total", status_code="200")
+        == ip_stack_responses + 1
+    )
+    assert (
+        get_sample("geolocation_cache_hits_total", cache="ip_geolocation")
+        == cache_hits + 1
+    )
+
+
+def test_get_metrics(test_app: TestClient) -> None:
+    test_app.get("/address", params={"address": "155.52.187.7"})
+
+    response = test_app.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    for metric in (
+        'geolocation_request_duration_seconds_count{method="GET",route="/address"}',
+        "geolocation_db_pool_checkout_wait_seconds_count",
+        'geolocation_cache_hit_ratio{cache="ip_geolocation"}',
+        'geolocation_cache_size{cache="domain_alias"}',
+    ):
+        assert metric in response.text
+
+
+def test_request_duration_of_unmatched_route(test_app: TestClient) -> None:
+    labels = {"method": "GET", "route": "unmatched"}
+    count = get_sample("geolocation_request_duration_seconds_count", **labels)
+
+    assert test_app.get("/no-such-route").status_code == status.HTTP_404_NOT_FOUND
+    assert (
+        get_sample("geolocation_request_duration_seconds_count", **labels) == count + 1
+    )
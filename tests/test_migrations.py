@@ -0,0 +1,92 @@
+import json
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+
+from alembic import command
+from alembic.config import Config
+from geolocation_catalogue.config import CONFIG
+
+from .conftest import IP_STACK_RESPONSES, TEST_ENGINE
+
+MIGRATIONS_DATABASE: str = "test_migrations"
+
+ROOT_PATH: Path = Path(__file__).parents[1]
+
+
+@pytest.fixture()
+def migrations_dsn() -> Iterator[str]:
+    """
+    Empty database of its own, so migrations run from scratch. Alembic env takes
+    DSN from CONFIG.
+    """
+    autocommit_engine = TEST_ENGINE.execution_options(isolation_level="AUTOCOMMIT")
+    with autocommit_engine.connect() as connection:
+        connection.execute(text(f"DROP DATABASE IF EXISTS {MIGRATIONS_DATABASE}"))
+        connection.execute(text(f"CREATE DATABASE {MIGRATIONS_DATABASE}"))
+
+    pg_dsn = CONFIG.pg_dsn
+    dsn = (
+        make_url(str(pg_dsn))
+        .set(database=MIGRATIONS_DATABASE)
+        .render_as_string(hide_password=False)
+    )
+    CONFIG.pg_dsn = dsn
+    try:
+        yield dsn
+    finally:
+        CONFIG.pg_dsn = pg_dsn
+        with autocommit_engine.connect() as connection:
+            connection.execute(
+                text(f"DROP DATABASE IF EXISTS {MIGRATIONS_DATABASE} WITH (FORCE)")
+            )
+
+
+def alembic_config() -> Config:
+    config = Config(str(ROOT_PATH / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT_PATH / "alembic"))
+    return config
+
+
+def test_inet_storage_collapses_textual_forms_of_address(migrations_dsn: str) -> None:
+    config = alembic_config()
+    command.upgrade(config, "3f1c2a9d7b10")
+
+    engine = create_engine(migrations_dsn)
+    try:
+        # each row in transaction of its own, so the last one is the newest
+        for ip, city in (
+            ("2001:db8::1", "first"),
+            ("2001:DB8::1", "second"),
+            ("2001:0db8::1", "newest"),
+            ("::ffff:1.2.3.4", "first"),
+            ("1.2.3.4", "newest"),
+            ("5.6.7.8", "only"),
+        ):
+            geolocation = {**IP_STACK_RESPONSES["216.58.209.14"], "city": city}
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        "INSERT INTO ip_geolocation (ip, geolocation) "
+                        "VALUES (:ip, CAST(:geolocation AS jsonb))"
+                    ),
+                    {"ip": ip, "geolocation": json.dumps(geolocation)},
+                )
+
+        command.upgrade(config, "head")
+
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text("SELECT host(ip), geolocation ->> 'city' FROM ip_geolocation")
+            ).all()
+    finally:
+        engine.dispose()
+
+    assert sorted(rows) == [
+        ("1.2.3.4", "newest"),
+        ("2001:db8::1", "newest"),
+        ("5.6.7.8", "only"),
+    ]
@@ -0,0 +1,90 @@
+from socket import gaierror
+
+import pytest
+from fastapi import HTTPException
+
+from geolocation_catalogue import domain_alias
+from geolocation_catalogue.address_validator import validate_address
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.negative_cache import (
+    NEGATIVE_CACHE,
+    NegativeLookupKind,
+    get_negatives,
+    purge_negatives,
+    raise_if_negative,
+    set_negatives,
+)
+
+from .conftest import TEST_SESSION_MAKER
+
+DOMAIN: str = "unresolvable.example"
+
+
+@pytest.fixture()
+def persisted() -> None:
+    CONFIG.negative_cache_persist = True
+    yield
+    CONFIG.negative_cache_persist = False
+
+
+def test_unresolvable_domain_is_resolved_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+
+    def getaddrinfo(host, port, family, type):
+        calls.append(host)
+        raise gaierror()
+
+    monkeypatch.setattr(domain_alias, "getaddrinfo", getaddrinfo)
+
+    with TEST_SESSION_MAKER() as db:
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc_info:
+                validate_address(db, DOMAIN)
+            assert exc_info.value.status_code == 404
+        assert calls == [DOMAIN]
+
+        assert purge_negatives([DOMAIN]) == 1
+        with pytest.raises(HTTPException):
+            validate_address(db, DOMAIN)
+    assert calls == [DOMAIN, DOMAIN]
+
+
+def test_negatives_are_kept_per_kind() -> None:
+    set_negatives(NegativeLookupKind.ADDRESS, {"192.0.2.1": "Not found."})
+
+    assert get_negatives(NegativeLookupKind.ADDRESS, ["192.0.2.1", "192.0.2.2"]) == {
+        "192.0.2.1": "Not found."
+    }
+    assert get_negatives(NegativeLookupKind.DOMAIN, ["192.0.2.1"]) == {}
+    with pytest.raises(HTTPException) as exc_info:
+        raise_if_negative(NegativeLookupKind.ADDRESS, "192.0.2.1")
+    assert exc_info.value.detail == "Not found."
+
+
+def test_persisted_negatives_are_shared(persisted: None) -> None:
+    set_negatives(
+        NegativeLookupKind.ADDRESS, {"192.0.2.1": "Not found.", "192.0.2.2": "Gone."}
+    )
+    # other process starts with empty in-process cache
+    NEGATIVE_CACHE.clear()
+
+    assert get_negatives(NegativeLookupKind.ADDRESS, ["192.0.2.1", "192.0.2.3"]) == {
+        "192.0.2.1": "Not found."
+    }
+    assert NEGATIVE_CACHE.get(("address", "192.0.2.1")) == "Not found."
+
+    assert purge_negatives(["192.0.2.1"]) == 1
+    assert get_negatives(NegativeLookupKind.ADDRESS, ["192.0.2.1"]) == {}
+    assert purge_negatives() == 1
+    assert get_negatives(NegativeLookupKind.ADDRESS, ["192.0.2.2"]) == {}
+
+
+def test_expired_persisted_negatives_are_ignored(persisted: None) -> None:
+    CONFIG.negative_cache_ttl_seconds = -1.0
+    try:
+        set_negatives(NegativeLookupKind.ADDRESS, {"192.0.2.1": "Not found."})
+    finally:
+        CONFIG.negative_cache_ttl_seconds = 60.0
+    NEGATIVE_CACHE.clear()
+
+    assert get_negatives(NegativeLookupKind.ADDRESS, ["192.0.2.1"]) == {}
@@ -0,0 +1,37 @@
+import time
+
+from geolocation_catalogue.rate_limit import TokenBucket
+
+
+def test_token_bucket_limits_bursts() -> None:
+    bucket = TokenBucket(rate=100, capacity=5)
+
+    assert bucket.try_acquire(5)
+    assert not bucket.try_acquire(1)
+    assert 0 < bucket.time_until(1) <= 0.01
+
+    time.sleep(0.02)
+
+    assert bucket.try_acquire(1)
+    assert not bucket.try_acquire(5)
+
+
+def test_token_bucket_refills_up_to_capacity() -> None:
+    bucket = TokenBucket(rate=1000, capacity=3)
+    bucket.try_acquire(3)
+
+    time.sleep(0.02)
+
+    assert bucket.tokens == 3
+    assert bucket.time_until(3) == 0.0
+    assert bucket.time_until(4) > 0
+
+
+def test_token_bucket_release() -> None:
+    bucket = TokenBucket(rate=0, capacity=2)
+    assert bucket.try_acquire(2)
+
+    bucket.release(1)
+    bucket.release(5)
+
+    assert bucket.tokens == 2
@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta, timezone
+
+import responses
+from sqlalchemy import update
+
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.ip_geolocation_crud import IpGeolocationCRUD
+from geolocation_catalogue.ip_stack_handler import IpStackHandler
+from geolocation_catalogue.models import GeolocationSource, IpGeolocation
+from geolocation_catalogue.refresh import GeolocationRefresher
+from geolocation_catalogue.responses import entity_tag
+from geolocation_catalogue.schemas import GeolocationSchema, IpGeolocationSchema
+
+from .conftest import (
+    IP_STACK_RESPONSES,
+    TEST_IP_STACK_API_ACCESS_KEY,
+    TEST_SESSION_MAKER,
+    get_ip_geolocation_from_db,
+)
+
+
+def create_refresher(sweep: bool = True) -> GeolocationRefresher:
+    return GeolocationRefresher(
+        ip_stack_handler=IpStackHandler(api_access_key=TEST_IP_STACK_API_ACCESS_KEY),
+        ttl=60,
+        rate=100,
+        batch_size=10,
+        interval=1,
+        max_scheduled=10,
+        sweep=sweep,
+        session_maker=TEST_SESSION_MAKER,
+    )
+
+
+def insert_fetched(ip: str, source: GeolocationSource, age: timedelta) -> None:
+    geolocation_schema = GeolocationSchema(**{**IP_STACK_RESPONSES[ip], "city": "old"})
+    with TEST_SESSION_MAKER() as db:
+        IpGeolocationCRUD.upsert(db, ip, geolocation_schema, source)
+        db.execute(
+            update(IpGeolocation)
+            .where(IpGeolocation.ip == ip)
+            .values(fetched_at=datetime.now(timezone.utc) - age)
+        )
+        db.commit()
+
+
+def add_ip_stack_response(ip: str, response_json: dict) -> None:
+    responses.add(
+        responses.GET,
+        f"{CONFIG.ip_stack_api_url}/{ip}?access_key={TEST_IP_STACK_API_ACCESS_KEY}&fields=main",
+        json=response_json,
+        status=200,
+    )
+
+
+@responses.activate
+def test_refresher_refreshes_oldest_ip_stack_geolocations() -> None:
+    ip, manual_ip = IP_STACK_RESPONSES
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(hours=1))
+    insert_fetched(manual_ip, GeolocationSource.MANUAL, timedelta(hours=1))
+    add_ip_stack_response(ip, IP_STACK_RESPONSES[ip])
+    refresher = create_refresher()
+
+    assert refresher.refresh_next()
+
+    ip_geolocation = get_ip_geolocation_from_db(ip)
+    assert ip_geolocation.geolocation["city"] == IP_STACK_RESPONSES[ip]["city"]
+    assert ip_geolocation.version == 2
+    assert ip_geolocation.fetched_at > datetime.now(timezone.utc) - timedelta(minutes=1)
+    # manually stored geolocation is never overwritten
+    assert get_ip_geolocation_from_db(manual_ip).geolocation["city"] == "old"
+    assert not refresher.refresh_next()
+
+
+@responses.activate
+def test_refresher_keeps_geolocation_not_found() -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(hours=1))
+    add_ip_stack_response(
+        ip, {"success": False, "error": {"code": 404, "type": "404_not_found"}}
+    )
+    refresher = create_refresher()
+
+    assert refresher.refresh_next()
+
+    ip_geolocation = get_ip_geolocation_from_db(ip)
+    assert ip_geolocation.geolocation["city"] == "old"
+    assert ip_geolocation.version == 1
+    # address isn't retried before another ttl passes
+    assert not refresher.refresh_next()
+
+
+@responses.activate
+def test_refresher_refreshes_scheduled_stale_addresses_first() -> None:
+    ip, other_ip = IP_STACK_RESPONSES
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(minutes=5))
+    insert_fetched(other_ip, GeolocationSource.IP_STACK, timedelta(hours=1))
+    add_ip_stack_response(ip, IP_STACK_RESPONSES[ip])
+    refresher = create_refresher()
+
+    with TEST_SESSION_MAKER() as db:
+        ip_geolocation_schema = IpGeolocationSchema.from_row(
+            IpGeolocationCRUD.get_stored_by_ip(db, ip)
+        )
+    IP_GEOLOCATION_CACHE.set(ip, ip_geolocation_schema)
+    assert refresher.is_stale(ip_geolocation_schema)
+    refresher.schedule_if_stale(ip_geolocation_schema)
+    refresher.schedule_if_stale(ip_geolocation_schema)
+    assert refresher.scheduled == 1
+
+    assert refresher.refresh_next()
+
+    assert len(responses.calls) == 1
+    assert IP_GEOLOCATION_CACHE.get(ip) is None
+    assert get_ip_geolocation_from_db(ip).version == 2
+    assert get_ip_geolocation_from_db(other_ip).version == 1
+
+
+def test_refresher_doesnt_schedule_fresh_or_manual_addresses() -> None:
+    ip, manual_ip = IP_STACK_RESPONSES
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(seconds=1))
+    insert_fetched(manual_ip, GeolocationSource.MANUAL, timedelta(hours=1))
+    refresher = create_refresher()
+
+    with TEST_SESSION_MAKER() as db:
+        for address in (ip, manual_ip):
+            refresher.schedule_if_stale(
+                IpGeolocationSchema.from_row(
+                    IpGeolocationCRUD.get_stored_by_ip(db, address)
+                )
+            )
+
+    assert refresher.scheduled == 0
+
+
+@responses.activate
+def test_refreshers_dont_refresh_the_same_addresses() -> None:
+    ip, other_ip = IP_STACK_RESPONSES
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(hours=1))
+    add_ip_stack_response(ip, IP_STACK_RESPONSES[ip])
+    sweeping_refresher = create_refresher()
+    worker_refresher = create_refresher(sweep=False)
+
+    with TEST_SESSION_MAKER() as db:
+        ip_geolocation_schema = IpGeolocationSchema.from_row(
+            IpGeolocationCRUD.get_stored_by_ip(db, ip)
+        )
+    worker_refresher.schedule_if_stale(ip_geolocation_schema)
+
+    assert sweeping_refresher.refresh_next()
+    # address was claimed by sweep in the meantime
+    assert not worker_refresher.refresh_next()
+    assert not create_refresher().refresh_next()
+
+    assert len(responses.calls) == 1
+    assert get_ip_geolocation_from_db(ip).version == 2
+
+
+def test_refresher_without_sweep_refreshes_only_scheduled_addresses() -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(hours=1))
+
+    assert not create_refresher(sweep=False).refresh_next()
+    assert get_ip_geolocation_from_db(ip).version == 1
+
+
+def test_claimed_addresses_are_claimed_again_after_timeout() -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(hours=1))
+    fetched_before = datetime.now(timezone.utc) - timedelta(minutes=1)
+
+    with TEST_SESSION_MAKER() as db:
+        assert IpGeolocationCRUD.claim_stale_ips(
+            db, fetched_before, fetched_before + timedelta(seconds=1), 10
+        ) == [ip]
+        assert not IpGeolocationCRUD.claim_stale_ips(
+            db, fetched_before, fetched_before, 10
+        )
+        # refresh of claimed address didn't complete in time
+        assert IpGeolocationCRUD.claim_stale_ips(
+            db, fetched_before + timedelta(seconds=2), fetched_before, 10, [ip]
+        ) == [ip]
+
+
+@responses.activate
+def test_claim_and_refresh_of_unchanged_address_keep_its_etag() -> None:
+    ip = list(IP_STACK_RESPONSES)[0]
+    insert_fetched(ip, GeolocationSource.IP_STACK, timedelta(hours=1))
+    add_ip_stack_response(
+        ip, {"success": False, "error": {"code": 404, "type": "404_not_found"}}
+    )
+    ip_geolocation = get_ip_geolocation_from_db(ip)
+    etag = entity_tag(ip_geolocation.version, ip_geolocation.updated_at)
+    fetched_before = datetime.now(timezone.utc) - timedelta(minutes=1)
+
+    with TEST_SESSION_MAKER() as db:
+        assert IpGeolocationCRUD.claim_stale_ips(
+            db, fetched_before, fetched_before, 10
+        ) == [ip]
+    ip_geolocation = get_ip_geolocation_from_db(ip)
+    assert entity_tag(ip_geolocation.version, ip_geolocation.updated_at) == etag
+
+    create_refresher().refresh([ip])
+    ip_geolocation = get_ip_geolocation_from_db(ip)
+    assert ip_geolocation.fetched_at > fetched_before
+    assert entity_tag(ip_geolocation.version, ip_geolocation.updated_at) == etag
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from geolocation_catalogue.single_flight import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+    executions = 0
+    started = threading.Event()
+
+    def fn() -> int:
+        nonlocal executions
+        executions += 1
+        started.set()
+        time.sleep(0.1)
+        return 42
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        leader = executor.submit(single_flight.do, "key", fn)
+        started.wait()
+        followers = [executor.submit(single_flight.do, "key", fn) for _ in range(7)]
+
+        assert leader.result() == 42
+        assert [f.result() for f in followers] == [42] * 7
+
+    assert executions == 1
+    stats = single_flight.stats()
+    assert stats.calls == 8
+    assert stats.executions == 1
+    assert stats.shared == 7
+    assert stats.in_flight == 0
+
+
+def test_single_flight_shares_exception() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+    started = threading.Event()
+
+    def fn() -> int:
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("test")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(single_flight.do, "key", fn)
+        started.wait()
+        follower = executor.submit(single_flight.do, "key", fn)
+
+        for future in (leader, follower):
+            with pytest.raises(ValueError):
+                future.result()
+
+    # failed call is not remembered
+    assert single_flight.do("key", lambda: 1) == 1
+
+
+def test_single_flight_async() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+    executions = 0
+
+    async def fn() -> int:
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def run() -> list[int]:
+        return await asyncio.gather(
+            *[single_flight.do_async("key", fn) for _ in range(10)]
+        )
+
+    assert asyncio.run(run()) == [42] * 10
+    assert executions == 1
+    assert single_flight.stats().shared == 9
+
+
+def test_single_flight_waiter_takes_over_cancelled_leader() -> None:
+    single_flight: SingleFlight[str, int] = SingleFlight()
+    executions = 0
+
+    async def fn() -> int:
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def run() -> list[int | BaseException]:
+        leader = asyncio.create_task(single_flight.do_async("key", fn))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.create_task(single_flight.do_async("key", fn)) for _ in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        # e.g. client of leader's request disconnected
+        leader.cancel()
+        return await asyncio.gather(leader, *waiters, return_exceptions=True)
+
+    leader_result, *waiter_results = asyncio.run(run())
+
+    assert isinstance(leader_result, asyncio.CancelledError)
+    assert waiter_results == [42] * 3
+    assert executions == 2
+    assert single_flight.stats().in_flight == 0
@@ -0,0 +1,131 @@
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from geolocation_catalogue import snapshot as snapshot_module
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.models import NetworkGeolocation
+from geolocation_catalogue.snapshot import (
+    GeolocationSnapshot,
+    get_snapshot,
+    write_snapshot,
+)
+
+from .conftest import (
+    IP_STACK_RESPONSES,
+    TEST_SESSION_MAKER,
+    delete_from_database,
+    insert_into_database,
+)
+from .test_app import check_response_against_data
+
+IP_US, IP_PL = list(IP_STACK_RESPONSES)
+IPV6: str = "2001:db8::1"
+
+
+def insert_network_into_database(network: str, geolocation: dict) -> None:
+    with TEST_SESSION_MAKER() as db:
+        db.add(NetworkGeolocation(network=network, geolocation=geolocation))
+        db.commit()
+
+
+@pytest.fixture()
+def snapshot_path(tmp_path: Path) -> str:
+    insert_into_database(IP_US, IP_STACK_RESPONSES[IP_US])
+    insert_into_database(IP_PL, IP_STACK_RESPONSES[IP_PL])
+    insert_into_database(IPV6, IP_STACK_RESPONSES[IP_PL])
+    insert_network_into_database("57.144.0.0/16", IP_STACK_RESPONSES[IP_US])
+    insert_network_into_database("57.144.120.0/24", IP_STACK_RESPONSES[IP_PL])
+    insert_network_into_database("57.144.120.7/32", IP_STACK_RESPONSES[IP_US])
+
+    path = str(tmp_path / "snapshot.bin")
+    with TEST_SESSION_MAKER() as db:
+        stats = write_snapshot(db, path, yield_per=2)
+
+    assert stats.keys == 6
+    assert stats.records == 2
+    return path
+
+
+@pytest.mark.parametrize(
+    "ip, expected_ip",
+    [
+        (IP_US, IP_US),
+        (IP_PL, IP_PL),
+        (IPV6, IP_PL),
+        ("57.144.1.1", IP_US),
+        ("57.144.120.1", IP_PL),
+        ("57.144.120.7", IP_US),
+    ],
+)
+def test_snapshot_lookup(snapshot_path: str, ip: str, expected_ip: str) -> None:
+    snapshot = GeolocationSnapshot(snapshot_path)
+
+    geolocation = snapshot.lookup(ip).model_dump()
+
+    for k in geolocation:
+        assert geolocation[k] == IP_STACK_RESPONSES[expected_ip][k]
+    snapshot.close()
+
+
+@pytest.mark.parametrize("ip", ["57.145.0.1", "1.1.1.1", "2001:db8::2"])
+def test_snapshot_lookup_not_found(snapshot_path: str, ip: str) -> None:
+    snapshot = GeolocationSnapshot(snapshot_path)
+
+    assert snapshot.lookup(ip) is None
+    snapshot.close()
+
+
+def test_get_address_geolocation_from_snapshot(
+    test_app: TestClient, snapshot_path: str
+) -> None:
+    delete_from_database(IP_PL)
+    CONFIG.snapshot_path = snapshot_path
+    try:
+        response = test_app.get("/address", params={"address": IP_PL})
+    finally:
+        CONFIG.snapshot_path = None
+
+    check_response_against_data(response, IP_PL, IP_STACK_RESPONSES[IP_PL])
+
+
+def test_snapshot_is_reopened_when_exported_again(
+    snapshot_path: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(CONFIG, "snapshot_path", snapshot_path)
+    snapshot = get_snapshot()
+    assert get_snapshot() is snapshot
+    assert snapshot.lookup(IPV6) is not None
+
+    delete_from_database(IPV6)
+    with TEST_SESSION_MAKER() as db:
+        write_snapshot(db, snapshot_path)
+
+    # file isn't checked again before interval passes
+    assert get_snapshot() is snapshot
+    monkeypatch.setattr(snapshot_module, "SNAPSHOT_CHECK_INTERVAL_SECONDS", 0.0)
+    assert get_snapshot() is not snapshot
+    assert get_snapshot().lookup(IPV6) is None
+
+
+@pytest.mark.parametrize("content", [None, b"", b"GEOSNAP1", "truncated"])
+def test_get_address_geolocation_without_usable_snapshot(
+    test_app: TestClient,
+    snapshot_path: str,
+    monkeypatch: pytest.MonkeyPatch,
+    content: bytes | str | None,
+) -> None:
+    path = Path(snapshot_path)
+    if content is None:
+        path.unlink()
+    elif content == "truncated":
+        path.write_bytes(path.read_bytes()[:-1])
+    else:
+        path.write_bytes(content)
+    monkeypatch.setattr(CONFIG, "snapshot_path", snapshot_path)
+
+    assert get_snapshot() is None
+    # address is looked up in database instead
+    response = test_app.get("/address", params={"address": IP_PL})
+    check_response_against_data(response, IP_PL, IP_STACK_RESPONSES[IP_PL])
@@ -0,0 +1,70 @@
+import asyncio
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from geolocation_catalogue.cache import IP_GEOLOCATION_CACHE
+from geolocation_catalogue.config import CONFIG
+from geolocation_catalogue.database import to_async_dsn
+from geolocation_catalogue.main import app
+from geolocation_catalogue.warmup import (
+    async_open_connections,
+    open_connections,
+    read_hot_keys,
+)
+
+from .conftest import IP_STACK_RESPONSES, insert_into_database
+
+
+def test_open_connections_up_to_pool_size() -> None:
+    engine = create_engine(str(CONFIG.pg_dsn), pool_size=2)
+    try:
+        open_connections(engine, 5)
+        assert engine.pool.checkedin() == 2
+    finally:
+        engine.dispose()
+
+
+def test_hot_addresses_are_saved_and_preloaded(tmp_path: Path) -> None:
+    hot_keys_path = tmp_path / "hot_keys"
+    hot_keys_path.write_text("57.144.110.1\n\n192.0.2.1\n216.58.209.14\n")
+    for ip in ("57.144.110.1", "216.58.209.14"):
+        insert_into_database(ip, IP_STACK_RESPONSES[ip])
+
+    CONFIG.hot_keys_path = str(hot_keys_path)
+    CONFIG.warmup_hot_keys = 2
+    CONFIG.warmup_db_connections = 1
+    try:
+        with TestClient(app):
+            # stored address from the first two hot keys is loaded with its version
+            assert IP_GEOLOCATION_CACHE.get("57.144.110.1").version == 1
+            assert IP_GEOLOCATION_CACHE.get("216.58.209.14") is None
+    finally:
+        CONFIG.hot_keys_path = None
+        CONFIG.warmup_hot_keys = 1000
+        CONFIG.warmup_db_connections = 0
+
+    assert read_hot_keys(str(hot_keys_path), 10) == ["57.144.110.1"]
+    for phase in ("warmup", "db_connections", "hot_keys"):
+        assert (
+            REGISTRY.get_sample_value(
+                "geolocation_startup_phase_duration_seconds", {"phase": phase}
+            )
+            is not None
+        )
+
+
+def test_async_open_connections_concurrently() -> None:
+    engine = create_async_engine(to_async_dsn(CONFIG.pg_dsn), pool_size=2)
+
+    async def open_and_dispose() -> int:
+        try:
+            await async_open_connections(engine, 5)
+            return engine.pool.checkedin()
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(open_and_dispose()) == 2